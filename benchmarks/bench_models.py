@@ -0,0 +1,97 @@
+# Memory footprint of a 300 app `list_apps` response, as returned by the
+# previous model classes (one object with a __dict__ per app, materialized
+# eagerly) versus the current ones (__slots__ wrappers over the payload,
+# interned strings).
+#
+#   $ PYTHONPATH=. python benchmarks/bench_models.py
+import json
+import tracemalloc
+
+from pywebostv.model import Application, ModelList, intern_strings
+
+
+class OldApplication(object):
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, val):
+        return self.data[val]
+
+
+def make_payload(count=300):
+    apps = []
+    for i in range(count):
+        apps.append({
+            "id": "com.vendor{}.app{}".format(i % 20, i),
+            "title": "Application {}".format(i),
+            "version": "1.0.{}".format(i % 5),
+            "vendor": "Vendor {}".format(i % 20),
+            "type": "web",
+            "visible": True,
+            "removable": i % 3 == 0,
+            "systemApp": False,
+            "folderPath": "/media/cryptofs/apps/usr/palm/applications/"
+                          "com.vendor{}.app{}".format(i % 20, i),
+            "icon": "http://192.168.1.20:3000/resources/{}/icon.png".format(
+                "%040x" % i),
+            "largeIcon": "http://192.168.1.20:3000/resources/{}/large.png"
+                         .format("%040x" % i),
+            "iconColor": "#1e1e1e",
+            "splashBackground": "splash.png",
+            "requiredPermissions": ["time.query", "activity.operation",
+                                    "applications.query"],
+            "bgImage": "bg.png",
+            "trustLevel": "default",
+            "inAppSetting": False,
+            "mediumLargeIcon": "icon_130x130.png",
+            "lockable": True,
+            "transparent": False,
+            "handlesRelaunch": False,
+            "noSplashOnLaunch": False,
+            "spinnerOnLaunch": True,
+            "uiRevision": 2,
+            "accessibility": {"supportsAudioGuidance": False},
+        })
+    return json.dumps({"returnValue": True, "apps": apps})
+
+
+def measure(func, raw):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    res = func(json.loads(raw))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(x.size_diff for x in after.compare_to(before, "filename"))
+    return res, size
+
+
+def old_list_apps(payload):
+    return [OldApplication(x) for x in payload["apps"]]
+
+
+def new_list_apps(payload):
+    return ModelList(Application, intern_strings(payload["apps"]))
+
+
+def main():
+    raw = make_payload()
+    old, old_size = measure(old_list_apps, raw)
+    new, new_size = measure(new_list_apps, raw)
+
+    # Touching every app (as a UI listing them would) should stay cheap.
+    touched = [x.title for x in new]
+
+    print("apps:            {}".format(len(touched)))
+    print("before:          {:8.1f} KiB".format(old_size / 1024.0))
+    print("after:           {:8.1f} KiB".format(new_size / 1024.0))
+    print("saved:           {:8.1f} %".format(
+        100.0 * (old_size - new_size) / old_size))
+    print("wrapper (before): {} bytes/app".format(
+        OldApplication({}).__sizeof__() + OldApplication({}).__dict__
+        .__sizeof__()))
+    print("wrapper (after):  {} bytes/app".format(
+        Application({}).__sizeof__()))
+
+
+if __name__ == "__main__":
+    main()
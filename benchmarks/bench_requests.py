@@ -0,0 +1,70 @@
+# Cost of blocking requests: time, garbage collections and memory per
+# request, and what a client still holds once a burst of requests has been
+# answered (this is what a client doing 10k requests/sec keeps around: the
+# target is that it doesn't grow with the request rate).
+#
+#   $ PYTHONPATH=. python benchmarks/bench_requests.py
+import gc
+import json
+import time
+import tracemalloc
+
+from pywebostv.connection import WebOSClient
+from pywebostv.controls import MediaControl
+
+
+class LoopbackClient(WebOSClient):
+    # Answers every request straight away, from the sending thread.
+    def __init__(self):
+        super(LoopbackClient, self).__init__("loopback")
+
+    def send(self, obj):
+        request_id = json.loads(obj)["id"]
+        self.received_message(
+            '{"id": "%s", "type": "response", "payload": '
+            '{"returnValue": true, "volume": 10, "muted": false}}'
+            % request_id)
+
+
+def run(control, count):
+    for _ in range(count):
+        control.get_volume()
+
+
+def main(count=10000):
+    client = LoopbackClient()
+    control = MediaControl(client)
+    run(control, 1000)  # Warm up.
+
+    collections = []
+
+    def on_gc(phase, info):
+        if phase == "start":
+            collections.append(info["generation"])
+    gc.callbacks.append(on_gc)
+    start = time.perf_counter()
+    run(control, count)
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(on_gc)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    run(control, count)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("requests:          {}".format(count))
+    print("time:              {:8.1f} us/request".format(
+        elapsed * 1e6 / count))
+    print("gc collections:    {:8d} per {} requests".format(
+        len(collections), count))
+    print("peak while busy:   {:8.1f} bytes/request".format(
+        (peak - before) / float(count)))
+    print("retained after:    {:8.1f} KiB ({:.1f} bytes/request)".format(
+        (after - before) / 1024.0, (after - before) / float(count)))
+    print("pending waiters:   {:8d}".format(len(client.waiters)))
+
+
+if __name__ == "__main__":
+    main()
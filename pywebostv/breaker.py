@@ -0,0 +1,114 @@
+import time
+from threading import Lock
+
+
+class CircuitOpen(IOError):
+    pass
+
+
+class CircuitBreaker(object):
+    # Opens after `threshold` consecutive failures: calls then fail at once
+    # instead of waiting for a timeout. After `reset_timeout` seconds one
+    # call goes through as a probe (half-open); if it fails the breaker opens
+    # again for twice as long, up to `max_reset_timeout`.
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, threshold=3, reset_timeout=5,
+                 max_reset_timeout=300):
+        self.host = host
+        self.threshold = threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return self.CLOSED
+            if self.probing or \
+                    time.time() >= self.opened_at + self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def retry_after(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            return max(0, self.opened_at + self.reset_timeout - time.time())
+
+    def allow(self):
+        # True if a call may go ahead. In half-open state only the first
+        # caller gets through, until success() or failure() is reported.
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or \
+                    time.time() < self.opened_at + self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpen("Circuit open for {}, retry in {:.1f}s.".format(
+                self.host, self.retry_after()))
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.reset_timeout = self.base_reset_timeout
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing:
+                self.probing = False
+                self.reset_timeout = min(self.reset_timeout * 2,
+                                         self.max_reset_timeout)
+                self.opened_at = time.time()
+            elif self.opened_at is None and self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        return {"host": self.host, "state": self.state,
+                "failures": self.failures, "retry_after": self.retry_after()}
+
+    def __repr__(self):
+        return "<CircuitBreaker '{}' {}>".format(self.host, self.state)
+
+
+class BreakerRegistry(object):
+    # One breaker per host, shared by all the clients to that host.
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.breakers = {}
+        self.lock = Lock()
+
+    def get(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(host,
+                                                               **self.kwargs)
+            return breaker
+
+    def states(self):
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return {x.host: x.state for x in breakers}
+
+    def open_hosts(self):
+        return [k for k, v in self.states().items()
+                if v == CircuitBreaker.OPEN]
+
+
+breakers = BreakerRegistry()
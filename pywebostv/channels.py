@@ -0,0 +1,146 @@
+import json
+import os
+import re
+from bisect import bisect_left
+from threading import RLock
+
+from pywebostv.controls import TvControl
+from pywebostv.model import Channel, content_hash, intern_strings
+
+
+class ChannelIndex(object):
+    def __init__(self, channels, fingerprint=None):
+        self.channels = intern_strings(channels)
+        self.fingerprint = fingerprint or content_hash(channels).hex()
+        self.by_id = {}
+        self.by_number = {}
+        self.by_type = {}
+        names = []
+        for position, channel in enumerate(self.channels):
+            self.by_id[channel.get("channelId")] = position
+            self.by_number.setdefault(str(channel.get("channelNumber")),
+                                      position)
+            self.by_type.setdefault(channel.get("channelTypeName"),
+                                    []).append(position)
+            names.append(((channel.get("channelName") or "").lower(),
+                          position))
+        names.sort()
+        self.names = [x for x, _ in names]
+        self.name_positions = [x for _, x in names]
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return (Channel(x) for x in self.channels)
+
+    def channel(self, position):
+        return Channel(self.channels[position])
+
+    def get(self, channel_id):
+        position = self.by_id.get(channel_id)
+        return self.channel(position) if position is not None else None
+
+    def find_number(self, number):
+        position = self.by_number.get(str(number))
+        return self.channel(position) if position is not None else None
+
+    def find_name(self, prefix, limit=None):
+        # Case-insensitive prefix search over the sorted names.
+        prefix = prefix.lower()
+        res = []
+        start = bisect_left(self.names, prefix)
+        for i in range(start, len(self.names)):
+            if not self.names[i].startswith(prefix):
+                break
+            res.append(self.channel(self.name_positions[i]))
+            if limit is not None and len(res) >= limit:
+                break
+        return res
+
+    def find_type(self, channel_type):
+        return [self.channel(x) for x in self.by_type.get(channel_type, [])]
+
+    def lookup(self, query):
+        # A channel number ("7", "7-1") if it is one, else a name prefix.
+        channel = self.find_number(query)
+        if channel is not None:
+            return channel
+        matches = self.find_name(str(query), limit=1)
+        return matches[0] if matches else None
+
+    def to_dict(self):
+        return {"fingerprint": self.fingerprint, "channels": self.channels}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["channels"], fingerprint=data["fingerprint"])
+
+
+class ChannelLineup(object):
+    # Keeps the channel index of one TV, on disk under `directory` (if given)
+    # so that it is available before the first fetch.
+    def __init__(self, client, directory=None):
+        self.client = client
+        self.control = TvControl(client)
+        self.directory = directory and os.path.expanduser(directory)
+        self.index = None
+        self.lock = RLock()
+        self.load()
+
+    @property
+    def path(self):
+        if not self.directory:
+            return None
+        device = getattr(self.client, "device", None)
+        key = (device and device.udn) or self.client.host
+        return os.path.join(self.directory,
+                            re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json")
+
+    def load(self):
+        path = self.path
+        if not path or not os.path.exists(path):
+            return
+        with open(path) as f:
+            index = ChannelIndex.from_dict(json.load(f))
+        with self.lock:
+            self.index = index
+
+    def save(self):
+        path = self.path
+        if not path or self.index is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.index.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    def refresh(self, timeout=None):
+        # Returns True if the lineup changed. The index is only rebuilt (and
+        # written) then.
+        payload = self.control.channel_list(timeout=timeout)
+        channels = payload.get("channelList") or []
+        fingerprint = content_hash(channels).hex()
+        with self.lock:
+            if self.index is not None and \
+                    self.index.fingerprint == fingerprint:
+                return False
+            self.index = ChannelIndex(channels, fingerprint=fingerprint)
+        self.save()
+        return True
+
+    def ensure(self, timeout=None):
+        if self.index is None:
+            self.refresh(timeout=timeout)
+        return self.index
+
+    def lookup(self, query):
+        return self.ensure().lookup(query)
+
+    def tune(self, query):
+        channel = self.lookup(query)
+        if channel is None:
+            raise ValueError("No such channel: {}".format(query))
+        self.control.set_channel_with_id(channel.id)
+        return channel
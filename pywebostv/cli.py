@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+
+from pywebostv.daemon import (Daemon, DaemonClient, DaemonError,
+                              default_socket_path, json_default, load_config)
+from pywebostv.pool import parse_value
+
+
+def parse_arguments(values):
+    args, kwargs = [], {}
+    for value in values:
+        key, sep, rest = value.partition("=")
+        if sep and key.isidentifier():
+            kwargs[key] = parse_value(rest)
+        else:
+            args.append(parse_value(value))
+    return args, kwargs
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="pywebostv", description="Control LG webOS TVs.")
+    parser.add_argument("--socket", default=None,
+                        help="Daemon socket (default: {}).".format(
+                            default_socket_path()))
+    commands = parser.add_subparsers(dest="action")
+    commands.required = True
+
+    daemon = commands.add_parser(
+        "daemon", help="Keep connections to the configured TVs open.")
+    daemon.add_argument("config", help="JSON config file.")
+
+    gateway = commands.add_parser(
+        "gateway", help="Serve the configured TVs over HTTP.")
+    gateway.add_argument("config", help="JSON config file.")
+    gateway.add_argument("--host", default=None)
+    gateway.add_argument("--port", type=int, default=None)
+
+    call = commands.add_parser(
+        "call", help="Run a command on a TV, through the daemon.")
+    call.add_argument("tv")
+    call.add_argument("control", help="e.g. MediaControl")
+    call.add_argument("command", help="e.g. set_volume")
+    call.add_argument("arguments", nargs="*",
+                      help="Arguments (JSON values, or name=value).")
+
+    commands.add_parser("list", help="TVs of the daemon and their state.")
+    commands.add_parser("ping", help="Check that the daemon is running.")
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    if args.action == "daemon":
+        config = load_config(args.config)
+        if args.socket:
+            config["socket"] = args.socket
+        try:
+            Daemon.from_config(config).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.action == "gateway":
+        from pywebostv.gateway import Gateway  # Only needed here.
+
+        config = load_config(args.config)
+        http = config.setdefault("http", {})
+        if args.host:
+            http["host"] = args.host
+        if args.port:
+            http["port"] = args.port
+        try:
+            Gateway.from_config(config).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    client = DaemonClient(args.socket or None)
+    try:
+        if args.action == "call":
+            call_args, call_kwargs = parse_arguments(args.arguments)
+            res = client.call(args.tv, args.control, args.command,
+                              *call_args, **call_kwargs)
+        elif args.action == "list":
+            res = client.tvs()
+        else:
+            res = client.ping()
+    except DaemonError as ex:
+        sys.stderr.write("Error: {}\n".format(ex))
+        return 1
+    except (IOError, OSError) as ex:
+        sys.stderr.write("Can't reach the daemon: {}\n".format(ex))
+        return 2
+    finally:
+        client.close()
+
+    if res is not None:
+        print(json.dumps(res, indent=2, default=json_default))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import heapq
 import json
 import time
-from threading import RLock
+import weakref
+from itertools import count
+from threading import Condition, Lock, RLock, Thread
 from uuid import uuid4
 try:
     from queue import Queue, Empty
@@ -10,8 +13,13 @@ except ImportError:
     from Queue import Queue, Empty
 
 from ws4py.client.threadedclient import WebSocketClient
+from ws4py.exc import HandshakeError
 
-from pywebostv.discovery import discover
+from pywebostv import tls
+from pywebostv.breaker import breakers
+
+from pywebostv.discovery import discover, descriptions
+from pywebostv.model import Device
 
 
 SIGNATURE = ("eyJhbGdvcml0aG0iOiJSU0EtU0hBMjU2Iiwia2V5SWQiOiJ0ZXN0LXNpZ25pbm" +
@@ -125,6 +133,103 @@ REGISTRATION_PAYLOAD = {
 }
 
 
+DEFAULT_TIMEOUT = 60
+
+
+class RequestTimeout(IOError):
+    pass
+
+
+def timeout_message(unique_id):
+    # What waiters get instead of a response once their deadline passes.
+    return {"id": unique_id, "type": "timeout", "error": "Request timed out."}
+
+
+def remaining(deadline):
+    return max(0, deadline - time.time())
+
+
+class ResultSlot(object):
+    # Holds the one response of a one-shot request. Queue-like (put, and get
+    # raising Empty), for a fraction of the cost of a Queue.
+    __slots__ = ("lock", "item")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.lock.acquire()
+        self.item = None
+
+    def put(self, item):
+        # Callers pop the waiter first, so there is only ever one put().
+        if self.item is None:
+            self.item = item
+            self.lock.release()
+
+    def get(self, block=True, timeout=None):
+        if not block:
+            acquired = self.lock.acquire(False)
+        elif timeout is None:
+            acquired = self.lock.acquire()
+        else:
+            acquired = self.lock.acquire(timeout=timeout)
+        if not acquired:
+            raise Empty
+        return self.item
+
+
+class DeadlineReaper(object):
+    # One thread for all clients: expires waiters at their deadline, even if
+    # nothing else arrives on their connection. Only the earliest deadline of
+    # each client is queued (answered requests leave nothing behind); the
+    # client's sweep returns the next one.
+    def __init__(self):
+        self.queue = []
+        self.sequence = count()
+        self.condition = Condition()
+        self.thread = None
+
+    def add(self, deadline, client):
+        with self.condition:
+            wakeup = client.reaper_wakeup
+            if wakeup is not None and wakeup <= deadline:
+                return
+            client.reaper_wakeup = deadline
+            heapq.heappush(self.queue, (deadline, next(self.sequence),
+                                        weakref.ref(client)))
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="WebOSReaper")
+                self.thread.daemon = True
+                self.thread.start()
+            if self.queue[0][0] == deadline:
+                self.condition.notify()
+
+    def run(self):
+        while True:
+            due = []
+            with self.condition:
+                now = time.time()
+                while self.queue and self.queue[0][0] <= now:
+                    deadline, _, client_ref = heapq.heappop(self.queue)
+                    client = client_ref()
+                    # Skip stale entries, superseded by an earlier deadline.
+                    if client is not None and \
+                            client.reaper_wakeup == deadline:
+                        client.reaper_wakeup = None
+                        due.append(client)
+                if not due:
+                    timeout = self.queue[0][0] - now if self.queue else None
+                    self.condition.wait(timeout)
+                    continue
+
+            for client in due:
+                next_deadline = client.clear_old_waiters()
+                if next_deadline is not None:
+                    self.add(next_deadline, client)
+
+
+reaper = DeadlineReaper()
+
+
 class WebOSWebSocketClient(WebSocketClient):
     @property
     def handshake_headers(self):
@@ -136,59 +241,223 @@ class WebOSClient(WebOSWebSocketClient):
     PROMPTED = 1
     REGISTERED = 2
 
-    def __init__(self, host, secure=False):
+    def __init__(self, host, secure=False, device=None, tls_context=None,
+                 breaker=None):
         if secure:
             ws_url = f"wss://{host}:3001/"
         else:
             ws_url = f"ws://{host}:3000/"
 
         super(WebOSClient, self).__init__(ws_url)
+        self.device = device
+        self.tls_context = tls_context
+        self.peer_fingerprint = None
+        self.tls_resumed = False
+        self.timings = {}
+        self.close_hooks = []
+        self.pong_hooks = []
+        self.keepalive = None
+        # An AdaptiveTimeouts to derive request timeouts from latencies.
+        self.timeouts = None
+        # A CircuitBreaker, or True for the one shared by all clients to
+        # this host (pywebostv.breaker.breakers).
+        self.breaker = breakers.get(host) if breaker is True else breaker
         self.waiters = {}
         self.waiter_lock = RLock()
+        self.reaper_wakeup = None
+        # Request ids: unique per client, much cheaper than a uuid each.
+        self.id_prefix = uuid4().hex[:8] + "-"
+        self.id_counter = count(1)
         self.subscribers = {}
         self.subscriber_lock = RLock()
         self.send_lock = RLock()
 
+    def next_id(self):
+        return self.id_prefix + str(next(self.id_counter))
+
     @staticmethod
-    def discover(secure=False):
+    def discover(secure=False, expected=None, registry=None, interfaces=None):
+        if registry is not None:
+            # Serve from the cache when warm, scan (and fill it) otherwise.
+            if not registry.warm:
+                registry.refresh(retries=3, expected=expected,
+                                 interfaces=interfaces)
+            return [WebOSClient(x["host"], secure, device=Device(x))
+                    for x in registry.devices()]
+
         res = discover("urn:schemas-upnp-org:device:MediaRenderer:1",
-                       keyword="LG", hosts=True, retries=3)
-        return [WebOSClient(x, secure) for x in res]
+                       keyword="LG", hosts=True, retries=3, expected=expected,
+                       interfaces=interfaces)
+        return [WebOSClient(x, secure, device=descriptions.by_host(x))
+                for x in res]
+
+    def connect(self):
+        if self.breaker is None:
+            return self.open_connection()
+        self.breaker.check()
+        try:
+            self.open_connection()
+        except Exception:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+
+    def open_connection(self):
+        # Same as ws4py's connect(), but with the TLS handshake done (and
+        # resumed when possible) by pywebostv.tls, and each phase timed in
+        # self.timings.
+        self.timings = {}
+        start = time.time()
+        self.sock.connect(self.bind_addr)
+        self.timings["tcp"] = time.time() - start
+
+        if self.scheme == "wss":
+            start = time.time()
+            self.sock = tls.wrap_socket(self.sock, self.host,
+                                        context=self.tls_context)
+            self._is_secure = True
+            self.tls_resumed = self.sock.session_reused
+            self.peer_fingerprint = tls.fingerprint(
+                self.sock.getpeercert(binary_form=True))
+            self.timings["tls"] = time.time() - start
+
+        start = time.time()
+        self._write(self.handshake_request)
+        response = b''
+        while b'\r\n\r\n' not in response:
+            data = self.sock.recv(128)
+            if not data:
+                break
+            response += data
+
+        if not response:
+            self.close_connection()
+            raise HandshakeError("Invalid response")
+
+        headers, _, body = response.partition(b'\r\n\r\n')
+        response_line, _, headers = headers.partition(b'\r\n')
+        try:
+            self.process_response_line(response_line)
+            self.protocols, self.extensions = \
+                self.process_handshake_header(headers)
+        except HandshakeError:
+            self.close_connection()
+            raise
+        self.timings["upgrade"] = time.time() - start
+
+        if self._is_secure:
+            # With TLS 1.3 the session ticket only arrives after the
+            # handshake, so this is the earliest it can be saved.
+            tls.sessions.put(self.host, self.sock.session,
+                             self.tls_context or tls.default_context())
+
+        self.handshake_ok()
+        if body:
+            self.process(body)
+
+    def closed(self, code, reason=None):
+        # Called by ws4py once the connection is gone, whichever side (or
+        # the network) ended it. Hooks get (client, code, reason).
+        for hook in list(self.close_hooks):
+            hook(self, code, reason)
+
+    def ponged(self, pong):
+        for hook in list(self.pong_hooks):
+            hook(self, pong.data)
 
-    def register(self, store, timeout=60):
+    @property
+    def rtt(self):
+        # Smoothed round trip time in seconds, if a Keepalive is running.
+        return self.keepalive.rtt if self.keepalive is not None else None
+
+    def check_certificate(self, store):
+        # Trust on first use: the fingerprint seen at the first registration
+        # is kept in `store` and must match from then on.
+        pinned = store.get("certificate_fingerprint")
+        if self.peer_fingerprint and pinned and \
+                pinned != self.peer_fingerprint:
+            raise tls.CertificateMismatch(
+                "Certificate of {} changed: expected {}, got {}.".format(
+                    self.host, pinned, self.peer_fingerprint))
+
+    def register(self, store, timeout=None):
+        # Checked before the client key is sent out.
+        self.check_certificate(store)
+        # A copy per call: concurrent registrations mustn't share keys.
+        payload = dict(REGISTRATION_PAYLOAD)
         if "client_key" in store:
-            REGISTRATION_PAYLOAD["client-key"] = store["client_key"]
-
-        queue = self.send_message('register', None, REGISTRATION_PAYLOAD,
-                                  get_queue=True)
-        while True:
-            try:
-                item = queue.get(block=True, timeout=timeout)
-            except Empty:
-                raise Exception("Timeout.")
-
-            if item.get("payload", {}).get("pairingType") == "PROMPT":
-                yield WebOSClient.PROMPTED
-            elif item["type"] == "registered":
-                store["client_key"] = item["payload"]["client-key"]
-                yield WebOSClient.REGISTERED
-                break
-            else:
-                # TODO: Better exception.
-                raise Exception("Failed to register.")
+            payload["client-key"] = store["client_key"]
+
+        if timeout is None:
+            # Only adaptive when there is a key: pairing waits for a human.
+            timeout = DEFAULT_TIMEOUT
+            if self.timeouts is not None and "client_key" in store:
+                timeout = self.timeouts.timeout_for("register")
+
+        # Answered twice (prompt, then registered): keep the waiter until done.
+        start = time.time()
+        prompted = False
+        deadline = start + timeout
+        unique_id = self.next_id()
+        queue = self.send_message('register', None, payload,
+                                  unique_id=unique_id, get_queue=True,
+                                  deadline=deadline, once=False)
+        try:
+            while True:
+                try:
+                    item = queue.get(block=True, timeout=remaining(deadline))
+                except Empty:
+                    raise RequestTimeout("Timed out registering.")
+
+                if item.get("type") == "timeout":
+                    raise RequestTimeout("Timed out registering.")
+                elif item.get("payload", {}).get("pairingType") == "PROMPT":
+                    prompted = True
+                    yield WebOSClient.PROMPTED
+                elif item["type"] == "registered":
+                    store["client_key"] = item["payload"]["client-key"]
+                    if self.peer_fingerprint:
+                        store["certificate_fingerprint"] = \
+                            self.peer_fingerprint
+                    self.timings["register"] = time.time() - start
+                    if self.timeouts is not None and not prompted:
+                        self.timeouts.record("register",
+                                             self.timings["register"])
+                    yield WebOSClient.REGISTERED
+                    break
+                else:
+                    # TODO: Better exception.
+                    raise Exception("Failed to register.")
+        finally:
+            self.cancel(unique_id)
 
     def send_message(self, request_type, uri, payload, unique_id=None,
-                     get_queue=False, callback=None, cur_time=time.time):
+                     get_queue=False, callback=None, cur_time=time.time,
+                     deadline=None, once=True):
+        # The waiter (callback or queue) gets the response, or a "timeout"
+        # message at `deadline` (default: DEFAULT_TIMEOUT seconds from
+        # cur_time(); never if that returns None). `once` waiters are
+        # removed on their first response.
         if unique_id is None:
-            unique_id = str(uuid4())
+            unique_id = self.next_id()
+
+        if self.breaker is not None:
+            self.breaker.check()
 
         if get_queue:
-            wait_queue = Queue()
+            wait_queue = ResultSlot() if once else Queue()
             callback = wait_queue.put
 
         if callback is not None:
+            if deadline is None:
+                created_time = cur_time()
+                if created_time is not None:
+                    deadline = created_time + DEFAULT_TIMEOUT
             with self.waiter_lock:
-                self.waiters[unique_id] = (callback, cur_time())
+                self.waiters[unique_id] = (callback, deadline, once,
+                                           uri or request_type, time.time())
+            if deadline is not None:
+                reaper.add(deadline, self)
 
         obj = {"type": request_type, "id": unique_id}
         if uri is not None:
@@ -196,8 +465,17 @@ class WebOSClient(WebOSWebSocketClient):
         if payload is not None:
             obj["payload"] = payload
 
-        with self.send_lock:
-            self.send(json.dumps(obj))
+        try:
+            with self.send_lock:
+                self.send(json.dumps(obj))
+        except Exception:
+            self.cancel(unique_id)
+            if self.breaker is not None:
+                self.breaker.failure()
+            raise
+        if self.breaker is not None and not (callback is not None and once):
+            # Nothing to wait for: getting it out is as good as it gets.
+            self.breaker.success()
 
         if get_queue:
             return wait_queue
@@ -209,7 +487,7 @@ class WebOSClient(WebOSWebSocketClient):
         with self.subscriber_lock:
             self.subscribers[unique_id] = uri
         self.send_message('subscribe', uri, payload, unique_id=unique_id,
-                          callback=func, cur_time=lambda: None)
+                          callback=func, cur_time=lambda: None, once=False)
         return unique_id
 
     def unsubscribe(self, unique_id):
@@ -219,27 +497,67 @@ class WebOSClient(WebOSWebSocketClient):
         if not uri:
             raise ValueError("Subscription not found: {}".format(unique_id))
 
-        with self.waiter_lock:
-            self.waiters.pop(unique_id)
-
+        self.cancel(unique_id)
         self.send_message('unsubscribe', uri, payload=None)
 
     def received_message(self, msg):
         obj = json.loads(str(msg))
 
         with self.waiter_lock:
-            self.clear_old_waiters()
             if "id" in obj and obj["id"] in self.waiters:
-                callback, created_time = self.waiters[obj["id"]]
+                callback, deadline, once, key, sent = self.waiters[obj["id"]]
+                now = time.time()
+                if deadline is not None and deadline <= now:
+                    # Too late, even if the reaper hasn't got to it yet.
+                    del self.waiters[obj["id"]]
+                    obj = timeout_message(obj["id"])
+                elif once:
+                    del self.waiters[obj["id"]]
+                if once and self.breaker is not None:
+                    if obj.get("type") == "timeout":
+                        self.breaker.failure()
+                    else:
+                        self.breaker.success()
+                if once and self.timeouts is not None:
+                    self.timeouts.record(key, now - sent)
                 callback(obj)
 
-    def clear_old_waiters(self, delta=60):
-        to_clear = []
-        cur_time = time.time()
-        for key, value in self.waiters.items():
-            callback, created_time = value
-            if created_time and created_time + delta < cur_time:
-                to_clear.append(key)
+    def cancel(self, unique_id):
+        # Forgets a pending request; a late response is then ignored.
+        with self.waiter_lock:
+            return self.waiters.pop(unique_id, None) is not None
 
-        for key in to_clear:
-            self.waiters.pop(key)
+    def expire(self, unique_id, deadline=None):
+        with self.waiter_lock:
+            entry = self.waiters.get(unique_id)
+            if entry is None or entry[1] is None:
+                return False
+            if deadline is not None and entry[1] != deadline:
+                return False  # Re-registered with a new deadline since.
+            del self.waiters[unique_id]
+        callback, _, once, key, sent = entry
+        if once and self.timeouts is not None:
+            # Took at least this long; lets the timeout grow.
+            self.timeouts.record(key, time.time() - sent)
+        if once and self.breaker is not None:
+            self.breaker.failure()
+        callback(timeout_message(unique_id))
+        return True
+
+    def clear_old_waiters(self):
+        # Expires the overdue waiters, returns the next deadline (or None).
+        now = time.time()
+        expired = []
+        next_deadline = None
+        with self.waiter_lock:
+            for key, value in self.waiters.items():
+                deadline = value[1]
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    expired.append(key)
+                elif next_deadline is None or deadline < next_deadline:
+                    next_deadline = deadline
+        for key in expired:
+            self.expire(key)
+        return next_deadline
@@ -1,4 +1,5 @@
 import base64
+import time
 
 try:
     # begin try for python <= 3.5
@@ -7,11 +8,17 @@ except ImportError:
     # after try for python >= 3.10
     from typing import Callable
 
+from collections import deque
 from queue import Empty
-from uuid import uuid4
+from threading import RLock, Timer
 
-from pywebostv.connection import WebOSWebSocketClient
+from ws4py.exc import WebSocketException
+
+from pywebostv.connection import RequestTimeout, WebOSWebSocketClient
+from pywebostv.connection import remaining, timeout_message
+from pywebostv.icons import icons
 from pywebostv.model import Application, InputSource, AudioOutputSource
+from pywebostv.model import ModelList, intern_strings
 
 ARGS_NONE = ()
 
@@ -36,6 +43,16 @@ def arguments(val, postprocess=lambda x: x, default=ARGS_NONE):
     return func
 
 
+def icon_argument(field, fallback):
+    # icon=<name, digest or Icon> picks an icon registered with
+    # pywebostv.icons.icons, already encoded; otherwise use `fallback`.
+    def func(*args, **kwargs):
+        if kwargs.get("icon") is not None:
+            return getattr(icons.get(kwargs["icon"]), field)
+        return fallback(*args, **kwargs)
+    return func
+
+
 def process_payload(obj, *args, **kwargs):
     if isinstance(obj, list):
         return [process_payload(item, *args, **kwargs) for item in obj]
@@ -47,6 +64,14 @@ def process_payload(obj, *args, **kwargs):
         return obj
 
 
+def no_validation(payload):
+    return True, None
+
+
+def identity(x):
+    return x
+
+
 def standard_validation(payload, key="returnValue"):
     if not payload.pop(key, None):
         return False, payload.pop("errorText", "Unknown error.")
@@ -68,22 +93,39 @@ class WebOSControlBase(object):
         self.client = client
         self.subscriptions = {}
 
-    def request(self, uri, params, callback=None, block=False, timeout=60):
+    def request(self, uri, params, callback=None, block=False, timeout=60,
+                deadline=None):
+        # `deadline` (absolute, time.time() based) takes precedence over
+        # `timeout`, so that nested calls share their caller's budget.
+        if deadline is None:
+            deadline = time.time() + timeout
         if block:
+            unique_id = self.client.next_id()
             queue = self.client.send_message('request', uri, params,
-                                             get_queue=True)
+                                             unique_id=unique_id,
+                                             get_queue=True, deadline=deadline)
             try:
-                return queue.get(timeout=timeout, block=True)
+                res = queue.get(timeout=remaining(deadline), block=True)
             except Empty:
-                raise Exception("Failed.")
+                res = timeout_message(unique_id)
+            if res.get("type") == "timeout":
+                # Counts as a timeout (breaker, latencies) even if we got
+                # here before the reaper did.
+                self.client.expire(unique_id)
+                raise RequestTimeout("Timed out waiting for {}.".format(uri))
+            return res
         else:
-            self.client.send_message('request', uri, params, callback=callback)
+            self.client.send_message('request', uri, params, callback=callback,
+                                     deadline=deadline if callback else None)
 
     def __getattr__(self, name):
         subscribe_prefix = "subscribe_"
         unsubscribe_prefix = "unsubscribe_"
         if name in self.COMMANDS:
-            return self.exec_command(name, self.COMMANDS[name])
+            # Built once per control, not once per call.
+            func = self.__dict__[name] = self.exec_command(name,
+                                                           self.COMMANDS[name])
+            return func
         elif name.startswith(subscribe_prefix):
             subscribe_name = name.lstrip(subscribe_prefix)
             sub_cmd_info = self.COMMANDS.get(subscribe_name)
@@ -105,31 +147,47 @@ class WebOSControlBase(object):
         else:
             raise AttributeError(name)
 
+    def command_timeout(self, cmd_info):
+        # COMMANDS may set "timeout": seconds, or {"floor": .., "ceiling": ..}
+        # to bound the adaptive timeout (see pywebostv.timeouts).
+        override = cmd_info.get("timeout")
+        if isinstance(override, (int, float)):
+            return override
+        timeouts = getattr(self.client, "timeouts", None)
+        if timeouts is None:
+            return 60
+        return timeouts.timeout_for(cmd_info["uri"], **(override or {}))
+
     def exec_command(self, cmd, cmd_info):
         def request_func(*args, **kwargs):
             callback = kwargs.pop('callback', None)
-            response_valid = cmd_info.get("validation", lambda p: (True, None))
-            return_fn = cmd_info.get('return', lambda x: x)
+            response_valid = cmd_info.get("validation", no_validation)
+            return_fn = cmd_info.get('return', identity)
             block = kwargs.pop('block', True)
-            timeout = kwargs.pop('timeout', 60)
+            timeout = kwargs.pop('timeout', None)
+            if timeout is None:
+                timeout = self.command_timeout(cmd_info)
+            deadline = kwargs.pop('deadline', None)
             params = process_payload(cmd_info.get("payload"), *args, **kwargs)
 
             # callback in the args has higher priority.
             if callback:
                 def callback_wrapper(res):
                     payload = res.get("payload")
+                    if res.get("type", None) == "timeout":
+                        return callback(False, RequestTimeout(res["error"]))
                     if res.get("type", None) == "error":
-                        callback(False, res.get("type", "Unknown Communication Error"))
+                        return callback(False, res.get("error", "Unknown Communication Error"))
                     status, message = response_valid(payload)
                     if not status:
                         return callback(False, message)
                     return callback(True, return_fn(payload))
 
                 self.request(cmd_info["uri"], params, timeout=timeout,
-                             callback=callback_wrapper)
+                             deadline=deadline, callback=callback_wrapper)
             elif block:
                 res = self.request(cmd_info["uri"], params, block=block,
-                                   timeout=timeout)
+                                   timeout=timeout, deadline=deadline)
                 if res.get("type", None) == "error":
                     raise IOError(res.get("error", "Unknown Communication Error"))
                 payload = res.get("payload")
@@ -144,8 +202,9 @@ class WebOSControlBase(object):
 
     def subscribe(self, name, cmd_info):
         def request_func(callback):
-            response_valid = cmd_info.get("subscription_validation", lambda p: (True, None))
-            return_fn = cmd_info.get('return', lambda x: x)
+            response_valid = cmd_info.get("subscription_validation",
+                                          no_validation)
+            return_fn = cmd_info.get('return', identity)
 
             def callback_wrapper(payload):
                 status, message = response_valid(payload)
@@ -156,7 +215,7 @@ class WebOSControlBase(object):
             if name in self.subscriptions:
                 raise ValueError("Already subscribed.")
 
-            uid = str(uuid4())
+            uid = self.client.next_id()
             self.subscriptions[name] = uid
             self.client.subscribe(cmd_info["uri"], uid, callback_wrapper)
         return request_func
@@ -237,10 +296,21 @@ class TvControl(WebOSControlBase):
             "subscription_validation": subscription_validation,
             "subscription": True
         },
-        "channel_list": {"uri": "ssap://tv/getChannelList"},
+        "channel_list": {
+            "uri": "ssap://tv/getChannelList",
+            "timeout": {"floor": 5}
+        },
         "get_current_program": {
             "uri": "ssap://tv/getChannelProgramInfo",
             "validation": standard_validation
+        },
+        "get_program_info": {
+            "uri": "ssap://tv/getChannelProgramInfo",
+            "args": [str],
+            "payload": {
+                "channelId": arguments(0)
+            },
+            "validation": standard_validation
         }
      }
 
@@ -260,15 +330,21 @@ class SystemControl(WebOSControlBase):
             "uri": "ssap://com.webos.service.update/getCurrentSWInformation",
             "validation": standard_validation,
         },
+        "network_info": {
+            "uri": "ssap://com.webos.service.connectionmanager/getinfo",
+            "validation": standard_validation,
+        },
         "notify": {
             "uri": "ssap://system.notifications/createToast",
             "args": [str],
             "payload": {
                 "message": arguments(0),
-                "iconData": arguments("icon_bytes",
-                                      postprocess=lambda bytes: base64.b64encode(bytes).decode('utf-8'),
-                                      default=None),
-                "iconExtension": arguments("icon_ext", default=None),
+                "iconData": icon_argument("data", arguments(
+                    "icon_bytes",
+                    postprocess=lambda bytes: base64.b64encode(bytes).decode('utf-8'),
+                    default=None)),
+                "iconExtension": icon_argument("extension", arguments(
+                    "icon_ext", default=None)),
             },
         },
     }
@@ -282,7 +358,9 @@ class ApplicationControl(WebOSControlBase):
             "kwargs": {},
             "payload": {},
             "validation": standard_validation,
-            "return": lambda payload: [Application(x) for x in payload["apps"]]
+            "return": lambda payload: ModelList(
+                Application, intern_strings(payload["apps"])),
+            "timeout": {"floor": 5}
         },
         "launch": {
             "uri": "ssap://system.launcher/launch",
@@ -294,6 +372,8 @@ class ApplicationControl(WebOSControlBase):
                 "params": arguments("params", default=None)
             },
             "validation": standard_validation,
+            # Answered once the app has started, which takes a while.
+            "timeout": {"floor": 10}
         },
         "get_current": {
             "uri": "ssap://com.webos.applicationManager/getForegroundAppInfo",
@@ -315,12 +395,221 @@ class ApplicationControl(WebOSControlBase):
     }
 
 
+class PointerInputSocket(object):
+    URI = "ssap://com.webos.service.networkinput/getPointerInputSocket"
+
+    _instances_lock = RLock()
+
+    def __init__(self, client, ws_class=WebOSWebSocketClient, retries=2):
+        self.client = client
+        self.ws_class = ws_class
+        self.retries = retries
+        self.ws = None
+        self.active = False
+        # Commands not sent yet. Dropped if the socket stays unavailable
+        # after all retries: the caller was told they failed.
+        self.pending = deque()
+        self.lock = RLock()
+
+    @classmethod
+    def for_client(cls, client, **kwargs):
+        # One pointer socket per client, shared by all its InputControls.
+        with cls._instances_lock:
+            sock = getattr(client, "pointer_input_socket", None)
+            if sock is None:
+                sock = cls(client, **kwargs)
+                client.pointer_input_socket = sock
+            return sock
+
+    @property
+    def connected(self):
+        return self.active and not self.ws.terminated
+
+    def connect(self, timeout=60, deadline=None):
+        if deadline is None:
+            deadline = time.time() + timeout
+        with self.lock:
+            if self.connected:
+                return
+
+            unique_id = self.client.next_id()
+            queue = self.client.send_message('request', self.URI, None,
+                                             unique_id=unique_id,
+                                             get_queue=True, deadline=deadline)
+            try:
+                res = queue.get(block=True, timeout=remaining(deadline))
+            except Empty:
+                res = timeout_message(unique_id)
+            if res.get("type") == "timeout":
+                # Counts as a timeout (breaker, latencies) even if we got
+                # here before the reaper did.
+                self.client.expire(unique_id)
+                raise RequestTimeout(
+                    "Timed out fetching the pointer input socket.")
+
+            sock_path = (res.get("payload") or {}).get("socketPath")
+            if not sock_path:
+                raise IOError("Unable to connect to mouse.")
+            self.ws = self.ws_class(sock_path)
+            # The rest of the budget goes to the connection itself.
+            budget = remaining(deadline)
+            if not budget:
+                raise RequestTimeout("Timed out connecting to the mouse.")
+            if getattr(self.ws, "sock", None) is not None:
+                self.ws.sock.settimeout(budget)
+            try:
+                self.ws.connect()
+            except Exception:
+                try:
+                    self.ws.close()
+                except (IOError, RuntimeError, WebSocketException):
+                    pass
+                raise
+            if getattr(self.ws, "sock", None) is not None:
+                self.ws.sock.settimeout(None)
+            self.active = True
+
+    def send(self, payload):
+        with self.lock:
+            self.pending.append(payload)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            error = None
+            for _ in range(self.retries + 1):
+                try:
+                    self.connect()
+                    while self.pending:
+                        self.ws.send(self.pending[0])
+                        self.pending.popleft()
+                    return
+                except (IOError, RuntimeError, WebSocketException) as ex:
+                    # The socket path may change once the old socket dies, so
+                    # the next attempt fetches a fresh one.
+                    error = ex
+                    self.drop()
+            self.pending.clear()
+            raise IOError("Pointer input socket unavailable: {}".format(error))
+
+    def drop(self):
+        with self.lock:
+            if not self.active:
+                return
+            self.active = False
+            try:
+                self.ws.close()
+            except (IOError, RuntimeError, WebSocketException):
+                pass
+
+    def close(self):
+        with self.lock:
+            self.pending.clear()
+            self.drop()
+
+
+def text_edits(old, new):
+    # Returns (delete_count, text_to_insert) that turn `old` into `new`. The
+    # IME only edits at the cursor (end of text), so everything after the
+    # common prefix has to be deleted and re-typed.
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    return len(old) - prefix, new[prefix:]
+
+
+class TextInputSync(object):
+    def __init__(self, control, window=0.05, initial="", on_latency=None,
+                 history=100, on_error=None):
+        self.control = control
+        self.window = window
+        self.on_latency = on_latency
+        self.on_error = on_error
+        self.last_error = None
+        self.latencies = deque(maxlen=history)
+        self.sent = initial
+        self.target = None
+        self.first_keystroke = None
+        self.timer = None
+        self.lock = RLock()
+
+    def update(self, text):
+        with self.lock:
+            self.target = text
+            if self.first_keystroke is None:
+                self.first_keystroke = time.time()
+            if self.timer is None:
+                self.timer = Timer(self.window, self.timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            target, self.target = self.target, None
+            started, self.first_keystroke = self.first_keystroke, None
+            if target is None or target == self.sent:
+                return
+
+            old, self.sent = self.sent, target
+            if old is None:
+                delete, insert = None, None
+            else:
+                delete, insert = text_edits(old, target)
+
+        callback = self.make_callback(started)
+        try:
+            if old is not None and not insert:
+                self.control.delete(delete, callback=callback)
+            elif old is not None and not delete:
+                self.control.type(insert, callback=callback)
+            else:
+                # Deleting and re-typing would take two messages; replacing
+                # the whole text takes one.
+                self.control.type(target, replace=1, callback=callback)
+        except Exception:
+            with self.lock:
+                # Maybe not sent: replace the whole text next time.
+                self.sent = None
+            raise
+
+    def timed_flush(self):
+        # Nobody would see the error on the timer's thread: keep it, and
+        # report it if asked to.
+        try:
+            self.flush()
+        except Exception as ex:
+            self.last_error = ex
+            if self.on_error is not None:
+                self.on_error(ex)
+
+    def make_callback(self, started):
+        def callback(status, payload):
+            if not status:
+                with self.lock:
+                    # We no longer know what the TV has; replace it next time.
+                    self.sent = None
+                return
+
+            latency = time.time() - started
+            self.latencies.append(latency)
+            if self.on_latency is not None:
+                self.on_latency(latency)
+        return callback
+
+
 class InputControl(WebOSControlBase):
     COMMANDS = {
         "type": {
             "uri": "ssap://com.webos.service.ime/insertText",
             "args": [str],
-            "payload": {"text": arguments(0), "replace": 0}
+            "payload": {
+                "text": arguments(0),
+                "replace": arguments("replace", default=0)
+            }
         },
         "delete": {
             "uri": "ssap://com.webos.service.ime/deleteCharacters",
@@ -461,6 +750,12 @@ class InputControl(WebOSControlBase):
     def __init__(self, *args, **kwargs):
         self.ws_class = kwargs.pop('ws_class', WebOSWebSocketClient)
         super(InputControl, self).__init__(*args, **kwargs)
+        self.pointer = PointerInputSocket.for_client(self.client,
+                                                     ws_class=self.ws_class)
+
+    @property
+    def mouse_ws(self):
+        return self.pointer.ws
 
     def __getattr__(self, name):
         if name in self.INPUT_COMMANDS:
@@ -469,24 +764,22 @@ class InputControl(WebOSControlBase):
             return super(InputControl, self).__getattr__(name)
         raise AttributeError(name)
 
-    def connect_input(self):
-        uri = "ssap://com.webos.service.networkinput/getPointerInputSocket"
-        res = self.request(uri, None, block=True)
-        sock_path = res.get("payload").get("socketPath")
-        if not sock_path:
-            raise IOError("Unable to connect to mouse.")
-        self.mouse_ws = self.ws_class(sock_path)
-        self.mouse_ws.connect()
+    def text_sync(self, **kwargs):
+        return TextInputSync(self, **kwargs)
+
+    def connect_input(self, timeout=60, deadline=None):
+        # Optional: the pointer socket is opened lazily on first use.
+        self.pointer.connect(timeout=timeout, deadline=deadline)
 
     def disconnect_input(self):
-        self.mouse_ws.close()
+        self.pointer.close()
 
     def exec_mouse_command(self, cmd_name, cmd_info):
         def request_func(*args, **kwargs):
             params = process_payload(cmd_info["command"], *args, **kwargs)
             payload = "\n".join(":".join(str(y) for y in x) for x in params)
             payload += "\n\n"
-            self.mouse_ws.send(payload)
+            self.pointer.send(payload)
         return request_func
 
 
@@ -498,7 +791,8 @@ class SourceControl(WebOSControlBase):
             "kwargs": {},
             "payload": {},
             "validation": standard_validation,
-            "return": lambda p: [InputSource(x) for x in p["devices"]],
+            "return": lambda p: ModelList(InputSource,
+                                          intern_strings(p["devices"])),
         },
         "set_source": {
             "uri": "ssap://tv/switchInput",
@@ -0,0 +1,193 @@
+import json
+import os
+import socket
+import socketserver
+import time
+from threading import Thread
+
+from pywebostv.pool import ConnectionPool, command_kwargs, json_default
+from pywebostv.warm import WarmConnection
+
+
+def default_socket_path():
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "pywebostv.sock")
+    return os.path.expanduser("~/.pywebostv/daemon.sock")
+
+
+def load_config(path):
+    # {"tvs": {name: {"host": .., "secure": false}}, "socket": ..,
+    #  "keys": .., "keepalive": {"interval": 10}}
+    with open(os.path.expanduser(path)) as f:
+        return json.load(f)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, one JSON response per line, for as long as
+    # the caller keeps the socket open.
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                res = self.server.daemon.handle(json.loads(line))
+            except Exception as ex:
+                res = {"ok": False, "error": str(ex),
+                       "type": type(ex).__name__}
+            try:
+                data = json.dumps(res, default=json_default)
+            except (TypeError, ValueError) as ex:
+                data = json.dumps({"ok": False, "error": str(ex),
+                                   "type": type(ex).__name__})
+            self.wfile.write(data.encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon(object):
+    # Keeps a registered connection to each configured TV (a
+    # ConnectionPool) and runs the commands it gets on a Unix socket, so
+    # that scripts and the CLI don't pay for connecting and registering on
+    # every call. Keys are kept in the JSON file at `key_path`.
+    def __init__(self, tvs, socket_path=None, key_path=None,
+                 connection_class=WarmConnection, **kwargs):
+        # `tvs`: {name: {"host": .., "secure": ..}}. `kwargs` go to each
+        # WarmConnection (e.g. keepalive={"interval": 10}).
+        self.socket_path = os.path.expanduser(socket_path or
+                                              default_socket_path())
+        self.pool = ConnectionPool(tvs, key_path=key_path,
+                                   connection_class=connection_class,
+                                   **kwargs)
+        self.server = None
+        self.thread = None
+
+    @property
+    def key_path(self):
+        return self.pool.key_path
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        options = {"socket_path": config.get("socket"),
+                   "key_path": config.get("keys", "~/.pywebostv/keys.json")}
+        if config.get("keepalive"):
+            options["keepalive"] = config["keepalive"]
+        options.update(kwargs)
+        return cls(config["tvs"], **options)
+
+    def start(self):
+        self.pool.start()
+
+        directory = os.path.dirname(self.socket_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Left over by a previous run.
+        self.server = DaemonServer(self.socket_path, DaemonHandler)
+        self.server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        self.thread = Thread(target=self.server.serve_forever,
+                             name="WebOSDaemon")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread.join()
+            self.thread = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        self.pool.stop()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        finally:
+            self.stop()
+
+    def handle(self, request):
+        op = request.get("op", "call")
+        if op == "ping":
+            return {"ok": True, "payload": "pong"}
+        elif op == "list":
+            return {"ok": True, "payload": self.pool.status()}
+        elif op == "call":
+            command = request["command"]
+            control = self.pool.control(request["tv"], request["control"],
+                                        request.get("connect_timeout", 10))
+            if command not in control.COMMANDS:
+                raise ValueError("Unknown command: {}".format(command))
+            kwargs = command_kwargs(request.get("kwargs", {}))
+            res = getattr(control, command)(*request.get("args", []),
+                                            **kwargs)
+            return {"ok": True, "payload": res}
+        raise ValueError("Unknown op: {}".format(op))
+
+
+class DaemonError(IOError):
+    pass
+
+
+class DaemonClient(object):
+    # Talks to a running Daemon; keeps its socket open across calls.
+    def __init__(self, socket_path=None, timeout=70):
+        self.socket_path = os.path.expanduser(socket_path or
+                                              default_socket_path())
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except (IOError, OSError):
+            sock.close()
+            raise
+        self.sock = sock
+        self.file = sock.makefile("rb")
+
+    def close(self):
+        if self.sock is not None:
+            self.file.close()
+            self.sock.close()
+            self.sock = None
+            self.file = None
+
+    def request(self, obj):
+        if self.sock is None:
+            self.connect()
+        try:
+            self.sock.sendall(json.dumps(obj).encode('utf-8') + b"\n")
+            line = self.file.readline()
+        except (IOError, OSError):
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise DaemonError("Daemon closed the connection.")
+        res = json.loads(line)
+        if not res["ok"]:
+            raise DaemonError(res["error"])
+        return res["payload"]
+
+    def call(self, tv, control, command, *args, **kwargs):
+        return self.request({"tv": tv, "control": control,
+                             "command": command, "args": list(args),
+                             "kwargs": kwargs})
+
+    def tvs(self):
+        return self.request({"op": "list"})
+
+    def ping(self):
+        return self.request({"op": "ping"})
@@ -1,11 +1,24 @@
+import asyncio
+import selectors
 import socket
+import struct
+import time
+from threading import Event, RLock
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 try:
     from urlparse import urlparse
 except ImportError:
     from urllib.parse import urlparse
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import requests
 
+from pywebostv.model import Device
+
 
 def read_location(resp, keyword=None):
     if not isinstance(resp, str):
@@ -18,12 +31,111 @@ def read_location(resp, keyword=None):
             return line[len(header):]
 
 
-def validate_location(location, keyword, timeout=5):
+def read_headers(resp):
+    if not isinstance(resp, str):
+        resp = resp.decode('utf-8', 'replace')
+
+    lines = resp.splitlines()
+    headers = {}
+    for line in lines[1:]:
+        key, sep, value = line.partition(":")
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return (lines[0] if lines else ""), headers
+
+
+def parse_description(content):
+    # Namespace agnostic: the root device's fields come before any embedded
+    # device's, so the first occurrence of each tag wins.
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        return {}
+
+    fields = {"friendlyName": "friendly_name", "modelName": "model",
+              "UDN": "udn", "manufacturer": "manufacturer",
+              "deviceType": "device_type"}
+    res = {}
+    services = []
+    for elem in root.iter():
+        tag = elem.tag.rsplit("}", 1)[-1]
+        text = (elem.text or "").strip()
+        if tag in fields and fields[tag] not in res:
+            res[fields[tag]] = text
+        elif tag == "serviceType" and text not in services:
+            services.append(text)
+    if res:
+        res["services"] = services
+    return res
+
+
+class DescriptionCache(object):
+    def __init__(self, ttl=60 * 60):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = RLock()
+
+    def get(self, location):
+        with self.lock:
+            entry = self.entries.get(location)
+            if entry is None:
+                return None
+            device, created = entry
+            if created + self.ttl < time.time():
+                del self.entries[location]
+                return None
+            return device
+
+    def put(self, device):
+        with self.lock:
+            self.entries[device["location"]] = (device, time.time())
+
+    def by_host(self, host):
+        with self.lock:
+            locations = [x for x in self.entries if urlparse(x).hostname == host]
+        for location in locations:
+            device = self.get(location)
+            if device is not None:
+                return device
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+descriptions = DescriptionCache()
+
+
+def fetch_description(location, keyword=None, timeout=5, session=None,
+                      cache=descriptions):
+    device = cache.get(location)
+    if device is None:
+        try:
+            content = (session or requests).get(location,
+                                                timeout=timeout).content
+        except requests.exceptions.RequestException:
+            return None
+
+        data = parse_description(content)
+        if not data:
+            return None
+        data["location"] = location
+        data["host"] = urlparse(location).hostname
+        device = Device(data)
+        cache.put(device)
+
+    if isinstance(keyword, bytes):
+        keyword = keyword.decode('utf-8')
+    return device if device.matches(keyword) else None
+
+
+def validate_location(location, keyword, timeout=5, session=None):
     if isinstance(keyword, str):
         keyword = keyword.encode()
 
     try:
-        content = requests.get(location, timeout=timeout).content
+        content = (session or requests).get(location, timeout=timeout).content
         if not keyword:
             return True
         return keyword in content
@@ -31,11 +143,89 @@ def validate_location(location, keyword, timeout=5):
         return False
 
 
+SIOCGIFADDR = 0x8915
+
+
+def mac_from_arp(host, path="/proc/net/arp"):
+    # The kernel's ARP cache has an entry for any TV we just talked to.
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()[1:]
+    except (IOError, OSError):
+        return None
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 4 and fields[0] == host:
+            mac = fields[3].lower()
+            if mac != "00:00:00:00:00:00":
+                return mac
+    return None
+
+
+def list_interfaces():
+    # [(name, ipv4 address)] of the non-loopback interfaces. Enumerating
+    # addresses needs an ioctl, so other platforms get the default route only.
+    default = [("default", "0.0.0.0")]
+    if fcntl is None or not hasattr(socket, "if_nameindex"):
+        return default
+
+    res = []
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for _, name in socket.if_nameindex():
+            request = struct.pack("256s", name[:15].encode('utf-8'))
+            try:
+                packed = fcntl.ioctl(probe.fileno(), SIOCGIFADDR, request)
+            except OSError:
+                continue
+            address = socket.inet_ntoa(packed[20:24])
+            if not address.startswith("127."):
+                res.append((name, address))
+    finally:
+        probe.close()
+    return res or default
+
+
+def resolve_interfaces(interfaces=None):
+    available = list_interfaces()
+    if interfaces is None:
+        return available
+
+    by_name = dict(available)
+    res = []
+    for item in interfaces:
+        if item in by_name:
+            res.append((item, by_name[item]))
+        else:
+            # Not a known name, so it has to be an IPv4 address.
+            socket.inet_aton(item)
+            res.append((item, item))
+    return res
+
+
+def open_search_socket(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                         socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+    if address != "0.0.0.0":
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                        socket.inet_aton(address))
+        sock.bind((address, 0))
+    sock.setblocking(False)
+    return sock
+
+
 # Adapted from Dan Krause (https://gist.github.com/dankrause/6000248)
-def discover(service, keyword=None, hosts=False, retries=1, timeout=5, mx=3):
+def iter_discover(service, keyword=None, hosts=False, retries=1, timeout=5,
+                  mx=3, expected=None, max_workers=8, poll_interval=0.1,
+                  devices=False, interfaces=None, stagger=1, stop=None):
+    # `stop`: an Event that ends the search early when set.
     group = ('239.255.255.250', 1900)
-    locations = set()
     seen = set()
+    found = set()
+    pending = set()
 
     message = "\r\n".join([
         'M-SEARCH * HTTP/1.1',
@@ -45,25 +235,133 @@ def discover(service, keyword=None, hosts=False, retries=1, timeout=5, mx=3):
         'MX: {mx}',
         '', '']).format(*group, st=service, mx=mx).encode('ascii')
 
-    for _ in range(retries):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
-                             socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-        sock.settimeout(timeout)
-        sock.sendto(message, group)
+    def confirmed(futures):
+        for future in futures:
+            if enough():
+                return
+            pending.discard(future)
+            device = future.result()
+            if device is None:
+                continue
+            key = device.host if hosts else device["location"]
+            if key not in found:
+                found.add(key)
+                yield device if devices else key
+
+    def validate(location, interface):
+        device = fetch_description(location, keyword, timeout=timeout,
+                                   session=session)
+        if device is not None:
+            device.data["interface"] = interface
+            if not device.get("mac"):
+                device.data["mac"] = mac_from_arp(device.host)
+        return device
+
+    def enough():
+        return (expected is not None and len(found) >= expected) or \
+            (stop is not None and stop.is_set())
+
+    session = requests.Session()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    selector = selectors.DefaultSelector()
+    try:
+        # One socket per interface, shared by all the retries.
+        for name, address in resolve_interfaces(interfaces):
+            selector.register(open_search_socket(address),
+                              selectors.EVENT_READ, name)
 
+        start = time.time()
+        sends = [start + i * stagger for i in range(retries)]
+        deadline = sends[-1] + timeout
         while True:
-            try:
-                location = read_location(sock.recv(1024))
+            done = {x for x in pending if x.done()}
+            for item in confirmed(done):
+                yield item
+            if enough():
+                return
+
+            now = time.time()
+            while sends and sends[0] <= now:
+                sends.pop(0)
+                for key in selector.get_map().values():
+                    try:
+                        key.fileobj.sendto(message, group)
+                    except OSError:
+                        pass
+            if now >= deadline:
+                break
+
+            wake_up = sends[0] if sends else deadline
+            for key, _ in selector.select(min(wake_up - now, poll_interval)):
+                try:
+                    data, _ = key.fileobj.recvfrom(65507)
+                except OSError:
+                    continue
+                location = read_location(data)
                 if location and location not in seen:
                     seen.add(location)
-                    if validate_location(location, keyword, timeout=timeout):
-                        locations.add(location)
-            except socket.timeout:
+                    pending.add(executor.submit(validate, location, key.data))
+
+        while pending:
+            done, _ = wait(pending, timeout=timeout,
+                           return_when=FIRST_COMPLETED)
+            if not done:
                 break
+            for item in confirmed(done):
+                yield item
+            if enough():
+                return
+    finally:
+        # Don't hold the caller up on validations we no longer care about.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if not pending:
+            session.close()
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
 
-    if hosts:
-        return {urlparse(x).hostname for x in locations}
-    else:
-        return {x for x in locations}
+def discover(service, keyword=None, hosts=False, retries=1, timeout=5, mx=3,
+             expected=None, callback=None, max_workers=8, devices=False,
+             interfaces=None):
+    res = set()
+    for item in iter_discover(service, keyword=keyword, hosts=hosts,
+                              retries=retries, timeout=timeout, mx=mx,
+                              expected=expected, max_workers=max_workers,
+                              devices=devices, interfaces=interfaces):
+        res.add(item)
+        if callback is not None:
+            callback(item)
+    return res
+
+
+async def discover_async(service, **kwargs):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    stop = Event()
+
+    def run():
+        items = iter_discover(service, stop=stop, **kwargs)
+        try:
+            for item in items:
+                if stop.is_set():
+                    break  # Nobody is reading anymore.
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            items.close()
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    future = loop.run_in_executor(None, run)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+    await future
@@ -0,0 +1,117 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from pywebostv.breaker import CircuitBreaker, CircuitOpen
+
+
+class CommandResult(object):
+    def __init__(self, client):
+        self.client = client
+        self.payload = None
+        self.error = None
+        self.latency = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def host(self):
+        return self.client.host
+
+    def __repr__(self):
+        if self.ok:
+            return "<CommandResult '{}' ok in {:.3f}s>".format(self.host,
+                                                               self.latency)
+        return "<CommandResult '{}' failed: {}>".format(self.host, self.error)
+
+
+class BroadcastResult(object):
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def succeeded(self):
+        return [x for x in self.results if x.ok]
+
+    @property
+    def failed(self):
+        return [x for x in self.results if not x.ok]
+
+    def summary(self):
+        latencies = sorted(x.latency for x in self.results
+                           if x.latency is not None)
+        return {
+            "total": len(self.results),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "min_latency": latencies[0] if latencies else None,
+            "max_latency": latencies[-1] if latencies else None,
+            "median_latency": (latencies[len(latencies) // 2]
+                               if latencies else None),
+        }
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return "<BroadcastResult {succeeded}/{total} ok>".format(
+            **self.summary())
+
+
+def broadcast(clients, control_class, command, *args, **kwargs):
+    # Runs `control_class(client).command(*args, **kwargs)` on every client,
+    # at most `parallelism` at a time. `deadline` (seconds) bounds each TV's
+    # call: TVs that answer later, or not by the end, are reported as timed
+    # out. COMMANDS entries also get it as their `timeout`; other methods
+    # (e.g. list_audio_output_sources) are called with the caller's
+    # arguments only.
+    parallelism = kwargs.pop("parallelism", 32)
+    deadline = kwargs.pop("deadline", 10)
+    if command in getattr(control_class, "COMMANDS", {}):
+        kwargs.setdefault("timeout", deadline)
+    clients = list(clients)
+    results = [CommandResult(x) for x in clients]
+
+    def run(client):
+        start = time.time()
+        try:
+            control = control_class(client)
+            return getattr(control, command)(*args, **kwargs), None, \
+                time.time() - start
+        except Exception as ex:
+            return None, ex, time.time() - start
+
+    # TVs whose circuit breaker is open are known to be down: fail them
+    # straight away instead of holding a worker until they time out.
+    live = []
+    for result in results:
+        breaker = getattr(result.client, "breaker", None)
+        if breaker is not None and breaker.state == CircuitBreaker.OPEN:
+            result.error = CircuitOpen("Circuit open for {}.".format(
+                breaker.host))
+        else:
+            live.append(result)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, parallelism))
+    try:
+        futures = [executor.submit(run, x.client) for x in live]
+        # Each call is bounded by `deadline`; allow for the time spent queued
+        # behind other TVs, plus a second of slack.
+        rounds = (len(live) + parallelism - 1) // max(1, parallelism)
+        wait(futures, timeout=rounds * deadline + 1)
+        for future, result in zip(futures, live):
+            if future.done():
+                result.payload, result.error, result.latency = future.result()
+                if result.error is None and result.latency > deadline:
+                    result.payload = None
+                    result.error = IOError("Deadline exceeded.")
+            else:
+                future.cancel()
+                result.error = IOError("Deadline exceeded.")
+    finally:
+        executor.shutdown(wait=False)
+    return BroadcastResult(results)
@@ -0,0 +1,436 @@
+import json
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore, Lock, Thread
+from urllib.parse import parse_qsl, urlsplit
+
+import pywebostv.controls
+from pywebostv.breaker import CircuitOpen
+from pywebostv.connection import RequestTimeout
+from pywebostv.pool import (ConnectionPool, command_kwargs, control_class,
+                            json_default, parse_value)
+from pywebostv.warm import WarmConnection
+
+
+class NotFound(LookupError):
+    pass
+
+
+class Busy(IOError):
+    pass
+
+
+class NotAllowed(LookupError):
+    pass
+
+
+# Getters that don't follow the get_/list_ naming.
+READ_ONLY_COMMANDS = {"info", "network_info", "channel_list"}
+
+
+def read_only(command, cmd_info):
+    # Safe to run from a GET (links, prefetchers, retries) and to share
+    # between concurrent callers.
+    return bool(cmd_info.get("subscription")) or \
+        command.startswith(("get_", "list_")) or \
+        command in READ_ONLY_COMMANDS
+
+
+def error_status(ex):
+    if isinstance(ex, NotAllowed):
+        return 405
+    if isinstance(ex, (NotFound, KeyError)):
+        return 404
+    if isinstance(ex, (TypeError, ValueError)):
+        return 400
+    if isinstance(ex, (Busy, CircuitOpen)):
+        return 503
+    if isinstance(ex, RequestTimeout):
+        return 504
+    if isinstance(ex, IOError):
+        return 502
+    return 500
+
+
+def describe_controls():
+    res = {}
+    for name in dir(pywebostv.controls):
+        cls = getattr(pywebostv.controls, name)
+        if isinstance(cls, type) and cls.__dict__.get("COMMANDS") and \
+                issubclass(cls, pywebostv.controls.WebOSControlBase):
+            res[name] = {k: {"subscription": bool(v.get("subscription")),
+                             "read_only": read_only(k, v)}
+                         for k, v in cls.COMMANDS.items()}
+    return res
+
+
+class EventHub(object):
+    # One subscription on the TV, shared by all the event streams for it.
+    # Events are queued per listener; a listener that falls `backlog`
+    # events behind loses the oldest.
+    def __init__(self, pool, tv, control_name, command, backlog=100,
+                 connect_timeout=10):
+        self.pool = pool
+        self.tv = tv
+        self.control_name = control_name
+        self.command = command
+        self.backlog = backlog
+        self.connect_timeout = connect_timeout
+        self.listeners = set()
+        self.control = None
+        self.lock = Lock()
+
+    def add(self):
+        queue = Queue(maxsize=self.backlog)
+        with self.lock:
+            if self.control is None:
+                self.subscribe()
+            self.listeners.add(queue)
+        return queue
+
+    def remove(self, queue):
+        with self.lock:
+            self.listeners.discard(queue)
+            if not self.listeners:
+                self.unsubscribe()
+
+    def subscribe(self):
+        control = self.pool.control(self.tv, self.control_name,
+                                    self.connect_timeout)
+        cmd_info = control.COMMANDS[self.command]
+        control.subscribe(self.command, cmd_info)(self.publish)
+        self.control = control
+
+    def unsubscribe(self):
+        control, self.control = self.control, None
+        if control is None:
+            return
+        try:
+            control.unsubscribe(self.command, control.COMMANDS[self.command])()
+        except Exception:
+            pass  # Gone with its connection.
+
+    def refresh(self):
+        # Subscribes again if the TV's connection was replaced since.
+        with self.lock:
+            if not self.listeners:
+                return
+            try:
+                current = self.pool.control(self.tv, self.control_name,
+                                            self.connect_timeout)
+            except Exception:
+                return
+            if current is not self.control:
+                self.control = None
+                self.subscribe()
+
+    def publish(self, status, payload):
+        self.send((status, payload))
+
+    def close(self):
+        self.send(None)
+
+    def send(self, item):
+        with self.lock:
+            listeners = list(self.listeners)
+        for queue in listeners:
+            while True:
+                try:
+                    queue.put_nowait(item)
+                    break
+                except Full:
+                    try:
+                        queue.get_nowait()
+                    except Empty:
+                        pass
+
+    @property
+    def active(self):
+        return self.control is not None
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    # GET  /tvs                                   TVs and their connections.
+    # GET  /controls                              Controls and commands.
+    # GET  /stats                                 Gateway counters.
+    # GET  /tvs/<tv>/<Control>/<command>?a=1      Call of a read-only
+    #                                             command; query = kwargs.
+    # POST /tvs/<tv>/<Control>/<command>          Call; body = [args] or
+    #                                             {"args": .., "kwargs": ..}
+    # GET  /tvs/<tv>/<Control>/<command>/events   Subscription, as SSE.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def gateway(self):
+        return self.server.gateway
+
+    def send_json(self, status, obj):
+        data = json.dumps(obj, default=json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        elif status == 405:
+            self.send_header("Allow", "POST")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, ex):
+        self.send_json(error_status(ex), {"ok": False, "error": str(ex),
+                                          "type": type(ex).__name__})
+
+    def route(self):
+        url = urlsplit(self.path)
+        parts = [x for x in url.path.split("/") if x]
+        return parts, dict(parse_qsl(url.query))
+
+    def do_GET(self):
+        parts, query = self.route()
+        try:
+            if parts == ["tvs"]:
+                return self.send_json(200, self.gateway.pool.status())
+            elif parts == ["controls"]:
+                return self.send_json(200, describe_controls())
+            elif parts == ["stats"]:
+                return self.send_json(200, self.gateway.stats())
+            elif len(parts) == 5 and parts[0] == "tvs" and \
+                    parts[4] == "events":
+                return self.stream(*parts[1:4])
+            elif len(parts) == 4 and parts[0] == "tvs":
+                kwargs = {k: parse_value(v) for k, v in query.items()}
+                res = self.gateway.call(parts[1], parts[2], parts[3], [],
+                                        kwargs, coalesce=True)
+                return self.send_json(200, {"ok": True, "payload": res})
+            raise NotFound("No such resource: {}".format(self.path))
+        except Exception as ex:
+            self.send_error_json(ex)
+
+    def do_POST(self):
+        parts, _ = self.route()
+        try:
+            if len(parts) != 4 or parts[0] != "tvs":
+                raise NotFound("No such resource: {}".format(self.path))
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"null")
+            if body is None:
+                args, kwargs = [], {}
+            elif isinstance(body, list):
+                args, kwargs = body, {}
+            elif isinstance(body, dict):
+                args, kwargs = body.get("args", []), body.get("kwargs", {})
+            else:
+                args, kwargs = [body], {}
+            res = self.gateway.call(parts[1], parts[2], parts[3], args, kwargs)
+            self.send_json(200, {"ok": True, "payload": res})
+        except Exception as ex:
+            self.send_error_json(ex)
+
+    def stream(self, tv, control_name, command):
+        hub, queue = self.gateway.listen(tv, control_name, command)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.flush()
+            while True:
+                try:
+                    item = queue.get(timeout=self.gateway.heartbeat)
+                except Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    hub.refresh()
+                    continue
+                if item is None:
+                    break  # Gateway stopping.
+                status, payload = item
+                event = command if status else "error"
+                data = json.dumps(payload, default=json_default)
+                self.wfile.write("event: {}\ndata: {}\n\n".format(
+                    event, data).encode('utf-8'))
+                self.wfile.flush()
+        except (IOError, OSError):
+            pass  # The caller went away.
+        finally:
+            self.gateway.unlisten(hub, queue)
+
+
+class GatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class Gateway(object):
+    # Exposes the COMMANDS of every control over HTTP, and subscriptions as
+    # Server-Sent Events, for all callers over one registered connection per
+    # TV. At most `max_per_tv` calls run on a TV at a time; the others wait
+    # up to `queue_timeout` seconds, then get a 503. Identical GET calls in
+    # flight at the same time share one call to the TV; GET is only for
+    # read-only commands, the others need a POST. Each subscription
+    # is made once on the TV whatever the number of listeners.
+    def __init__(self, tvs, host="127.0.0.1", port=8080, key_path=None,
+                 max_per_tv=4, queue_timeout=5, max_streams=64, heartbeat=15,
+                 connect_timeout=10, connection_class=WarmConnection,
+                 **kwargs):
+        self.host = host
+        self.port = port
+        self.max_per_tv = max_per_tv
+        self.queue_timeout = queue_timeout
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.connect_timeout = connect_timeout
+        self.pool = ConnectionPool(tvs, key_path=key_path,
+                                   connection_class=connection_class,
+                                   **kwargs)
+        self.limits = {x: BoundedSemaphore(max_per_tv) for x in tvs}
+        self.inflight = {}
+        self.hubs = {}
+        self.streams = 0
+        self.counters = {"calls": 0, "coalesced": 0, "rejected": 0}
+        self.lock = Lock()
+        self.server = None
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        http = config.get("http", {})
+        options = {"host": http.get("host", "127.0.0.1"),
+                   "port": http.get("port", 8080),
+                   "key_path": config.get("keys", "~/.pywebostv/keys.json")}
+        if config.get("keepalive"):
+            options["keepalive"] = config["keepalive"]
+        options.update(kwargs)
+        return cls(config["tvs"], **options)
+
+    @property
+    def address(self):
+        return self.server.server_address if self.server else None
+
+    def start(self):
+        self.pool.start()
+        self.server = GatewayServer((self.host, self.port), GatewayHandler)
+        self.server.gateway = self
+        self.thread = Thread(target=self.server.serve_forever,
+                             name="WebOSGateway")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            hubs = list(self.hubs.values())
+        for hub in hubs:
+            hub.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread.join()
+            self.thread = None
+        self.pool.stop()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        finally:
+            self.stop()
+
+    def stats(self):
+        with self.lock:
+            hubs = list(self.hubs.values())
+            res = dict(self.counters, streams=self.streams)
+        res["subscriptions"] = len([x for x in hubs if x.active])
+        return res
+
+    def command(self, tv, control_name, command):
+        if tv not in self.limits:
+            raise NotFound("Unknown TV: {}".format(tv))
+        try:
+            cls = control_class(control_name)
+        except ValueError as ex:
+            raise NotFound(str(ex))
+        cmd_info = cls.COMMANDS.get(command)
+        if cmd_info is None:
+            raise NotFound("Unknown command: {}".format(command))
+        return cmd_info
+
+    def call(self, tv, control_name, command, args, kwargs, coalesce=False):
+        cmd_info = self.command(tv, control_name, command)
+        kwargs = command_kwargs(kwargs)
+        if not coalesce:
+            return self.run(tv, control_name, command, args, kwargs)
+        if not read_only(command, cmd_info):
+            raise NotAllowed("{} changes the TV's state: use POST.".format(
+                command))
+
+        key = json.dumps([tv, control_name, command, args, kwargs],
+                         sort_keys=True)
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            res = self.run(tv, control_name, command, args, kwargs)
+            future.set_result(res)
+            return res
+        except Exception as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def run(self, tv, control_name, command, args, kwargs):
+        limit = self.limits[tv]
+        if not limit.acquire(timeout=self.queue_timeout):
+            with self.lock:
+                self.counters["rejected"] += 1
+            raise Busy("Too many requests for {}.".format(tv))
+        try:
+            with self.lock:
+                self.counters["calls"] += 1
+            control = self.pool.control(tv, control_name,
+                                        self.connect_timeout)
+            return getattr(control, command)(*args, **kwargs)
+        finally:
+            limit.release()
+
+    def listen(self, tv, control_name, command):
+        cmd_info = self.command(tv, control_name, command)
+        if not cmd_info.get("subscription"):
+            raise NotFound("{} has no subscription.".format(command))
+        key = (tv, control_name, command)
+        with self.lock:
+            if self.streams >= self.max_streams:
+                self.counters["rejected"] += 1
+                raise Busy("Too many event streams.")
+            self.streams += 1
+            hub = self.hubs.get(key)
+            if hub is None:
+                hub = self.hubs[key] = EventHub(
+                    self.pool, tv, control_name, command,
+                    connect_timeout=self.connect_timeout)
+        try:
+            return hub, hub.add()
+        except Exception:
+            self.unlisten(hub, None)
+            raise
+
+    def unlisten(self, hub, queue):
+        # The hub stays (unsubscribed when idle) for the next listener.
+        if queue is not None:
+            hub.remove(queue)
+        with self.lock:
+            self.streams -= 1
@@ -0,0 +1,202 @@
+import calendar
+import heapq
+import time
+from itertools import count
+from threading import Condition, Thread
+
+from pywebostv.controls import TvControl
+
+
+TIME_FORMAT = "%Y,%m,%d,%H,%M,%S"
+
+
+def parse_program_time(value):
+    # The TV reports times as "2021,03,14,20,30,00" (UTC).
+    try:
+        return calendar.timegm(time.strptime(value, TIME_FORMAT))
+    except (TypeError, ValueError):
+        return None
+
+
+def current_program(info, now=None):
+    now = now or time.time()
+    for program in info.get("programList") or []:
+        start = parse_program_time(program.get("startTime"))
+        end = parse_program_time(program.get("endTime"))
+        if start is not None and end is not None and start <= now < end:
+            return program
+    return None
+
+
+class ProgramGuide(object):
+    # Caches getChannelProgramInfo per channel until the programme on air
+    # ends, and refetches `prefetch` seconds before that so that the next
+    # programme is already there when it starts. Channels without guide data
+    # are kept for `default_ttl` seconds. Only channels read in the last
+    # `idle` seconds are refetched; the others just expire. All refetches
+    # are run by one thread.
+    def __init__(self, client, default_ttl=300, prefetch=30,
+                 prefetch_enabled=True, idle=600):
+        self.client = client
+        self.control = TvControl(client)
+        self.default_ttl = default_ttl
+        self.prefetch = prefetch
+        self.prefetch_enabled = prefetch_enabled
+        self.idle = idle
+        self.entries = {}
+        self.last_read = {}
+        self.due = {}
+        self.queue = []
+        self.sequence = count()
+        self.condition = Condition()
+        self.thread = None
+        self.closed = False
+
+    def expiry(self, info, now):
+        program = current_program(info, now)
+        end = program and parse_program_time(program.get("endTime"))
+        return end if end and end > now else now + self.default_ttl
+
+    def cached(self, channel_id, now=None):
+        now = now or time.time()
+        with self.condition:
+            entry = self.entries.get(channel_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        return None
+
+    def store(self, channel_id, info):
+        now = time.time()
+        expires = self.expiry(info, now)
+        with self.condition:
+            if self.closed:
+                return
+            self.entries[channel_id] = (expires, info)
+            self.due.pop(channel_id, None)
+            if self.prefetch_enabled and self.recently_read(channel_id, now):
+                # Already inside the prefetch window: the TV would return the
+                # same programme, so wait for it to end instead.
+                when = expires - self.prefetch
+                if when <= now:
+                    when = expires
+                self.due[channel_id] = when
+                heapq.heappush(self.queue,
+                               (when, next(self.sequence), channel_id))
+                if self.thread is None:
+                    self.thread = Thread(target=self.run,
+                                         name="WebOSProgramGuide")
+                    self.thread.daemon = True
+                    self.thread.start()
+                self.condition.notify()
+
+    def recently_read(self, channel_id, now):
+        last_read = self.last_read.get(channel_id)
+        return last_read is not None and now - last_read <= self.idle
+
+    def mark_read(self, channel_ids):
+        now = time.time()
+        with self.condition:
+            for channel_id in channel_ids:
+                self.last_read[channel_id] = now
+
+    def run(self):
+        while True:
+            due = []
+            with self.condition:
+                if self.closed:
+                    return
+                now = time.time()
+                while self.queue and self.queue[0][0] <= now:
+                    when, _, channel_id = heapq.heappop(self.queue)
+                    if self.due.get(channel_id) != when:
+                        continue  # Stored again, or invalidated, since.
+                    del self.due[channel_id]
+                    if self.recently_read(channel_id, now):
+                        due.append(channel_id)
+                    else:
+                        self.last_read.pop(channel_id, None)
+                if not due:
+                    timeout = self.queue[0][0] - now if self.queue else None
+                    self.condition.wait(timeout)
+            for channel_id in due:
+                self.refetch(channel_id)
+
+    def refetch(self, channel_id):
+        def on_response(status, payload):
+            if status:
+                self.store(channel_id, payload)
+        try:
+            self.control.get_program_info(channel_id, callback=on_response)
+        except Exception:
+            pass  # The entry expires and the next get() fetches it.
+
+    def get(self, channel_id, timeout=None):
+        self.mark_read([channel_id])
+        info = self.cached(channel_id)
+        if info is None:
+            info = self.control.get_program_info(channel_id, timeout=timeout)
+            self.store(channel_id, info)
+        return info
+
+    def current(self, channel_id, timeout=None):
+        return current_program(self.get(channel_id, timeout=timeout))
+
+    def get_many(self, channel_ids, timeout=10):
+        # Returns {channel_id: info}. Misses are requested together over the
+        # one connection; channels that fail or don't answer within `timeout`
+        # are left out.
+        self.mark_read(channel_ids)
+        res = {}
+        missing = []
+        for channel_id in channel_ids:
+            info = self.cached(channel_id)
+            if info is not None:
+                res[channel_id] = info
+            elif channel_id not in missing:
+                missing.append(channel_id)
+
+        condition = Condition()
+        pending = set(missing)
+
+        def make_callback(channel_id):
+            def on_response(status, payload):
+                if status:
+                    self.store(channel_id, payload)
+                with condition:
+                    if status:
+                        res[channel_id] = payload
+                    pending.discard(channel_id)
+                    condition.notify()
+            return on_response
+
+        for channel_id in missing:
+            self.control.get_program_info(channel_id,
+                                          callback=make_callback(channel_id))
+
+        deadline = time.time() + timeout
+        with condition:
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                condition.wait(remaining)
+            return dict(res)
+
+    def invalidate(self, channel_id=None):
+        with self.condition:
+            if channel_id is None:
+                self.entries.clear()
+                self.due.clear()
+                del self.queue[:]
+            else:
+                self.entries.pop(channel_id, None)
+                self.due.pop(channel_id, None)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+            thread, self.thread = self.thread, None
+        self.invalidate()
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,202 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+
+from ws4py.exc import WebSocketException
+
+from pywebostv.connection import WebOSClient
+from pywebostv.controls import SystemControl
+from pywebostv.wol import port_open
+
+
+HEALTHY = "healthy"
+UNREACHABLE = "unreachable"
+HANDSHAKE_FAILED = "handshake-failed"
+UNREGISTERED = "unregistered"
+UNRESPONSIVE = "unresponsive"
+
+# Answered even without registration (with an error), so it shows that the
+# TV's SSAP service is up.
+PING_URI = "ssap://com.webos.service.update/getCurrentSWInformation"
+
+
+class HealthProbe(object):
+    # One health check of one TV; latencies in seconds, None if not reached.
+    __slots__ = ("time", "status", "tcp", "websocket", "register", "ssap",
+                 "error")
+
+    def __init__(self, status=None):
+        self.time = time.time()
+        self.status = status
+        self.tcp = None
+        self.websocket = None
+        self.register = None
+        self.ssap = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.status == HEALTHY
+
+    def to_dict(self):
+        return {x: getattr(self, x) for x in self.__slots__}
+
+    def __repr__(self):
+        return "<HealthProbe {}>".format(self.status)
+
+
+class HealthTarget(object):
+    def __init__(self, name, host, store=None, secure=False, history=32):
+        self.name = name
+        self.host = host
+        self.store = store
+        self.secure = secure
+        self.history = deque(maxlen=history)
+
+
+class HealthChecker(object):
+    # Checks every TV each `interval` seconds, at most `max_workers` at a
+    # time: TCP port, websocket handshake, registration (for TVs with a
+    # store) and a cheap SSAP request. The last `history` probes of each TV
+    # are kept; change hooks get (name, old_status, new_status, probe).
+    def __init__(self, interval=60, timeout=5, max_workers=16, history=32,
+                 client_class=WebOSClient):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.history_size = history
+        self.client_class = client_class
+        self.targets = {}
+        self.change_hooks = []
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    def add(self, name, host, store=None, secure=False):
+        target = HealthTarget(name, host, store=store, secure=secure,
+                              history=self.history_size)
+        with self.lock:
+            self.targets[name] = target
+        return target
+
+    def remove(self, name):
+        with self.lock:
+            return self.targets.pop(name, None)
+
+    def on_change(self, callback):
+        self.change_hooks.append(callback)
+
+    def probe(self, target):
+        res = HealthProbe()
+        port = 3001 if target.secure else 3000
+
+        start = time.time()
+        if not port_open(target.host, port, timeout=self.timeout):
+            res.status = UNREACHABLE
+            return res
+        res.tcp = time.time() - start
+
+        client = self.client_class(target.host, secure=target.secure)
+        start = time.time()
+        # Bounds the upgrade too: the TV may accept TCP and never answer.
+        if getattr(client, "sock", None) is not None:
+            client.sock.settimeout(self.timeout)
+        try:
+            client.connect()
+        except (IOError, RuntimeError, WebSocketException) as ex:
+            res.status, res.error = HANDSHAKE_FAILED, str(ex)
+            try:
+                client.close()
+            except (IOError, RuntimeError, WebSocketException):
+                pass
+            return res
+        if getattr(client, "sock", None) is not None:
+            client.sock.settimeout(None)
+        res.websocket = time.time() - start
+
+        try:
+            if target.store is not None and "client_key" in target.store:
+                start = time.time()
+                try:
+                    for _ in client.register(target.store,
+                                             timeout=self.timeout):
+                        pass
+                except Exception as ex:
+                    res.status, res.error = UNREGISTERED, str(ex)
+                    return res
+                res.register = time.time() - start
+
+                start = time.time()
+                SystemControl(client).info(timeout=self.timeout)
+            else:
+                start = time.time()
+                SystemControl(client).request(PING_URI, None, block=True,
+                                              timeout=self.timeout)
+            res.ssap = time.time() - start
+            res.status = HEALTHY
+        except Exception as ex:
+            res.status, res.error = UNRESPONSIVE, str(ex)
+        finally:
+            try:
+                client.close()
+            except (IOError, RuntimeError, WebSocketException):
+                pass
+        return res
+
+    def check(self, name):
+        with self.lock:
+            target = self.targets[name]
+        res = self.probe(target)
+        with self.lock:
+            old = target.history[-1].status if target.history else None
+            target.history.append(res)
+        if old != res.status:
+            for hook in list(self.change_hooks):
+                hook(name, old, res.status, res)
+        return res
+
+    def check_all(self):
+        with self.lock:
+            names = list(self.targets)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.check, names))
+        return dict(zip(names, results))
+
+    def status(self, name):
+        with self.lock:
+            history = self.targets[name].history
+            return history[-1].status if history else None
+
+    def health(self):
+        with self.lock:
+            return {k: (v.history[-1].to_dict() if v.history else None)
+                    for k, v in self.targets.items()}
+
+    def history(self, name):
+        with self.lock:
+            return [x.to_dict() for x in self.targets[name].history]
+
+    def unhealthy(self):
+        with self.lock:
+            return [k for k, v in self.targets.items()
+                    if v.history and not v.history[-1].ok]
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = Thread(target=self.run, name="WebOSHealth")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            start = time.time()
+            self.check_all()
+            self.stop_event.wait(max(0, self.interval -
+                                     (time.time() - start)))
@@ -0,0 +1,116 @@
+import base64
+import hashlib
+from io import BytesIO
+from threading import Lock
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+]
+
+
+def sniff_extension(data):
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return None
+
+
+def downsize(data, max_size):
+    # Scales the image down to fit in max_size x max_size pixels, as PNG.
+    # Without Pillow the image is left as it is.
+    if Image is None:
+        return data, None
+    image = Image.open(BytesIO(data))
+    if max(image.size) <= max_size:
+        return data, None
+    image.thumbnail((max_size, max_size))
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue(), "png"
+
+
+class Icon(object):
+    __slots__ = ("name", "digest", "data", "extension", "size")
+
+    def __init__(self, name, digest, data, extension, size):
+        self.name = name
+        self.digest = digest
+        self.data = data
+        self.extension = extension
+        self.size = size
+
+    def __repr__(self):
+        return "<Icon '{}' {} {} bytes>".format(self.name or self.digest,
+                                                self.extension, self.size)
+
+
+class IconRegistry(object):
+    # Encodes each icon once. Icons are found by the name they were
+    # registered under or by the hex digest of their (original) content.
+    def __init__(self):
+        self.by_name = {}
+        self.by_digest = {}
+        self.lock = Lock()
+
+    def register(self, icon_bytes, name=None, extension=None, max_size=None):
+        digest = hashlib.blake2b(icon_bytes, digest_size=16).hexdigest()
+        with self.lock:
+            icon = self.by_digest.get(digest)
+        if icon is None:
+            data, new_extension = icon_bytes, None
+            if max_size:
+                data, new_extension = downsize(icon_bytes, max_size)
+            extension = new_extension or extension or \
+                sniff_extension(data) or "png"
+            icon = Icon(name, digest, base64.b64encode(data).decode('utf-8'),
+                        extension, len(data))
+        with self.lock:
+            icon = self.by_digest.setdefault(digest, icon)
+            if name is not None:
+                self.by_name[name] = icon
+        return icon
+
+    def get(self, key):
+        if isinstance(key, Icon):
+            return key
+        with self.lock:
+            icon = self.by_name.get(key) or self.by_digest.get(key)
+        if icon is None:
+            raise KeyError("Unknown icon: {}".format(key))
+        return icon
+
+    def remove(self, key):
+        with self.lock:
+            icon = self.by_name.pop(key, None) or self.by_digest.get(key)
+            if icon is None:
+                return None
+            self.by_digest.pop(icon.digest, None)
+            for name in [k for k, v in self.by_name.items() if v is icon]:
+                del self.by_name[name]
+        return icon
+
+    def clear(self):
+        with self.lock:
+            self.by_name.clear()
+            self.by_digest.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.by_name or key in self.by_digest
+
+    def __len__(self):
+        with self.lock:
+            return len(self.by_digest)
+
+
+icons = IconRegistry()
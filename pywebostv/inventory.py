@@ -0,0 +1,116 @@
+from threading import RLock
+from uuid import uuid4
+
+from pywebostv.controls import ApplicationControl
+from pywebostv.model import Application, content_hash, intern_strings
+
+
+class AppChanges(object):
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return "<AppChanges +{} -{} ~{}>".format(
+            len(self.added), len(self.removed), len(self.changed))
+
+
+class AppInventory(object):
+    LIST_APPS_URI = "ssap://com.webos.applicationManager/listApps"
+
+    def __init__(self, client):
+        self.client = client
+        self.control = ApplicationControl(client)
+        self.apps = {}
+        self.hashes = {}
+        self.lock = RLock()
+        self.subscription_id = None
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __contains__(self, app_id):
+        return app_id in self.apps
+
+    def get(self, app_id):
+        app = self.apps.get(app_id)
+        return Application(app) if app is not None else None
+
+    def applications(self):
+        with self.lock:
+            return [Application(x) for x in self.apps.values()]
+
+    def refresh(self, timeout=None):
+        apps = self.control.list_apps(timeout=timeout)
+        return self.replace([x.data for x in apps])
+
+    def replace(self, apps):
+        apps = intern_strings(apps)
+        with self.lock:
+            old_ids = set(self.apps)
+            new_apps = {x["id"]: x for x in apps}
+            new_hashes = {k: content_hash(v) for k, v in new_apps.items()}
+
+            changes = AppChanges(
+                added=[Application(new_apps[x])
+                       for x in new_apps if x not in old_ids],
+                removed=[Application(self.apps[x])
+                         for x in old_ids if x not in new_apps],
+                changed=[Application(new_apps[x])
+                         for x in new_apps if x in old_ids and
+                         new_hashes[x] != self.hashes[x]])
+            self.apps, self.hashes = new_apps, new_hashes
+        return changes
+
+    def apply(self, change, app):
+        app = intern_strings(app)
+        app_id = app["id"]
+        with self.lock:
+            if change == "removed":
+                removed = self.apps.pop(app_id, None)
+                self.hashes.pop(app_id, None)
+                return AppChanges(removed=[Application(removed)]
+                                  if removed is not None else [])
+
+            digest = content_hash(app)
+            if app_id not in self.apps:
+                self.apps[app_id], self.hashes[app_id] = app, digest
+                return AppChanges(added=[Application(app)])
+            if self.hashes[app_id] != digest:
+                self.apps[app_id], self.hashes[app_id] = app, digest
+                return AppChanges(changed=[Application(app)])
+        return AppChanges()
+
+    def subscribe(self, callback):
+        # callback(status, changes). TVs that don't support this subscription
+        # call back with status=False; poll refresh() on those instead.
+        def on_event(payload):
+            payload = payload or {}
+            if not payload.get("returnValue", True) and \
+                    not payload.get("subscribed"):
+                return callback(False, payload.get("errorText",
+                                                   "Unknown error."))
+            if "apps" in payload:
+                changes = self.replace(payload["apps"])
+            elif "app" in payload:
+                changes = self.apply(payload.get("change"), payload["app"])
+            else:
+                return
+            if changes:
+                callback(True, changes)
+
+        if self.subscription_id is not None:
+            raise ValueError("Already subscribed.")
+        self.subscription_id = str(uuid4())
+        self.client.subscribe(self.LIST_APPS_URI, self.subscription_id,
+                              on_event)
+
+    def unsubscribe(self):
+        if self.subscription_id is None:
+            raise ValueError("Not subscribed.")
+        self.client.unsubscribe(self.subscription_id)
+        self.subscription_id = None
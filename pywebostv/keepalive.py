@@ -0,0 +1,148 @@
+import time
+from collections import deque
+from itertools import count
+from threading import Event, Lock, Thread, current_thread
+
+from ws4py.exc import WebSocketException
+
+
+class Keepalive(object):
+    # Pings the TV every `interval` seconds. Each pong updates the round trip
+    # time; a ping unanswered after `timeout` seconds is missed, and after
+    # `max_missed` of those in a row the connection is declared dead: the
+    # dead hooks are called with (client, reason) and the socket is closed,
+    # which in turn runs client.close_hooks.
+    def __init__(self, client, interval=10, timeout=5, max_missed=2,
+                 window=32, on_dead=None):
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self.max_missed = max_missed
+        self.samples = deque(maxlen=window)
+        self.srtt = None
+        self.rttvar = None
+        self.missed = 0
+        self.pings = 0
+        self.pongs = 0
+        self.outstanding = {}
+        self.sequence = count()
+        self.dead = False
+        self.dead_hooks = [on_dead] if on_dead is not None else []
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    @property
+    def rtt(self):
+        return self.srtt
+
+    def percentile(self, value):
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * value / 100.0))
+        return samples[index]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rtt": self.srtt,
+                "rtt_variance": self.rttvar,
+                "last_rtt": self.samples[-1] if self.samples else None,
+                "samples": len(self.samples),
+                "pings": self.pings,
+                "pongs": self.pongs,
+                "missed": self.missed,
+                "dead": self.dead,
+            }
+
+    def start(self):
+        self.client.keepalive = self
+        self.client.pong_hooks.append(self.on_pong)
+        self.client.close_hooks.append(self.on_closed)
+        self.thread = Thread(target=self.run, name="WebOSKeepalive")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for hooks, hook in ((self.client.pong_hooks, self.on_pong),
+                            (self.client.close_hooks, self.on_closed)):
+            if hook in hooks:
+                hooks.remove(hook)
+        if self.client.keepalive is self:
+            self.client.keepalive = None
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        next_ping = time.time()
+        while not self.stop_event.is_set():
+            now = time.time()
+            self.check_missed(now)
+            if self.dead:
+                return
+            if now >= next_ping:
+                self.ping()
+                next_ping = now + self.interval
+
+            with self.lock:
+                wake = min([next_ping] + [x + self.timeout
+                                          for x in self.outstanding.values()])
+            self.stop_event.wait(max(0, wake - time.time()))
+
+    def ping(self):
+        payload = str(next(self.sequence))
+        with self.lock:
+            self.outstanding[payload] = time.time()
+            self.pings += 1
+        try:
+            with self.client.send_lock:
+                self.client.ping(payload)
+        except (IOError, RuntimeError, WebSocketException) as ex:
+            self.declare_dead("Ping failed: {}".format(ex))
+
+    def check_missed(self, now):
+        with self.lock:
+            expired = [k for k, v in self.outstanding.items()
+                       if v + self.timeout <= now]
+            for key in expired:
+                del self.outstanding[key]
+            self.missed += len(expired)
+            missed = self.missed
+        if missed >= self.max_missed:
+            self.declare_dead("{} pings unanswered.".format(missed))
+
+    def on_pong(self, client, data):
+        now = time.time()
+        payload = data.decode('utf-8') if isinstance(data, bytes) else data
+        with self.lock:
+            sent = self.outstanding.pop(payload, None)
+            if sent is None:
+                return  # Unsolicited, or answered after its timeout.
+            rtt = now - sent
+            self.samples.append(rtt)
+            self.pongs += 1
+            self.missed = 0
+            # Smoothed like TCP does (RFC 6298).
+            if self.srtt is None:
+                self.srtt, self.rttvar = rtt, rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def on_closed(self, client, code, reason):
+        self.stop_event.set()
+
+    def declare_dead(self, reason):
+        with self.lock:
+            if self.dead:
+                return
+            self.dead = True
+        self.stop_event.set()
+        for hook in list(self.dead_hooks):
+            hook(self.client, reason)
+        self.client.close_connection()
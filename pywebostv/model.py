@@ -1,30 +1,157 @@
+import hashlib
+import json
+import sys
+
+
+def intern_strings(obj, max_length=64):
+    # Lists of apps/sources repeat the same keys and many of the same short
+    # values (vendor, type, version...); share one copy of each.
+    if isinstance(obj, dict):
+        return {sys.intern(k) if isinstance(k, str) else k:
+                intern_strings(v, max_length) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [intern_strings(x, max_length) for x in obj]
+    elif isinstance(obj, str) and len(obj) <= max_length:
+        return sys.intern(obj)
+    return obj
+
+
+def content_hash(obj):
+    encoded = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=8).digest()
+
+
+class Model(object):
+    # Thin wrapper over the raw payload: fields are read from it on access
+    # instead of being copied to attributes. Equal (and hashed) by id.
+    __slots__ = ("data",)
+    KEY = "id"
 
-class Application(object):
     def __init__(self, data):
         self.data = data
 
     def __getitem__(self, val):
         return self.data[val]
 
+    def get(self, val, default=None):
+        return self.data.get(val, default)
+
+    @property
+    def id(self):
+        return self.data.get(self.KEY)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        if self.id is None:
+            return self is other
+        return self.id == other.id
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __hash__(self):
+        if self.id is None:
+            return object.__hash__(self)
+        return hash((type(self).__name__, self.id))
+
+
+class ModelList(list):
+    # A plain list of models (what list_apps & co. always returned), which
+    # also knows its model class. The wrappers are a single slot each; the
+    # payload itself isn't copied.
+    __slots__ = ("model",)
+
+    def __init__(self, model, items):
+        super(ModelList, self).__init__(model(x) for x in items)
+        self.model = model
+
+    def __getitem__(self, index):
+        res = super(ModelList, self).__getitem__(index)
+        if isinstance(index, slice):
+            sliced = ModelList(self.model, ())
+            sliced.extend(res)
+            return sliced
+        return res
+
+    def __repr__(self):
+        return "<ModelList of {} {}>".format(len(self), self.model.__name__)
+
+
+class Application(Model):
+    __slots__ = ()
+
+    @property
+    def title(self):
+        return self.data.get("title")
+
     def __repr__(self):
         return "<Application '{}'>".format(self["title"])
 
 
-class InputSource(object):
-    def __init__(self, data):
-        self.data = data
-        self.label = data["label"]
+class InputSource(Model):
+    __slots__ = ()
 
-    def __getitem__(self, val):
-        return self.data[val]
+    @property
+    def label(self):
+        return self.data["label"]
 
     def __repr__(self):
         return "<InputSource '{}'>".format(self["label"])
 
 
-class AudioOutputSource(object):
-    def __init__(self, data):
-        self.data = data
+class AudioOutputSource(Model):
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self.data
+
+    def __getitem__(self, val):
+        raise TypeError("AudioOutputSource is not subscriptable.")
 
     def __repr__(self):
         return "<AudioOutputSource '{}'>".format(self.data)
+
+
+class Channel(Model):
+    __slots__ = ()
+    KEY = "channelId"
+
+    @property
+    def number(self):
+        return self.data.get("channelNumber")
+
+    @property
+    def name(self):
+        return self.data.get("channelName")
+
+    @property
+    def type(self):
+        return self.data.get("channelTypeName")
+
+    def __repr__(self):
+        return "<Channel {} '{}'>".format(self.number, self.name)
+
+
+class Device(Model):
+    __slots__ = ()
+    KEY = "udn"
+
+    @property
+    def udn(self):
+        return self.data.get("udn")
+
+    @property
+    def host(self):
+        return self.data.get("host")
+
+    def matches(self, keyword):
+        if not keyword:
+            return True
+        fields = ("friendly_name", "manufacturer", "model", "device_type")
+        return any(keyword in (self.data.get(x) or "") for x in fields)
+
+    def __repr__(self):
+        return "<Device '{}' {}>".format(self.get("friendly_name"), self.udn)
@@ -0,0 +1,121 @@
+import json
+import os
+from threading import Lock
+
+import pywebostv.controls
+from pywebostv.model import Model
+from pywebostv.warm import WarmConnection
+
+
+def json_default(obj):
+    # Responses hold models (Application, InputSource, ..) and ModelLists.
+    if isinstance(obj, Model):
+        return obj.data
+    if isinstance(obj, Exception):
+        return str(obj)
+    return list(obj)
+
+
+def parse_value(value):
+    # "10" -> 10, "true" -> True, '{"a": 1}' -> dict; anything else is a
+    # string.
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def control_class(name):
+    cls = getattr(pywebostv.controls, name, None)
+    if not isinstance(cls, type) or \
+            not issubclass(cls, pywebostv.controls.WebOSControlBase):
+        raise ValueError("Unknown control: {}".format(name))
+    return cls
+
+
+def command_kwargs(kwargs):
+    # What remote callers may pass to a command: the ones controlling how
+    # it runs (a callback to call, whether to block) are ours to set.
+    return {k: v for k, v in kwargs.items()
+            if k not in ("callback", "block", "deadline")}
+
+
+class ConnectionPool(object):
+    # One registered connection per TV (a WarmConnection), shared by all
+    # callers, with the client keys kept in the JSON file at `key_path`.
+    def __init__(self, tvs, key_path=None, connection_class=WarmConnection,
+                 **kwargs):
+        # `tvs`: {name: {"host": .., "secure": ..}}. `kwargs` go to each
+        # WarmConnection (e.g. keepalive={"interval": 10}).
+        self.tvs = tvs
+        self.key_path = key_path and os.path.expanduser(key_path)
+        self.connection_class = connection_class
+        self.kwargs = kwargs
+        self.stores = {}
+        self.saved = {}
+        self.connections = {}
+        self.controls = {}
+        self.lock = Lock()
+        self.load_keys()
+
+    def load_keys(self):
+        if self.key_path and os.path.exists(self.key_path):
+            with open(self.key_path) as f:
+                self.stores = json.load(f)
+        for name in self.tvs:
+            self.stores.setdefault(name, {})
+        self.saved = json.loads(json.dumps(self.stores))
+
+    def save_keys(self):
+        with self.lock:
+            if not self.key_path or self.stores == self.saved:
+                return
+            self.saved = json.loads(json.dumps(self.stores))
+            directory = os.path.dirname(self.key_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp_path = self.key_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                os.chmod(tmp_path, 0o600)
+                json.dump(self.saved, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.key_path)
+
+    def start(self):
+        for name, tv in self.tvs.items():
+            connection = self.connection_class(
+                tv["host"], self.stores[name], secure=tv.get("secure", False),
+                **self.kwargs)
+            connection.start()
+            self.connections[name] = connection
+
+    def stop(self):
+        for connection in self.connections.values():
+            connection.stop()
+        self.connections = {}
+        self.controls = {}
+        self.save_keys()
+
+    def client(self, tv, timeout=10):
+        connection = self.connections.get(tv)
+        if connection is None:
+            raise KeyError("Unknown TV: {}".format(tv))
+        client = connection.get(timeout=timeout)
+        # Registration may just have given us a key.
+        self.save_keys()
+        return client
+
+    def control(self, tv, name, timeout=10):
+        # A control of the TV's current client; the same instance until the
+        # client is replaced.
+        client = self.client(tv, timeout)
+        key = (tv, name)
+        with self.lock:
+            cached = self.controls.get(key)
+            if cached is None or cached[0] is not client:
+                cached = self.controls[key] = (client,
+                                               control_class(name)(client))
+        return cached[1]
+
+    def status(self):
+        return {k: dict(v.metrics(), host=self.tvs[k]["host"])
+                for k, v in self.connections.items()}
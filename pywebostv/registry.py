@@ -0,0 +1,216 @@
+import json
+import os
+import socket
+import struct
+import time
+from threading import RLock, Thread
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+from pywebostv.discovery import iter_discover, fetch_description, read_headers
+from pywebostv.model import Device
+
+
+SSDP_GROUP = ('239.255.255.250', 1900)
+MEDIA_RENDERER = "urn:schemas-upnp-org:device:MediaRenderer:1"
+
+
+class DeviceRegistry(object):
+    def __init__(self, path=None, ttl=24 * 60 * 60):
+        self.path = path and os.path.expanduser(path)
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = RLock()
+        self.load()
+
+    @staticmethod
+    def key(device):
+        return device.get("udn") or device["host"]
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            entries = json.load(f)
+        with self.lock:
+            self.entries = {self.key(x): x for x in entries}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            entries = list(self.entries.values())
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def update(self, device, last_seen=None, save=True):
+        # `save=False` leaves writing the file to the caller, to batch it.
+        if isinstance(device, Device):
+            device = device.data
+        record = dict(device)
+        record["last_seen"] = last_seen or time.time()
+        with self.lock:
+            # A TV that changed its IP keeps its UDN; drop the stale entry.
+            if record.get("udn"):
+                self.entries.pop(record["host"], None)
+            self.entries[self.key(record)] = record
+        if save:
+            self.save()
+        return record
+
+    def touch(self, udn, location=None, save=True):
+        with self.lock:
+            record = self.entries.get(udn)
+            if record is None:
+                return None
+            record["last_seen"] = time.time()
+            if location:
+                record["location"] = location
+                record["host"] = urlparse(location).hostname
+        if save:
+            self.save()
+        return record
+
+    def remove(self, key, save=True):
+        with self.lock:
+            record = self.entries.pop(key, None)
+        if record is not None and save:
+            self.save()
+        return record
+
+    def devices(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            return [x for x in self.entries.values()
+                    if x["last_seen"] + self.ttl >= now]
+
+    def hosts(self):
+        return [x["host"] for x in self.devices()]
+
+    def device(self, key):
+        record = self.get(key)
+        return Device(record) if record is not None else None
+
+    @property
+    def warm(self):
+        return bool(self.devices())
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def refresh(self, service=MEDIA_RENDERER, keyword="LG", **kwargs):
+        res = [self.update(x, save=False)
+               for x in iter_discover(service, keyword=keyword, devices=True,
+                                      **kwargs)]
+        self.save()  # Once for the whole scan.
+        return res
+
+
+class NotifyListener(object):
+    # Changes are written to the registry's file at most once every
+    # `save_interval` seconds (TVs announce themselves often).
+    def __init__(self, registry, service=MEDIA_RENDERER, keyword="LG",
+                 interface="0.0.0.0", save_interval=30):
+        self.registry = registry
+        self.save_interval = save_interval
+        self.dirty = False
+        self.last_save = 0
+        self.service = service
+        self.keyword = keyword
+        self.interface = interface
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', SSDP_GROUP[1]))
+        membership = struct.pack("4s4s", socket.inet_aton(SSDP_GROUP[0]),
+                                 socket.inet_aton(self.interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        membership)
+        sock.settimeout(1)
+
+        self.sock = sock
+        self.running = True
+        self.thread = Thread(target=self.run, name="SSDPNotifyListener")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.save(force=True)
+
+    def run(self):
+        while self.running:
+            try:
+                data, _ = self.sock.recvfrom(65507)
+            except socket.timeout:
+                data = None
+            except OSError:
+                break
+            try:
+                if data is not None:
+                    self.handle(data)
+                self.save()
+            except Exception:
+                # A bad announcement (or a failed write) mustn't stop the
+                # listener; the write is retried with the next change.
+                continue
+
+    def save(self, force=False):
+        if not self.dirty:
+            return False
+        if not force and time.time() - self.last_save < self.save_interval:
+            return False
+        self.dirty = False
+        self.last_save = time.time()
+        try:
+            self.registry.save()
+        except Exception:
+            self.dirty = True
+            raise
+        return True
+
+    def handle(self, data):
+        start_line, headers = read_headers(data)
+        if not start_line.upper().startswith("NOTIFY"):
+            return
+        if headers.get("nt") != self.service:
+            return
+
+        udn = headers.get("usn", "").split("::", 1)[0]
+        nts = headers.get("nts")
+        if nts == "ssdp:byebye":
+            if self.registry.remove(udn, save=False) is not None:
+                self.dirty = True
+        elif nts == "ssdp:alive":
+            location = headers.get("location")
+            if not location:
+                return
+            if self.registry.touch(udn, location=location,
+                                   save=False) is None:
+                device = fetch_description(location, keyword=self.keyword)
+                if device is not None:
+                    self.registry.update(device, save=False)
+                    self.dirty = True
+            else:
+                self.dirty = True
@@ -0,0 +1,351 @@
+import heapq
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import count
+from threading import Condition, Lock, Thread
+from uuid import uuid4
+
+import pywebostv.controls
+
+
+class CronSchedule(object):
+    # minute hour day-of-month month day-of-week, with "*", "a-b", "a,b" and
+    # "/step". Day of week is 0-6 with 0 (or 7) being Sunday.
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: {}".format(expr))
+        self.expr = expr
+        self.fields = [self.parse_field(x, lo, hi)
+                       for x, (lo, hi) in zip(fields, self.RANGES)]
+        if 7 in self.fields[4]:
+            self.fields[4] = (self.fields[4] - {7}) | {0}
+        self.any_dom = fields[2] == "*"
+        self.any_dow = fields[4] == "*"
+
+    @staticmethod
+    def parse_field(field, lo, hi):
+        res = set()
+        for part in field.split(","):
+            value, _, step = part.partition("/")
+            if value == "*":
+                start, end = lo, hi
+            elif "-" in value:
+                start, end = (int(x) for x in value.split("-", 1))
+            else:
+                start = int(value)
+                end = hi if step else start
+            if not lo <= start <= end <= hi:
+                raise ValueError("Bad cron field: {}".format(field))
+            res.update(range(start, end + 1, int(step) if step else 1))
+        return res
+
+    def day_matches(self, day):
+        minutes, hours, doms, months, dows = self.fields
+        if day.month not in months:
+            return False
+        dom = day.day in doms
+        dow = (day.weekday() + 1) % 7 in dows
+        # Cron semantics: if both are restricted, either may match.
+        if self.any_dom or self.any_dow:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, timestamp):
+        minutes, hours = sorted(self.fields[0]), sorted(self.fields[1])
+        start = datetime.fromtimestamp(timestamp).replace(second=0,
+                                                          microsecond=0)
+        start += timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self.day_matches(day):
+                for hour in hours:
+                    for minute in minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return time.mktime(candidate.timetuple())
+            day += timedelta(days=1)
+        raise ValueError("Cron expression never fires: {}".format(self.expr))
+
+
+class Job(object):
+    def __init__(self, targets, control, command, args=None, kwargs=None,
+                 cron=None, run_at=None, jitter=0, stagger=0, retries=0,
+                 retry_delay=30, job_id=None, next_run=None, pending=None):
+        if (cron is None) == (run_at is None):
+            raise ValueError("Exactly one of cron or run_at is needed.")
+        self.id = job_id or str(uuid4())
+        self.targets = list(targets)
+        self.control = control
+        self.command = command
+        self.args = list(args or [])
+        self.kwargs = dict(kwargs or {})
+        self.cron = cron
+        self.schedule = CronSchedule(cron) if cron else None
+        self.run_at = run_at
+        self.jitter = jitter
+        self.stagger = stagger
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.next_run = next_run
+        # Executions fired but not finished yet: {target: [due, attempt]}.
+        self.pending = dict(pending or {})
+
+    def compute_next_run(self, now):
+        if self.schedule is not None:
+            return self.schedule.next_after(now)
+        return self.run_at
+
+    def to_dict(self):
+        return {
+            "job_id": self.id, "targets": self.targets,
+            "control": self.control, "command": self.command,
+            "args": self.args, "kwargs": self.kwargs, "cron": self.cron,
+            "run_at": self.run_at, "jitter": self.jitter,
+            "stagger": self.stagger, "retries": self.retries,
+            "retry_delay": self.retry_delay, "next_run": self.next_run,
+            "pending": dict(self.pending),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        when = self.cron or self.run_at
+        return "<Job {} {}.{} @ {}>".format(self.id, self.control,
+                                           self.command, when)
+
+
+class Execution(object):
+    def __init__(self, job, target, scheduled, attempt=1):
+        self.job = job
+        self.target = target
+        self.scheduled = scheduled
+        self.attempt = attempt
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+
+    @property
+    def ok(self):
+        return self.finished is not None and self.error is None
+
+    @property
+    def latency(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def delay(self):
+        # How late the execution started compared to when it was due.
+        if self.started is None:
+            return None
+        return self.started - self.scheduled
+
+    def to_dict(self):
+        return {
+            "job_id": self.job.id, "target": self.target,
+            "scheduled": self.scheduled, "started": self.started,
+            "finished": self.finished, "attempt": self.attempt,
+            "latency": self.latency, "ok": self.ok,
+            "error": None if self.error is None else str(self.error),
+        }
+
+
+class Scheduler(object):
+    def __init__(self, clients, groups=None, path=None, max_workers=16,
+                 history=1000):
+        # `clients` maps a TV name to a connected WebOSClient (or is a
+        # callable doing so); `groups` maps a group name to TV names.
+        self.clients = clients
+        self.groups = groups or {}
+        self.path = path and os.path.expanduser(path)
+        self.jobs = {}
+        self.queue = []
+        self.sequence = count()
+        self.history = deque(maxlen=history)
+        self.condition = Condition()
+        self.save_lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.thread = None
+        self.running = False
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            jobs = [Job.from_dict(x) for x in json.load(f)]
+        for job in jobs:
+            self.add_job(job, save=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.condition:
+            jobs = [x.to_dict() for x in self.jobs.values()]
+        tmp_path = self.path + ".tmp"
+        with self.save_lock:
+            with open(tmp_path, "w") as f:
+                json.dump(jobs, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def add_job(self, job, save=True):
+        with self.condition:
+            if job.next_run is None and not job.pending:
+                job.next_run = job.compute_next_run(time.time())
+            self.jobs[job.id] = job
+            if job.next_run is not None:
+                self.push(job.next_run, job)
+            # Executions left over by a previous run (e.g. a restart in the
+            # middle of a stagger).
+            for target, (when, attempt) in job.pending.items():
+                self.push(when, Execution(job, target, when, attempt))
+            self.condition.notify()
+        if save:
+            self.save()
+        return job
+
+    def schedule(self, targets, control, command, *args, **kwargs):
+        options = {k: kwargs.pop(k) for k in list(kwargs)
+                   if k in ("cron", "run_at", "jitter", "stagger", "retries",
+                            "retry_delay")}
+        return self.add_job(Job(targets, control, command, args=args,
+                                kwargs=kwargs, **options))
+
+    def remove_job(self, job_id):
+        with self.condition:
+            job = self.jobs.pop(job_id, None)
+        self.save()
+        return job
+
+    def push(self, when, item):
+        heapq.heappush(self.queue, (when, next(self.sequence), item))
+
+    def resolve_targets(self, targets):
+        res = []
+        for target in targets:
+            for name in self.groups.get(target, [target]):
+                if name not in res:
+                    res.append(name)
+        return res
+
+    def resolve_client(self, name):
+        if callable(self.clients):
+            return self.clients(name)
+        return self.clients[name]
+
+    def run_pending(self, now=None):
+        # Starts everything that is due; returns when the next item is due.
+        now = now or time.time()
+        due = []
+        with self.condition:
+            while self.queue and self.queue[0][0] <= now:
+                when, _, item = heapq.heappop(self.queue)
+                if isinstance(item, Job):
+                    self.expand(item, when, now)
+                elif self.jobs.get(item.job.id) is item.job:
+                    due.append(item)  # Unless its job was removed.
+            next_time = self.queue[0][0] if self.queue else None
+
+        for execution in due:
+            self.executor.submit(self.execute, execution)
+        return next_time
+
+    def expand(self, job, when, now):
+        if job.id not in self.jobs or job.next_run != when:
+            return  # Removed, or rescheduled since.
+
+        # Spread the targets over time so that they don't all fire at once.
+        for index, target in enumerate(self.resolve_targets(job.targets)):
+            offset = index * job.stagger + random.uniform(0, job.jitter)
+            self.push(when + offset, Execution(job, target, when + offset))
+            job.pending[target] = [when + offset, 1]
+
+        if job.schedule is not None:
+            job.next_run = job.compute_next_run(max(when, now))
+            self.push(job.next_run, job)
+        else:
+            # Kept (and saved) until its executions and retries are done.
+            job.next_run = None
+            if not job.pending:
+                self.jobs.pop(job.id, None)
+        self.executor.submit(self.save)
+
+    def execute(self, execution):
+        job = execution.job
+        execution.started = time.time()
+        try:
+            control_class = getattr(pywebostv.controls, job.control)
+            control = control_class(self.resolve_client(execution.target))
+            method = getattr(control, job.command)
+            execution.result = method(*job.args, **job.kwargs)
+        except Exception as ex:
+            execution.error = ex
+        execution.finished = time.time()
+        self.history.append(execution)
+
+        target = execution.target
+        with self.condition:
+            if self.jobs.get(job.id) is not job:
+                return  # Removed meanwhile.
+            current = job.pending.get(target) == [execution.scheduled,
+                                                  execution.attempt]
+            if execution.error is not None and \
+                    execution.attempt <= job.retries:
+                retry = Execution(job, target,
+                                  execution.finished + job.retry_delay,
+                                  attempt=execution.attempt + 1)
+                self.push(retry.scheduled, retry)
+                if current:
+                    job.pending[target] = [retry.scheduled, retry.attempt]
+                self.condition.notify()
+            elif current:
+                del job.pending[target]
+            if job.next_run is None and not job.pending:
+                self.jobs.pop(job.id, None)
+        self.save()
+
+    def job_history(self, job_id=None):
+        return [x.to_dict() for x in list(self.history)
+                if job_id is None or x.job.id == job_id]
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.run, name="WebOSScheduler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, wait=True):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.executor.shutdown(wait=wait)
+
+    def run(self):
+        while self.running:
+            self.run_pending()
+            with self.condition:
+                if not self.running:
+                    break
+                # Re-read the queue under the lock: add_job may have pushed
+                # something sooner while we were busy.
+                if not self.queue:
+                    self.condition.wait()
+                else:
+                    timeout = self.queue[0][0] - time.time()
+                    if timeout > 0:
+                        self.condition.wait(timeout)
@@ -0,0 +1,534 @@
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from itertools import count
+from multiprocessing.connection import wait
+from threading import Lock, RLock, Thread
+
+from pywebostv.connection import RequestTimeout, WebOSClient
+
+
+class WorkerDied(IOError):
+    pass
+
+
+def picklable_error(ex):
+    try:
+        pickle.dumps(ex)
+        return ex
+    except Exception:
+        return IOError("{}: {}".format(type(ex).__name__, ex))
+
+
+class ShardTarget(object):
+    # A TV as seen by the worker that owns it.
+    def __init__(self, name, host, store, secure):
+        self.name = name
+        self.host = host
+        self.store = store
+        self.secure = secure
+        self.client = None
+        self.controls = {}
+        self.subscriptions = {}  # key -> (control_class, command)
+        self.active = set()      # Keys subscribed on the current client.
+        self.retry_at = 0
+        self.lock = RLock()
+
+
+class ShardWorker(object):
+    # Runs in a worker process: owns the connections to its TVs, runs the
+    # calls it is sent (on a thread pool) and sends back the results,
+    # subscription events and new client keys.
+    def __init__(self, conn, client_class=WebOSClient, max_threads=32,
+                 retry_interval=5):
+        self.conn = conn
+        self.client_class = client_class
+        self.retry_interval = retry_interval
+        self.targets = {}
+        self.send_lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+
+    def send(self, *msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def run(self):
+        try:
+            while True:
+                if self.conn.poll(1):
+                    try:
+                        msg = self.conn.recv()
+                    except EOFError:
+                        break  # The coordinator is gone.
+                    if msg[0] == "stop":
+                        break
+                    self.handle(msg)
+                self.maintain()
+        finally:
+            self.executor.shutdown(wait=False)
+            for target in list(self.targets.values()):
+                self.disconnect(target)
+
+    def handle(self, msg):
+        kind = msg[0]
+        if kind == "add":
+            _, name, host, store, secure = msg
+            self.targets[name] = ShardTarget(name, host, store, secure)
+        elif kind == "remove":
+            target = self.targets.pop(msg[1], None)
+            if target is not None:
+                self.disconnect(target)
+        elif kind == "call":
+            self.executor.submit(self.call, *msg[1:])
+        elif kind == "subscribe":
+            _, name, key, control_class, command = msg
+            target = self.targets.get(name)
+            if target is not None:
+                target.subscriptions[key] = (control_class, command)
+                self.executor.submit(self.refresh, target)
+        elif kind == "unsubscribe":
+            _, name, key = msg
+            target = self.targets.get(name)
+            if target is not None:
+                self.executor.submit(self.unsubscribe, target, key)
+
+    def maintain(self):
+        # Reconnects the TVs that lost their connection but have
+        # subscriptions, which nothing else would bring back.
+        now = time.time()
+        for target in list(self.targets.values()):
+            if target.client is None and target.subscriptions and \
+                    target.retry_at <= now:
+                target.retry_at = now + self.retry_interval
+                self.executor.submit(self.refresh, target)
+
+    def ensure(self, target):
+        with target.lock:
+            if target.client is not None:
+                return target.client
+            client = self.client_class(target.host, secure=target.secure)
+            client.close_hooks.append(
+                lambda c, code, reason: self.on_closed(target, c))
+            old_key = target.store.get("client_key")
+            try:
+                client.connect()
+                for _ in client.register(target.store):
+                    pass
+            except Exception:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+                raise
+            target.client = client
+            target.controls = {}
+            target.active = set()
+            if target.store.get("client_key") != old_key:
+                self.send("key", target.name, dict(target.store))
+            return client
+
+    def refresh(self, target):
+        try:
+            with target.lock:
+                self.ensure(target)
+                for key, (control_class, command) in \
+                        list(target.subscriptions.items()):
+                    if key in target.active:
+                        continue
+                    control = self.control(target, control_class)
+                    control.subscribe(command, control.COMMANDS[command])(
+                        self.event_callback(target.name, key))
+                    target.active.add(key)
+        except Exception:
+            pass  # Retried by maintain().
+
+    def unsubscribe(self, target, key):
+        with target.lock:
+            entry = target.subscriptions.pop(key, None)
+            if entry is None or key not in target.active:
+                return
+            target.active.discard(key)
+            control_class, command = entry
+            try:
+                control = self.control(target, control_class)
+                control.unsubscribe(command, control.COMMANDS[command])()
+            except Exception:
+                pass
+
+    def event_callback(self, name, key):
+        def callback(status, payload):
+            if not status:
+                payload = picklable_error(payload)
+            self.send("event", name, key, status, payload)
+        return callback
+
+    def control(self, target, control_class):
+        control = target.controls.get(control_class)
+        if control is None:
+            control = target.controls[control_class] = \
+                control_class(target.client)
+        return control
+
+    def call(self, request_id, name, control_class, command, args, kwargs):
+        try:
+            target = self.targets.get(name)
+            if target is None:
+                raise KeyError("{} is not on this worker.".format(name))
+            self.ensure(target)
+            with target.lock:
+                control = self.control(target, control_class)
+            res = getattr(control, command)(*args, **kwargs)
+        except Exception as ex:
+            self.send("result", request_id, picklable_error(ex), None)
+            return
+        try:
+            self.send("result", request_id, None, res)
+        except Exception as ex:
+            self.send("result", request_id, picklable_error(ex), None)
+
+    def on_closed(self, target, client):
+        with target.lock:
+            if target.client is client:
+                target.client = None
+                target.controls = {}
+                target.active = set()
+
+    def disconnect(self, target):
+        with target.lock:
+            client, target.client = target.client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+def run_worker(conn, client_class, max_threads, retry_interval):
+    ShardWorker(conn, client_class, max_threads, retry_interval).run()
+
+
+class WorkerHandle(object):
+    # The coordinator's side of one worker process.
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.names = set()
+        self.pending = {}  # request id -> Future
+        self.send_lock = Lock()
+
+    def send(self, *msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class ShardedFleet(object):
+    # Spreads TVs over `workers` processes, so that JSON and callback work
+    # for thousands of connections isn't bound by one GIL. The coordinator
+    # (this object, in the parent) routes calls to the worker owning the TV
+    # and dispatches subscription events; both go over one pipe per worker.
+    # When a worker dies its TVs move to the others (and a new worker takes
+    # its place if `respawn`), with their subscriptions. The stores passed
+    # to add() are kept up to date with the keys workers get from the TVs,
+    # so a moved TV doesn't prompt again.
+    def __init__(self, workers=None, client_class=WebOSClient, max_threads=32,
+                 retry_interval=5, call_timeout=120, respawn=True,
+                 context="spawn"):
+        # `context`: the multiprocessing start method. "spawn" is safe with
+        # threads running in the parent; `client_class` must be importable.
+        self.size = workers or multiprocessing.cpu_count()
+        self.client_class = client_class
+        self.max_threads = max_threads
+        self.retry_interval = retry_interval
+        self.call_timeout = call_timeout
+        self.respawn = respawn
+        self.context = multiprocessing.get_context(context)
+        self.workers = []
+        self.targets = {}        # name -> {"host", "store", "secure"}
+        self.assigned = {}       # name -> WorkerHandle
+        self.subscriptions = {}  # name -> {key: (class, command, callback)}
+        self.key_hooks = []
+        self.request_ids = count(1)
+        self.lock = RLock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            for _ in range(self.size):
+                self.workers.append(self.spawn())
+        self.thread = Thread(target=self.run, name="WebOSShards")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            workers, self.workers = self.workers, []
+            self.assigned = {}
+        for handle in workers:
+            try:
+                handle.send("stop")
+            except (IOError, OSError):
+                pass
+        for handle in workers:
+            handle.process.join(5)
+            if handle.process.is_alive():
+                handle.process.terminate()
+            self.fail_pending(handle, "Fleet stopped.")
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def spawn(self):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=run_worker, name="WebOSShard",
+            args=(child_conn, self.client_class, self.max_threads,
+                  self.retry_interval))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        return WorkerHandle(process, parent_conn)
+
+    def on_key_change(self, callback):
+        # Called with (name, store) when a worker got a new client key.
+        self.key_hooks.append(callback)
+
+    def add(self, name, host, store=None, secure=False):
+        with self.lock:
+            if name in self.targets:
+                self.remove(name)
+            self.targets[name] = {"host": host,
+                                  "store": {} if store is None else store,
+                                  "secure": secure}
+            return self.assign(name)
+
+    def remove(self, name):
+        with self.lock:
+            self.subscriptions.pop(name, None)
+            self.unassign(name)
+            return self.targets.pop(name, None)
+
+    def least_loaded(self):
+        live = [x for x in self.workers if x.process.is_alive()]
+        if not live:
+            return None
+        return min(live, key=lambda x: len(x.names))
+
+    def assign(self, name, handle=None):
+        # Hands `name` to `handle` (default: the least loaded worker), with
+        # its latest store and its subscriptions. Returns the worker's pid.
+        with self.lock:
+            handle = handle or self.least_loaded()
+            if handle is None:
+                return None
+            target = self.targets[name]
+            handle.names.add(name)
+            self.assigned[name] = handle
+            try:
+                handle.send("add", name, target["host"], dict(target["store"]),
+                            target["secure"])
+                for key, (control_class, command, _) in \
+                        self.subscriptions.get(name, {}).items():
+                    handle.send("subscribe", name, key, control_class,
+                                command)
+            except (IOError, OSError):
+                pass  # Dead: run() moves its TVs again.
+            return handle.pid
+
+    def unassign(self, name):
+        with self.lock:
+            handle = self.assigned.pop(name, None)
+            if handle is None:
+                return
+            handle.names.discard(name)
+            try:
+                handle.send("remove", name)
+            except (IOError, OSError):
+                pass
+
+    def add_worker(self):
+        # Starts one more worker and moves TVs onto it.
+        with self.lock:
+            handle = self.spawn()
+            self.workers.append(handle)
+            self.rebalance()
+            return handle.pid
+
+    def rebalance(self):
+        # Moves TVs from the busiest workers to the idlest until their
+        # counts differ by at most one. Moved TVs reconnect.
+        with self.lock:
+            while True:
+                live = [x for x in self.workers if x.process.is_alive()]
+                if len(live) < 2:
+                    return
+                busiest = max(live, key=lambda x: len(x.names))
+                idlest = min(live, key=lambda x: len(x.names))
+                if len(busiest.names) - len(idlest.names) <= 1:
+                    return
+                name = sorted(busiest.names)[0]
+                self.unassign(name)
+                self.assign(name, idlest)
+
+    def call_async(self, name, control_class, command, *args, **kwargs):
+        # Runs control_class(client).command(*args, **kwargs) on the TV's
+        # worker; returns a Future.
+        future = Future()
+        with self.lock:
+            handle = self.assigned.get(name)
+            if name not in self.targets:
+                future.set_exception(KeyError(name))
+                return future
+            if handle is None:
+                future.set_exception(WorkerDied(
+                    "No worker for {}.".format(name)))
+                return future
+            request_id = next(self.request_ids)
+            handle.pending[request_id] = future
+        try:
+            handle.send("call", request_id, name, control_class, command,
+                        args, kwargs)
+        except (IOError, OSError) as ex:
+            with self.lock:
+                handle.pending.pop(request_id, None)
+            future.set_exception(WorkerDied(str(ex)))
+        return future
+
+    def call(self, name, control_class, command, *args, **kwargs):
+        future = self.call_async(name, control_class, command, *args,
+                                 **kwargs)
+        try:
+            return future.result(timeout=self.call_timeout)
+        except FutureTimeout:
+            raise RequestTimeout("No answer from the worker for {}.".format(
+                name))
+
+    def subscribe(self, name, control_class, command, callback):
+        # `callback(name, status, payload)` is called, on the coordinator's
+        # thread, for each event. Survives reconnects and worker deaths.
+        key = "{}.{}".format(control_class.__name__, command)
+        with self.lock:
+            if name not in self.targets:
+                raise KeyError(name)
+            subscriptions = self.subscriptions.setdefault(name, {})
+            if key in subscriptions:
+                raise ValueError("Already subscribed.")
+            subscriptions[key] = (control_class, command, callback)
+            handle = self.assigned.get(name)
+        if handle is not None:
+            try:
+                handle.send("subscribe", name, key, control_class, command)
+            except (IOError, OSError):
+                pass
+        return key
+
+    def unsubscribe(self, name, control_class, command):
+        key = "{}.{}".format(control_class.__name__, command)
+        with self.lock:
+            if self.subscriptions.get(name, {}).pop(key, None) is None:
+                raise ValueError("Not subscribed.")
+            handle = self.assigned.get(name)
+        if handle is not None:
+            try:
+                handle.send("unsubscribe", name, key)
+            except (IOError, OSError):
+                pass
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                handles = {x.conn: x for x in self.workers}
+                sentinels = {x.process.sentinel: x for x in self.workers}
+            ready = wait(list(handles) + list(sentinels), timeout=0.5)
+            dead = set(sentinels[x] for x in ready if x in sentinels)
+            for handle in set(handles[x] for x in ready if x in handles) | \
+                    dead:
+                # Results sent just before dying are still worth having.
+                try:
+                    while handle.conn.poll():
+                        self.dispatch(handle, handle.conn.recv())
+                except (EOFError, OSError):
+                    dead.add(handle)
+            for handle in dead:
+                self.on_worker_died(handle)
+
+    def dispatch(self, handle, msg):
+        kind = msg[0]
+        if kind == "result":
+            _, request_id, error, payload = msg
+            with self.lock:
+                future = handle.pending.pop(request_id, None)
+            # False if the caller cancelled it meanwhile.
+            if future is None or not future.set_running_or_notify_cancel():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(payload)
+        elif kind == "event":
+            _, name, key, status, payload = msg
+            with self.lock:
+                entry = self.subscriptions.get(name, {}).get(key)
+            if entry is not None:
+                try:
+                    entry[2](name, status, payload)
+                except Exception:
+                    pass  # Must not stop the coordinator.
+        elif kind == "key":
+            _, name, store = msg
+            with self.lock:
+                target = self.targets.get(name)
+                if target is None:
+                    return
+                target["store"].update(store)
+            for hook in list(self.key_hooks):
+                try:
+                    hook(name, target["store"])
+                except Exception:
+                    pass
+
+    def on_worker_died(self, handle):
+        with self.lock:
+            if handle not in self.workers:
+                return
+            self.workers.remove(handle)
+            names = sorted(handle.names)
+            for name in names:
+                if self.assigned.get(name) is handle:
+                    del self.assigned[name]
+            if self.running and self.respawn:
+                self.workers.append(self.spawn())
+            for name in names:
+                self.assign(name)
+        self.fail_pending(handle, "Worker {} died.".format(handle.pid))
+        handle.conn.close()
+
+    def fail_pending(self, handle, message):
+        with self.lock:
+            pending, handle.pending = handle.pending, {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(WorkerDied(message))
+
+    def assignments(self):
+        with self.lock:
+            return {k: v.pid for k, v in self.assigned.items()}
+
+    def stats(self):
+        with self.lock:
+            return {x.pid: {"alive": x.process.is_alive(),
+                            "tvs": len(x.names),
+                            "pending": len(x.pending)}
+                    for x in self.workers}
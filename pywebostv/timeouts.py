@@ -0,0 +1,56 @@
+from collections import deque
+from threading import Lock
+
+
+class AdaptiveTimeouts(object):
+    # Per-URI timeouts for one TV, from the latencies it has shown so far:
+    # `multiplier` times the `percentile`th latency, within [floor, ceiling].
+    # URIs with fewer than `min_samples` answers get `default`. Timed out
+    # requests count as taking their timeout, so that a TV which got slower
+    # gets longer timeouts instead of timing out over and over.
+    def __init__(self, floor=0.5, ceiling=60, default=60, percentile=99,
+                 multiplier=2, min_samples=5, window=64):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.default = default
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.window = window
+        self.samples = {}
+        self.lock = Lock()
+
+    def record(self, uri, latency):
+        with self.lock:
+            samples = self.samples.get(uri)
+            if samples is None:
+                samples = self.samples[uri] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def latency(self, uri, percentile=None):
+        with self.lock:
+            samples = sorted(self.samples.get(uri) or [])
+        if not samples:
+            return None
+        percentile = self.percentile if percentile is None else percentile
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return samples[index]
+
+    def timeout_for(self, uri, floor=None, ceiling=None):
+        floor = self.floor if floor is None else floor
+        ceiling = self.ceiling if ceiling is None else ceiling
+        with self.lock:
+            count = len(self.samples.get(uri) or [])
+        if count < self.min_samples:
+            timeout = self.default
+        else:
+            timeout = self.latency(uri) * self.multiplier
+        return min(max(timeout, floor), ceiling)
+
+    def stats(self):
+        with self.lock:
+            uris = list(self.samples)
+        return {x: {"samples": len(self.samples[x]),
+                    "p50": self.latency(x, 50),
+                    "p99": self.latency(x, 99),
+                    "timeout": self.timeout_for(x)} for x in uris}
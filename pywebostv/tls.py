@@ -0,0 +1,74 @@
+import hashlib
+import ssl
+import time
+from threading import Lock
+
+
+class CertificateMismatch(IOError):
+    pass
+
+
+def fingerprint(der):
+    return hashlib.sha256(der).hexdigest()
+
+
+class SessionCache(object):
+    # TLS sessions by host, so that reconnects can skip the full handshake.
+    # A session can only be resumed by the SSLContext that created it.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.sessions = {}
+        self.lock = Lock()
+
+    def get(self, host, context):
+        with self.lock:
+            entry = self.sessions.get(host)
+            if entry is None or entry[0] is not context:
+                return None
+            session = entry[1]
+            if session.time + session.timeout < time.time():
+                del self.sessions[host]
+                return None
+            return session
+
+    def put(self, host, session, context):
+        if session is None:
+            return
+        with self.lock:
+            self.sessions.pop(host, None)
+            if len(self.sessions) >= self.max_entries:
+                del self.sessions[next(iter(self.sessions))]
+            self.sessions[host] = (context, session)
+
+    def remove(self, host):
+        with self.lock:
+            self.sessions.pop(host, None)
+
+    def clear(self):
+        with self.lock:
+            self.sessions.clear()
+
+
+sessions = SessionCache()
+
+_context = None
+_context_lock = Lock()
+
+
+def default_context():
+    # TVs present a self-signed certificate: it is pinned (see
+    # WebOSClient.register) rather than verified against a CA.
+    global _context
+    with _context_lock:
+        if _context is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            _context = context
+        return _context
+
+
+def wrap_socket(sock, host, context=None, cache=sessions):
+    context = context or default_context()
+    session = cache.get(host, context) if cache is not None else None
+    return context.wrap_socket(sock, server_hostname=host, session=session)
@@ -0,0 +1,170 @@
+import time
+from collections import deque
+from threading import Condition, Thread
+
+from ws4py.exc import WebSocketException
+
+from pywebostv.connection import RequestTimeout, WebOSClient
+from pywebostv.keepalive import Keepalive
+
+
+class WarmConnection(object):
+    # Keeps a registered client to one TV ready in the background, and
+    # reconnects as soon as it drops (TVs close idle connections), so that
+    # the first command doesn't wait for TCP, the upgrade and registration.
+    def __init__(self, host, store, secure=False, client_class=WebOSClient,
+                 retry_interval=1, max_retry_interval=30,
+                 register_timeout=None, history=100, keepalive=None):
+        # `keepalive`: Keepalive arguments (e.g. {"interval": 10}) to detect
+        # half-open connections on each client, or None.
+        self.host = host
+        self.store = store
+        self.secure = secure
+        self.client_class = client_class
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.register_timeout = register_timeout
+        self.keepalive = keepalive
+        self.client = None
+        self.dropped = None  # Last client closed before being published.
+        self.served = True
+        self.connects = 0
+        self.disconnects = 0
+        self.last_error = None
+        self.phases = deque(maxlen=history)
+        self.first_command_waits = deque(maxlen=history)
+        self.condition = Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(target=self.run, name="WebOSWarm-" + self.host)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            client, self.client = self.client, None
+            self.condition.notify_all()
+        if client is not None:
+            self.discard(client)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        interval = self.retry_interval
+        while True:
+            with self.condition:
+                while self.running and self.client is not None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+            try:
+                client = self.establish()
+                with self.condition:
+                    if not self.running:
+                        self.discard(client)
+                        return
+                    # Its close hook found nothing to reset if it ran before
+                    # this point.
+                    if client is self.dropped or \
+                            getattr(client, "terminated", False):
+                        raise IOError("{} closed the connection.".format(
+                            self.host))
+                    self.client = client
+                    self.served = False
+                    self.last_error = None
+                    self.condition.notify_all()
+            except Exception as ex:
+                with self.condition:
+                    self.last_error = ex
+                    self.condition.wait(interval)
+                interval = min(interval * 2, self.max_retry_interval)
+                continue
+            interval = self.retry_interval
+
+    def establish(self):
+        start = time.time()
+        client = self.client_class(self.host, secure=self.secure)
+        client.close_hooks.append(self.on_closed)
+        try:
+            client.connect()
+            for _ in client.register(self.store,
+                                     timeout=self.register_timeout):
+                pass
+            if self.keepalive is not None:
+                Keepalive(client, **self.keepalive).start()
+        except Exception:
+            self.discard(client)
+            raise
+        timings = dict(client.timings)
+        timings["total"] = time.time() - start
+        with self.condition:
+            self.phases.append(timings)
+            self.connects += 1
+        return client
+
+    def on_closed(self, client, code, reason):
+        with self.condition:
+            if self.client is client:
+                self.client = None
+                self.disconnects += 1
+                self.condition.notify_all()
+            else:
+                self.dropped = client
+
+    def discard(self, client):
+        try:
+            client.close()
+        except (IOError, RuntimeError, WebSocketException):
+            pass
+
+    def get(self, timeout=60):
+        # Returns the registered client, waiting up to `timeout` seconds if
+        # it is (re)connecting.
+        start = time.time()
+        self.start()
+        with self.condition:
+            while self.client is None:
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    raise RequestTimeout("No connection to {}: {}".format(
+                        self.host, self.last_error or "timed out"))
+                self.condition.wait(remaining)
+            if not self.served:
+                # Only the first caller after each (re)connect counts.
+                self.served = True
+                self.first_command_waits.append(time.time() - start)
+            return self.client
+
+    @property
+    def ready(self):
+        return self.client is not None
+
+    def metrics(self):
+        with self.condition:
+            phases = list(self.phases)
+            waits = list(self.first_command_waits)
+            mean_phases = {}
+            for key in set(k for x in phases for k in x):
+                values = [x[key] for x in phases if key in x]
+                mean_phases[key] = sum(values) / len(values)
+            return {
+                "ready": self.client is not None,
+                "connects": self.connects,
+                "disconnects": self.disconnects,
+                "last_phases": phases[-1] if phases else None,
+                "mean_phases": mean_phases,
+                "time_to_first_command": waits[-1] if waits else None,
+                "mean_time_to_first_command": (sum(waits) / len(waits)
+                                               if waits else None),
+                "last_error": (None if self.last_error is None
+                               else str(self.last_error)),
+            }
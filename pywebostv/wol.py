@@ -0,0 +1,171 @@
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ws4py.exc import WebSocketException
+
+from pywebostv.connection import WebOSClient
+from pywebostv.controls import SystemControl
+from pywebostv.discovery import mac_from_arp
+
+
+def parse_mac(mac):
+    digits = "".join(c for c in mac if c not in ":-.").lower()
+    if len(digits) != 12:
+        raise ValueError("Bad MAC address: {}".format(mac))
+    return bytes.fromhex(digits)
+
+
+def magic_packet(mac):
+    return b"\xff" * 6 + parse_mac(mac) * 16
+
+
+def send_magic_packet(mac, broadcast="255.255.255.255", port=9):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.sendto(magic_packet(mac), (broadcast, port))
+    finally:
+        sock.close()
+
+
+def remember_mac(client, store):
+    # Call while the TV is on, so that a later power_on(..) knows its MAC.
+    info = SystemControl(client).network_info()
+    for key in ("wiredInfo", "wifiInfo"):
+        mac = (info.get(key) or {}).get("macAddress")
+        if mac:
+            store["mac_address"] = mac.lower()
+            return store["mac_address"]
+    return None
+
+
+def port_open(host, port, timeout=1):
+    try:
+        socket.create_connection((host, port), timeout=timeout).close()
+        return True
+    except (socket.timeout, OSError):
+        return False
+
+
+def close_client(client):
+    try:
+        client.close()
+    except (IOError, RuntimeError, WebSocketException):
+        pass
+
+
+class WakeResult(object):
+    def __init__(self, host):
+        self.host = host
+        self.client = None
+        self.error = None
+        self.time_to_ready = None
+        self.time_to_registered = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return "<WakeResult '{}' ready in {:.2f}s>".format(
+                self.host, self.time_to_ready)
+        return "<WakeResult '{}' failed: {}>".format(self.host, self.error)
+
+
+def wait_until_ready(host, secure=None, timeout=60, interval=0.25,
+                     max_interval=2, on_retry=None,
+                     client_class=WebOSClient):
+    # Returns a connected client once the TV accepts a websocket on 3001
+    # (secure) or 3000, backing off exponentially between probes.
+    if secure is None:
+        candidates = [(3001, True), (3000, False)]
+    else:
+        candidates = [(3001 if secure else 3000, secure)]
+
+    deadline = time.time() + timeout
+    while True:
+        for port, is_secure in candidates:
+            if not port_open(host, port):
+                continue
+            client = client_class(host, secure=is_secure)
+            # The ports open before the websocket service answers: don't
+            # let a half-booted TV hold the probe past the deadline.
+            if getattr(client, "sock", None) is not None:
+                client.sock.settimeout(
+                    min(max(deadline - time.time(), 0.1), 1))
+            try:
+                client.connect()
+            except (IOError, WebSocketException):
+                close_client(client)
+                continue
+            if getattr(client, "sock", None) is not None:
+                client.sock.settimeout(None)
+            return client
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise IOError("TV at {} did not come up.".format(host))
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+        if on_retry is not None:
+            on_retry()
+
+
+def power_on(host, store, mac=None, secure=None, timeout=60,
+             broadcast="255.255.255.255", resend_interval=5,
+             client_class=WebOSClient):
+    result = WakeResult(host)
+    mac = mac or store.get("mac_address") or mac_from_arp(host)
+    if not mac:
+        raise ValueError("MAC address of {} is unknown.".format(host))
+
+    start = last_sent = time.time()
+
+    def resend():
+        # Magic packets are fire and forget; repeat them while we wait.
+        nonlocal last_sent
+        if time.time() - last_sent >= resend_interval:
+            send_magic_packet(mac, broadcast)
+            last_sent = time.time()
+
+    send_magic_packet(mac, broadcast)
+    client = wait_until_ready(host, secure=secure, timeout=timeout,
+                              on_retry=resend, client_class=client_class)
+    result.time_to_ready = time.time() - start
+
+    remaining = max(timeout - result.time_to_ready, 1)
+    try:
+        for status in client.register(store, timeout=remaining):
+            if status == WebOSClient.REGISTERED:
+                break
+    except Exception:
+        close_client(client)  # Nobody else holds it.
+        raise
+    store["mac_address"] = mac.lower()
+    result.client = client
+    result.time_to_registered = time.time() - start
+    return result
+
+
+def power_on_fleet(targets, stagger=0.5, max_workers=16, **kwargs):
+    # `targets` is a list of (host, store). TVs are woken `stagger` seconds
+    # apart so that they don't all draw inrush current at the same instant.
+    start = time.time()
+
+    def wake(index, host, store):
+        delay = start + index * stagger - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            return power_on(host, store, **kwargs)
+        except Exception as ex:
+            result = WakeResult(host)
+            result.error = ex
+            return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(wake, i, host, store)
+                   for i, (host, store) in enumerate(targets)]
+        return [x.result() for x in futures]
@@ -22,4 +22,10 @@ setup(
         "requests[security]",
         "future",
     ],
+    extras_require={
+        "icons": ["Pillow"],
+    },
+    entry_points={
+        "console_scripts": ["pywebostv = pywebostv.cli:main"],
+    },
 )
@@ -0,0 +1,127 @@
+import socket
+import time
+
+from pytest import raises
+
+from pywebostv.breaker import BreakerRegistry, CircuitBreaker, CircuitOpen
+from pywebostv.connection import RequestTimeout, WebOSClient
+from pywebostv.controls import WebOSControlBase
+
+from utils import FakeClient
+
+
+class TestCircuitBreaker(object):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker("tv", threshold=2, reset_timeout=10)
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.failure()
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert 9 < breaker.retry_after() <= 10
+        with raises(CircuitOpen):
+            breaker.check()
+
+    def test_success_resets(self):
+        breaker = CircuitBreaker("tv", threshold=2)
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker("tv", threshold=1, reset_timeout=0.1)
+        breaker.failure()
+        assert not breaker.allow()
+        time.sleep(0.15)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        assert breaker.allow()       # The probe.
+        assert not breaker.allow()   # Everyone else waits for it.
+
+        breaker.failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.reset_timeout == 0.2
+
+        time.sleep(0.25)
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.reset_timeout == 0.1
+
+    def test_registry(self):
+        registry = BreakerRegistry(threshold=1)
+        assert registry.get("a") is registry.get("a")
+        registry.get("a").failure()
+        registry.get("b")
+        assert registry.states() == {"a": "open", "b": "closed"}
+        assert registry.open_hosts() == ["a"]
+
+
+class TestClientBreaker(object):
+    def test_send_fails_fast_after_timeouts(self):
+        client = FakeClient()
+        client.breaker = CircuitBreaker("test", threshold=2,
+                                        reset_timeout=60)
+        control = WebOSControlBase(client)
+        control.COMMANDS = {"test": {"uri": "/test"}}
+
+        for _ in range(2):
+            with raises(RequestTimeout):
+                control.test(timeout=0.1)
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+        start = time.time()
+        with raises(CircuitOpen):
+            control.test(timeout=5)
+        assert time.time() - start < 1
+
+    def test_timed_out_probe_reopens(self):
+        # However the timeout is noticed (reaper or caller), a failed probe
+        # must not leave the breaker half-open for good.
+        client = FakeClient()
+        client.breaker = CircuitBreaker("test", threshold=1,
+                                        reset_timeout=0)
+        control = WebOSControlBase(client)
+        control.COMMANDS = {"test": {"uri": "/test"}}
+
+        for _ in range(20):
+            with raises(RequestTimeout):
+                control.test(timeout=0.01)
+            assert not client.breaker.probing
+            assert client.breaker.allow()
+            client.breaker.failure()
+        assert client.waiters == {}
+
+    def test_responses_close_breaker(self):
+        client = FakeClient()
+        client.breaker = CircuitBreaker("test", threshold=1,
+                                        reset_timeout=0)
+        client.breaker.failure()
+        control = WebOSControlBase(client)
+        control.COMMANDS = {"test": {"uri": "/test"}}
+        client.setup_response("/test", {"resp": True})
+
+        assert control.test() == {"resp": True}
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+    def test_connect(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        server.close()  # Nothing listens there now.
+
+        breaker = CircuitBreaker("127.0.0.1", threshold=1, reset_timeout=60)
+        client = WebOSClient("127.0.0.1", breaker=breaker)
+        client.port = port
+        with raises(IOError):
+            client.connect()
+        assert breaker.state == CircuitBreaker.OPEN
+        with raises(CircuitOpen):
+            WebOSClient("127.0.0.1", breaker=breaker).connect()
+
+    def test_shared_breaker(self):
+        assert WebOSClient("10.1.1.1", breaker=True).breaker is \
+            WebOSClient("10.1.1.1", breaker=True).breaker
+        assert WebOSClient("10.1.1.1").breaker is None
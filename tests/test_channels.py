@@ -0,0 +1,92 @@
+import os
+
+from pywebostv.channels import ChannelIndex, ChannelLineup
+
+from utils import FakeClient
+
+
+CHANNEL_LIST = "ssap://tv/getChannelList"
+
+
+def make_channels():
+    names = ["BBC One", "BBC Two", "CNN", "Discovery", "bbc news"]
+    return [{"channelId": "id-{}".format(i),
+             "channelNumber": "{}-1".format(i + 1),
+             "channelName": name,
+             "channelTypeName": "Cable TV" if i % 2 else "Satellite TV"}
+            for i, name in enumerate(names)]
+
+
+class TestChannelIndex(object):
+    def test_lookups(self):
+        index = ChannelIndex(make_channels())
+
+        assert len(index) == 5
+        assert index.get("id-2").name == "CNN"
+        assert index.get("missing") is None
+        assert index.find_number("4-1").name == "Discovery"
+        assert [x.name for x in index.find_name("bbc")] == \
+            ["bbc news", "BBC One", "BBC Two"]
+        assert len(index.find_name("BBC", limit=2)) == 2
+        assert index.find_name("zzz") == []
+        assert [x.id for x in index.find_type("Cable TV")] == ["id-1", "id-3"]
+
+    def test_lookup(self):
+        index = ChannelIndex(make_channels())
+        assert index.lookup("3-1").id == "id-2"
+        assert index.lookup("disc").id == "id-3"
+        assert index.lookup("nothing") is None
+
+    def test_roundtrip(self):
+        index = ChannelIndex(make_channels())
+        restored = ChannelIndex.from_dict(index.to_dict())
+        assert restored.fingerprint == index.fingerprint
+        assert restored.lookup("cnn") == index.lookup("cnn")
+
+
+class TestChannelLineup(object):
+    def test_refresh_only_on_change(self, tmpdir):
+        client = FakeClient("10.0.0.1")
+        lineup = ChannelLineup(client, directory=str(tmpdir))
+
+        client.setup_response(CHANNEL_LIST, {"returnValue": True,
+                                             "channelList": make_channels()})
+        assert lineup.refresh()
+        index = lineup.index
+        assert os.path.exists(str(tmpdir.join("10.0.0.1.json")))
+
+        assert not lineup.refresh()
+        assert lineup.index is index
+
+        changed = make_channels()[:3]
+        client.setup_response(CHANNEL_LIST, {"returnValue": True,
+                                             "channelList": changed})
+        assert lineup.refresh()
+        assert len(lineup.index) == 3
+
+    def test_persisted_per_tv(self, tmpdir):
+        client = FakeClient("10.0.0.1")
+        client.setup_response(CHANNEL_LIST, {"returnValue": True,
+                                             "channelList": make_channels()})
+        ChannelLineup(client, directory=str(tmpdir)).refresh()
+
+        restored = ChannelLineup(FakeClient("10.0.0.1"),
+                                 directory=str(tmpdir))
+        assert restored.index is not None
+        assert restored.lookup("cnn").id == "id-2"
+        assert ChannelLineup(FakeClient("10.0.0.2"),
+                             directory=str(tmpdir)).index is None
+
+    def test_tune(self):
+        client = FakeClient()
+        lineup = ChannelLineup(client)
+        client.setup_response(CHANNEL_LIST, {"returnValue": True,
+                                             "channelList": make_channels()})
+        client.setup_response("ssap://tv/openChannel", {"returnValue": True})
+
+        assert lineup.tune("disc").id == "id-3"
+        client.assert_sent_message_without_id({
+            "type": "request",
+            "uri": "ssap://tv/openChannel",
+            "payload": {"channelId": "id-3"}
+        })
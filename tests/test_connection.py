@@ -6,7 +6,7 @@ from threading import Event, Thread
 from pytest import raises
 
 import pywebostv.connection
-from pywebostv.connection import WebOSClient
+from pywebostv.connection import RequestTimeout, ResultSlot, WebOSClient
 
 from utils import FakeClient
 
@@ -76,10 +76,88 @@ class TestWebOSClient(object):
         client.received_message(json.dumps({"id": "2", "test": "test2"}))
         client.received_message(json.dumps({"id": "1", "test": "test1"}))
 
+        assert q1.get(block=True, timeout=1)["type"] == "timeout"
         with raises(Empty):
-            assert q1.get(block=True, timeout=1)
+            q1.get(block=True, timeout=0.1)
 
         assert q2.get(block=True, timeout=1) == {"id": "2", "test": "test2"}
+        assert client.waiters == {}
+
+    def test_deadline_expires_waiter(self):
+        res = []
+        event = Event()
+
+        def callback(obj):
+            res.append(obj)
+            event.set()
+
+        client = FakeClient()
+        client.send_message('req', "uri", None, unique_id="1",
+                            callback=callback, deadline=time.time() + 0.2)
+        assert "1" in client.waiters
+
+        assert event.wait(2)
+        assert res == [{"id": "1", "type": "timeout",
+                        "error": "Request timed out."}]
+        assert "1" not in client.waiters
+
+        # A late response is ignored.
+        client.received_message(json.dumps({"id": "1", "test": "late"}))
+        assert len(res) == 1
+
+    def test_answered_waiter_not_expired(self):
+        res = []
+        client = FakeClient()
+        client.send_message('req', "uri", None, unique_id="1",
+                            callback=res.append, deadline=time.time() + 0.1)
+        client.received_message(json.dumps({"id": "1", "test": "test"}))
+        time.sleep(0.3)
+        assert res == [{"id": "1", "test": "test"}]
+
+    def test_cancel(self):
+        client = FakeClient()
+        client.send_message('req', "uri", None, unique_id="1",
+                            get_queue=True)
+        assert client.cancel("1")
+        assert not client.cancel("1")
+        assert client.waiters == {}
+
+    def test_result_slot(self):
+        slot = ResultSlot()
+        with raises(Empty):
+            slot.get(block=False)
+
+        slot.put({"id": "1"})
+        slot.put({"id": "1", "type": "timeout"})  # Too late: ignored.
+        assert slot.get(block=True, timeout=1) == {"id": "1"}
+        with raises(Empty):
+            slot.get(block=True, timeout=0.05)
+
+    def test_next_id(self):
+        client = FakeClient()
+        ids = [client.next_id() for _ in range(100)]
+        assert len(set(ids)) == 100
+        other = FakeClient()
+        assert not set(ids) & set(other.next_id() for _ in range(100))
+
+    def test_reaper_keeps_earliest_deadline(self):
+        res = []
+        client = FakeClient()
+        start = time.time()
+        client.send_message('req', "uri", None, unique_id="1",
+                            callback=res.append, deadline=start + 0.3)
+        client.send_message('req', "uri", None, unique_id="2",
+                            callback=res.append, deadline=start + 0.1)
+        client.send_message('req', "uri", None, unique_id="3",
+                            callback=res.append, deadline=start + 0.2)
+        assert client.reaper_wakeup == start + 0.1
+
+        client.received_message(json.dumps({"id": "3", "test": "test"}))
+        time.sleep(0.6)
+        assert [x["id"] for x in res] == ["3", "2", "1"]
+        assert [x.get("type") for x in res] == [None, "timeout", "timeout"]
+        assert client.waiters == {}
+        assert client.reaper_wakeup is None
 
     def test_subscription(self):
         result = []
@@ -123,6 +201,13 @@ class TestWebOSClient(object):
 
         assert 'KEY!@#' in json.dumps(client.sent_message)
 
+        # Nothing left behind for the next registration, on any client.
+        other = FakeClient()
+        with raises(Exception):
+            next(other.register({}, timeout=0.1))
+        assert 'KEY!@#' not in json.dumps(other.sent_message)
+        assert "client-key" not in pywebostv.connection.REGISTRATION_PAYLOAD
+
     def test_discovery(self):
         def mock_discover(*args, **kwargs):
             return ["host1", "host2"]
@@ -136,8 +221,9 @@ class TestWebOSClient(object):
 
     def test_registration_timeout(self):
         client = FakeClient()
-        with raises(Exception):
-            list(client.register({}, timeout=5))
+        with raises(RequestTimeout):
+            list(client.register({}, timeout=1))
+        assert client.waiters == {}
 
     def test_registration(self):
         client = FakeClient()
@@ -1,13 +1,16 @@
 import base64
+import time
 from threading import Event, Semaphore
 
 from pytest import raises, mark
 
 import pywebostv.controls
+from pywebostv.connection import RequestTimeout
 from pywebostv.controls import WebOSControlBase
 from pywebostv.controls import arguments, process_payload
 from pywebostv.controls import MediaControl, SystemControl, ApplicationControl
-from pywebostv.controls import InputControl
+from pywebostv.controls import InputControl, text_edits
+from pywebostv.icons import icons
 from pywebostv.model import Application
 
 from utils import FakeClient, FakeMouseClient
@@ -160,8 +163,56 @@ class TestWebOSControlBase(object):
         }
 
         client.setup_response("/another-uri", {"resp": True})
-        with raises(Exception):
+        with raises(RequestTimeout):
             control_base.test(timeout=1)
+        assert client.waiters == {}
+
+    def test_exec_deadline(self):
+        client = FakeClient()
+        control_base = WebOSControlBase(client)
+        control_base.COMMANDS = {"test": {"uri": "/test"}}
+
+        start = time.time()
+        with raises(RequestTimeout):
+            control_base.test(timeout=60, deadline=time.time() + 0.3)
+        assert time.time() - start < 5
+
+    def test_exec_timeout_callback(self):
+        client = FakeClient()
+        control_base = WebOSControlBase(client)
+        control_base.COMMANDS = {"test": {"uri": "/test"}}
+
+        response = []
+        event = Event()
+
+        def callback(status, resp):
+            response.append((status, resp))
+            event.set()
+
+        control_base.test(callback=callback, timeout=0.2)
+        assert event.wait(2)
+        assert len(response) == 1
+        assert response[0][0] is False
+        assert isinstance(response[0][1], RequestTimeout)
+        assert client.waiters == {}
+
+    def test_exec_error_callback(self):
+        client = FakeClient()
+        control_base = WebOSControlBase(client)
+        control_base.COMMANDS = {"test": {"uri": "/test"}}
+        client.responses["/test"] = {"type": "error", "error": "401 denied"}
+
+        response = []
+        event = Event()
+
+        def callback(status, resp):
+            response.append((status, resp))
+            event.set()
+
+        control_base.test(callback=callback)
+        assert event.wait(2)
+        time.sleep(0.1)
+        assert response == [(False, "401 denied")]
 
     def test_subscribe(self):
         client = FakeClient()
@@ -350,6 +401,32 @@ class TestSystemControl(object):
             }
         )
 
+    def test_notify_registered_icon(self):
+        client = FakeClient()
+        system = SystemControl(client)
+        data = b"\x89PNG\r\n\x1a\nicon"
+        icon = icons.register(data, name="test-brand")
+        try:
+            system.notify("test", icon="test-brand", block=False)
+        finally:
+            icons.remove("test-brand")
+
+        client.assert_sent_message_without_id(
+            {
+                "type": "request",
+                "uri": "ssap://system.notifications/createToast",
+                "payload": {"message": "test",
+                            "iconData": icon.data,
+                            "iconExtension": "png"}
+            }
+        )
+
+    def test_notify_unknown_icon(self):
+        client = FakeClient()
+        system = SystemControl(client)
+        with raises(KeyError):
+            system.notify("test", icon="no-such-icon", block=False)
+
 
 class TestApplicationControl(object):
     def test_list_apps(self):
@@ -469,6 +546,100 @@ class TestInputControl(object):
             "uri": "ssap://com.webos.service.ime/sendEnterKey",
         })
 
+    @mark.parametrize(
+        "old,new,edits",
+        [
+            ("", "abc", (0, "abc")),
+            ("abc", "abcd", (0, "d")),
+            ("abcd", "ab", (2, "")),
+            ("hello", "help", (2, "p")),
+            ("same", "same", (0, "")),
+        ])
+    def test_text_edits(self, old, new, edits):
+        assert text_edits(old, new) == edits
+
+    def test_text_sync(self):
+        client = FakeClient()
+        inp = InputControl(client)
+        latencies = []
+        acked = Event()
+
+        def on_latency(latency):
+            latencies.append(latency)
+            acked.set()
+
+        client.setup_response("ssap://com.webos.service.ime/insertText",
+                              {"returnValue": True})
+        client.setup_response("ssap://com.webos.service.ime/deleteCharacters",
+                              {"returnValue": True})
+        sync = inp.text_sync(window=10, on_latency=on_latency)
+
+        for text in ["h", "he", "hel", "hello"]:
+            sync.update(text)
+        sync.flush()
+        assert acked.wait(timeout=2)
+        assert len(latencies) == 1
+
+        sync.update("hell")
+        sync.flush()
+        sync.update("help")
+        sync.flush()
+        sync.flush()
+
+        uris = [(x["uri"].split("/")[-1], x.get("payload"))
+                for x in client.sent_messages]
+        assert uris == [
+            ("insertText", {"text": "hello", "replace": 0}),
+            ("deleteCharacters", {"count": 1}),
+            ("insertText", {"text": "help", "replace": 1}),
+        ]
+
+    def test_text_sync_window(self):
+        client = FakeClient()
+        inp = InputControl(client)
+        sent = Event()
+
+        client.setup_response("ssap://com.webos.service.ime/insertText",
+                              {"returnValue": True})
+        sync = inp.text_sync(window=0.1, on_latency=lambda x: sent.set())
+        sync.update("a")
+        sync.update("ab")
+        assert sent.wait(timeout=2)
+
+        assert [x["payload"] for x in client.sent_messages] == [
+            {"text": "ab", "replace": 0}
+        ]
+
+    def test_text_sync_send_failure(self):
+        client = FakeClient()
+        inp = InputControl(client)
+        errors = []
+        failed = Event()
+
+        def on_error(ex):
+            errors.append(ex)
+            failed.set()
+
+        client.setup_response("ssap://com.webos.service.ime/insertText",
+                              {"returnValue": True})
+        sync = inp.text_sync(window=0.05, on_error=on_error)
+        sync.update("hello")
+        sync.flush()
+
+        def lost(obj):
+            raise IOError("Connection lost.")
+        send, client.send = client.send, lost
+        sync.update("hello world")
+        assert failed.wait(timeout=2)
+        assert isinstance(sync.last_error, IOError) and errors
+        assert sync.sent is None
+
+        client.send = send
+        sync.update("hello world!")
+        sync.flush()
+        assert client.sent_message["payload"] == \
+            {"text": "hello world!", "replace": 1}
+
     def test_invalid_input_command(self):
         client = FakeClient()
         inp = InputControl(client)
@@ -516,3 +687,106 @@ class TestInputControl(object):
             {"socketPath": ""})
         with raises(IOError):
             inp.connect_input()
+
+    def test_connect_input_deadline(self):
+        client = FakeClient()
+        inp = InputControl(client, ws_class=FakeMouseClient)
+
+        start = time.time()
+        with raises(RequestTimeout):
+            inp.connect_input(deadline=time.time() + 0.2)
+        assert time.time() - start < 5
+        assert client.waiters == {}
+
+    def test_lazy_mouse_socket(self):
+        client = FakeClient()
+        inp = InputControl(client, ws_class=FakeMouseClient)
+
+        client.setup_response(
+            "ssap://com.webos.service.networkinput/getPointerInputSocket",
+            {"socketPath": "x"})
+        inp.click()
+
+        assert inp.pointer.connected
+        inp.mouse_ws.assert_sent_message("type:click\n\n")
+
+    def test_shared_mouse_socket(self):
+        client = FakeClient()
+        inp1 = InputControl(client, ws_class=FakeMouseClient)
+        inp2 = InputControl(client, ws_class=FakeMouseClient)
+
+        client.setup_response(
+            "ssap://com.webos.service.networkinput/getPointerInputSocket",
+            {"socketPath": "x"})
+        inp1.click()
+        ws = inp1.mouse_ws
+        inp2.ok()
+
+        assert inp1.pointer is inp2.pointer
+        assert inp2.mouse_ws is ws
+        ws.assert_sent_message("type:button\nname:ENTER\n\n")
+
+    def test_mouse_socket_reconnect(self):
+        sockets = []
+
+        class FlakyMouseClient(FakeMouseClient):
+            def __init__(self, url):
+                super(FlakyMouseClient, self).__init__(url)
+                self.payloads = []
+                sockets.append(self)
+
+            def send(self, obj):
+                if len(sockets) == 1 and self.payloads:
+                    raise RuntimeError("Broken pipe.")
+                self.payloads.append(obj)
+
+        client = FakeClient()
+        inp = InputControl(client, ws_class=FlakyMouseClient)
+
+        client.setup_response(
+            "ssap://com.webos.service.networkinput/getPointerInputSocket",
+            {"socketPath": "x"})
+        inp.click()
+        inp.ok()
+
+        assert len(sockets) == 2
+        assert sockets[0].payloads == ["type:click\n\n"]
+        assert sockets[1].payloads == ["type:button\nname:ENTER\n\n"]
+
+    def test_mouse_socket_unavailable(self):
+        client = FakeClient()
+        inp = InputControl(client, ws_class=FakeMouseClient)
+
+        client.setup_response(
+            "ssap://com.webos.service.networkinput/getPointerInputSocket",
+            {"socketPath": ""})
+        with raises(IOError):
+            inp.click()
+        # Failed for good: not replayed with the next command.
+        assert list(inp.pointer.pending) == []
+
+    def test_mouse_connect_failure_closes_socket(self):
+        sockets = []
+
+        class RefusingMouseClient(FakeMouseClient):
+            def __init__(self, url):
+                super(RefusingMouseClient, self).__init__(url)
+                self.closed = False
+                sockets.append(self)
+
+            def connect(self):
+                raise IOError("Connection refused.")
+
+            def close(self):
+                self.closed = True
+
+        client = FakeClient()
+        inp = InputControl(client, ws_class=RefusingMouseClient)
+        client.setup_response(
+            "ssap://com.webos.service.networkinput/getPointerInputSocket",
+            {"socketPath": "x"})
+        with raises(IOError):
+            inp.click()
+        assert len(sockets) == 3
+        assert all(x.closed for x in sockets)
+        assert list(inp.pointer.pending) == []
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+
+from pytest import fixture, raises
+
+from pywebostv.cli import main, parse_arguments
+from pywebostv.daemon import Daemon, DaemonClient, DaemonError
+
+from utils import AutoClient
+
+
+class DaemonFakeClient(AutoClient):
+    client_key = "new-key"
+    replies = {
+        "ssap://audio/getVolume": {"returnValue": True, "volume": 10},
+        "ssap://audio/setVolume": lambda x: {
+            "returnValue": True, "volume": x["payload"]["volume"]},
+    }
+
+
+@fixture
+def directory():
+    # Short, for the Unix socket path.
+    path = tempfile.mkdtemp(prefix="wo")
+    yield path
+    shutil.rmtree(path)
+
+
+@fixture
+def daemon(directory):
+    with open(os.path.join(directory, "keys.json"), "w") as f:
+        json.dump({"lobby": {"client_key": "old-key"}}, f)
+    daemon = Daemon({"lobby": {"host": "10.0.0.1"},
+                     "bar": {"host": "10.0.0.2"}},
+                    socket_path=os.path.join(directory, "d.sock"),
+                    key_path=os.path.join(directory, "keys.json"),
+                    client_class=DaemonFakeClient)
+    daemon.start()
+    yield daemon
+    daemon.stop()
+
+
+class TestDaemon(object):
+    def test_call(self, daemon):
+        client = DaemonClient(daemon.socket_path)
+        assert client.ping() == "pong"
+        assert client.call("lobby", "MediaControl", "get_volume") == \
+            {"volume": 10}
+        assert client.call("lobby", "MediaControl", "set_volume", 5) == \
+            {"returnValue": True, "volume": 5}
+        assert set(client.tvs()) == {"lobby", "bar"}
+        client.close()
+
+    def test_errors(self, daemon):
+        client = DaemonClient(daemon.socket_path)
+        with raises(DaemonError):
+            client.call("kitchen", "MediaControl", "get_volume")
+        with raises(DaemonError):
+            client.call("lobby", "MediaControl", "close")
+        with raises(DaemonError):
+            client.call("lobby", "Daemon", "stop")
+        with raises(DaemonError):
+            client.call("lobby", "SystemControl", "info")
+        # How the command runs is up to the daemon.
+        assert client.call("lobby", "MediaControl", "get_volume",
+                           block=False, callback="x") == {"volume": 10}
+        # Still usable after errors.
+        assert client.call("lobby", "MediaControl", "get_volume") == \
+            {"volume": 10}
+        client.close()
+
+    def test_keys_saved(self, daemon):
+        client = DaemonClient(daemon.socket_path)
+        client.call("lobby", "MediaControl", "get_volume")
+        client.call("bar", "MediaControl", "get_volume")
+        client.close()
+        with open(daemon.key_path) as f:
+            assert json.load(f) == {"lobby": {"client_key": "new-key"},
+                                    "bar": {"client_key": "new-key"}}
+
+    def test_cli(self, daemon, capsys):
+        assert main(["--socket", daemon.socket_path, "call", "lobby",
+                     "MediaControl", "set_volume", "7"]) == 0
+        assert json.loads(capsys.readouterr().out) == \
+            {"returnValue": True, "volume": 7}
+
+        assert main(["--socket", daemon.socket_path, "call", "nope",
+                     "MediaControl", "get_volume"]) == 1
+        assert "nope" in capsys.readouterr().err
+
+    def test_cli_no_daemon(self, directory, capsys):
+        assert main(["--socket", os.path.join(directory, "none.sock"),
+                     "ping"]) == 2
+
+    def test_parse_arguments(self):
+        assert parse_arguments(["10", "hello", "true", "volume=3",
+                                'x={"a": 1}', "a=b=c"]) == \
+            ([10, "hello", True], {"volume": 3, "x": {"a": 1}, "a": "b=c"})
@@ -0,0 +1,233 @@
+import asyncio
+import socket
+import time
+
+import pywebostv.discovery
+from pywebostv.discovery import discover, discover_async, iter_discover
+from pywebostv.discovery import read_location, parse_description
+from pywebostv.discovery import fetch_description, DescriptionCache
+from pywebostv.model import Device
+
+
+def make_response(location):
+    return "\r\n".join([
+        "HTTP/1.1 200 OK",
+        "LOCATION: {}".format(location),
+        "ST: urn:schemas-upnp-org:device:MediaRenderer:1",
+        "", ""]).encode('ascii')
+
+
+class FakeSocket(object):
+    # Answers every M-SEARCH with `responses` through a real socketpair, so
+    # that it works with selectors.
+    responses = []
+    instances = []
+
+    def __init__(self, *args):
+        self.reader, self.writer = socket.socketpair(socket.AF_UNIX,
+                                                     socket.SOCK_DGRAM)
+        self.sent = []
+        self.address = None
+        self.instances.append(self)
+
+    def setsockopt(self, *args):
+        pass
+
+    def setblocking(self, flag):
+        self.reader.setblocking(flag)
+
+    def bind(self, address):
+        self.address = address
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def sendto(self, message, addr):
+        self.sent.append((message, addr))
+        for response in self.responses:
+            self.writer.send(response)
+
+    def recvfrom(self, size):
+        return self.reader.recv(size), ("10.0.0.1", 1900)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class FakeSocketModule(object):
+    socket = FakeSocket
+
+    def __getattr__(self, name):
+        return getattr(socket, name)
+
+
+class TestDiscovery(object):
+    def setup_method(self):
+        self.socket_backup = pywebostv.discovery.socket
+        self.fetch_backup = pywebostv.discovery.fetch_description
+        self.iter_backup = pywebostv.discovery.iter_discover
+        pywebostv.discovery.socket = FakeSocketModule()
+        self.interfaces_backup = pywebostv.discovery.list_interfaces
+        pywebostv.discovery.list_interfaces = lambda: [("eth0", "0.0.0.0")]
+        FakeSocket.instances = []
+        FakeSocket.responses = [
+            make_response("http://10.0.0.1:1234/a.xml"),
+            make_response("http://10.0.0.2:1234/b.xml"),
+            make_response("http://10.0.0.2:1234/b.xml"),
+            make_response("http://10.0.0.3:1234/c.xml"),
+        ]
+
+    def teardown_method(self):
+        pywebostv.discovery.socket = self.socket_backup
+        pywebostv.discovery.list_interfaces = self.interfaces_backup
+        pywebostv.discovery.fetch_description = self.fetch_backup
+        pywebostv.discovery.iter_discover = self.iter_backup
+
+    def mock_validate(self, delays, valid=lambda loc: True):
+        def validate(location, keyword, timeout=5, session=None):
+            time.sleep(delays.get(location, 0))
+            if not valid(location):
+                return None
+            host = location.split("/")[2].split(":")[0]
+            return Device({"location": location, "host": host,
+                           "udn": "uuid:" + host})
+        pywebostv.discovery.fetch_description = validate
+
+    def test_read_location(self):
+        assert read_location(make_response("http://x/y.xml")) == \
+            "http://x/y.xml"
+        assert read_location(b"HTTP/1.1 200 OK\r\n\r\n") is None
+
+    def test_parse_description(self):
+        content = b"""<?xml version="1.0"?>
+        <root xmlns="urn:schemas-upnp-org:device-1-0">
+          <device>
+            <friendlyName>Living Room</friendlyName>
+            <manufacturer>LG Electronics</manufacturer>
+            <modelName>OLED55</modelName>
+            <UDN>uuid:1234</UDN>
+            <serviceList>
+              <service>
+                <serviceType>urn:lge-com:service:webos-second-screen:1
+                </serviceType>
+              </service>
+            </serviceList>
+          </device>
+        </root>"""
+        assert parse_description(content) == {
+            "friendly_name": "Living Room",
+            "manufacturer": "LG Electronics",
+            "model": "OLED55",
+            "udn": "uuid:1234",
+            "services": ["urn:lge-com:service:webos-second-screen:1"],
+        }
+        assert parse_description(b"not xml") == {}
+
+    def test_description_cache(self):
+        cache = DescriptionCache()
+        device = Device({"location": "http://10.0.0.1:1/a.xml",
+                         "host": "10.0.0.1", "manufacturer": "LG"})
+        cache.put(device)
+
+        # Served from the cache: no HTTP request is made for this location.
+        assert fetch_description(device["location"], "LG",
+                                 cache=cache) is device
+        assert fetch_description(device["location"], "Sony",
+                                 cache=cache) is None
+        assert cache.by_host("10.0.0.1") is device
+
+        cache.ttl = -1
+        assert cache.get(device["location"]) is None
+
+    def test_discover_devices(self):
+        self.mock_validate({})
+        res = discover("service", timeout=0.3, devices=True)
+        assert sorted(x.udn for x in res) == \
+            ["uuid:10.0.0.1", "uuid:10.0.0.2", "uuid:10.0.0.3"]
+
+    def test_discover_hosts(self):
+        self.mock_validate({}, valid=lambda loc: "10.0.0.3" not in loc)
+        res = discover("service", hosts=True, timeout=0.3)
+        assert res == {"10.0.0.1", "10.0.0.2"}
+
+    def test_slow_device_does_not_stall(self):
+        self.mock_validate({"http://10.0.0.1:1234/a.xml": 0.5})
+        res = list(iter_discover("service", timeout=1))
+        assert res[-1] == "http://10.0.0.1:1234/a.xml"
+        assert len(res) == 3
+
+    def test_expected_returns_early(self):
+        self.mock_validate({})
+        start = time.time()
+        res = discover("service", hosts=True, retries=3, timeout=5,
+                       expected=2)
+        assert len(res) == 2
+        assert time.time() - start < 2
+
+    def test_callback(self):
+        self.mock_validate({})
+        seen = []
+        res = discover("service", timeout=0.3, callback=seen.append)
+        assert set(seen) == res
+        assert len(seen) == 3
+
+    def test_discover_async(self):
+        self.mock_validate({})
+
+        async def collect():
+            return [x async for x in discover_async("service", hosts=True,
+                                                    timeout=0.3)]
+
+        res = asyncio.new_event_loop().run_until_complete(collect())
+        assert sorted(res) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+    def test_discover_async_early_exit(self):
+        self.mock_validate({})
+        stopped = []
+
+        def tracked(service, **kwargs):
+            try:
+                for item in iter_discover(service, **kwargs):
+                    yield item
+            finally:
+                stopped.append(time.time())
+        pywebostv.discovery.iter_discover = tracked
+
+        async def first():
+            async for item in discover_async("service", hosts=True,
+                                             timeout=3):
+                break
+            await asyncio.sleep(1)
+            return item
+
+        start = time.time()
+        assert asyncio.new_event_loop().run_until_complete(first())
+        # Stopped soon after the consumer left, not after the timeout.
+        assert stopped and stopped[0] - start < 1.5
+
+    def test_multiple_interfaces(self):
+        self.mock_validate({})
+        pywebostv.discovery.list_interfaces = lambda: [
+            ("eth0", "10.0.0.100"), ("eth1", "10.1.0.100")]
+        FakeSocket.responses = FakeSocket.responses[:1]
+
+        res = list(iter_discover("service", devices=True, retries=3,
+                                 timeout=0.3, stagger=0.1))
+        assert len(res) == 1
+        assert res[0]["interface"] in ("eth0", "eth1")
+
+        # One socket per interface, reused for all the retries.
+        assert len(FakeSocket.instances) == 2
+        assert [len(x.sent) for x in FakeSocket.instances] == [3, 3]
+        assert {x.address for x in FakeSocket.instances} == \
+            {("10.0.0.100", 0), ("10.1.0.100", 0)}
+
+    def test_selected_interfaces(self):
+        self.mock_validate({})
+        pywebostv.discovery.list_interfaces = lambda: [
+            ("eth0", "10.0.0.100"), ("eth1", "10.1.0.100")]
+
+        discover("service", timeout=0.1, interfaces=["eth1", "10.2.0.100"])
+        assert [x.address for x in FakeSocket.instances] == \
+            [("10.1.0.100", 0), ("10.2.0.100", 0)]
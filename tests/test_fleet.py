@@ -0,0 +1,81 @@
+import time
+
+from pywebostv.breaker import CircuitBreaker, CircuitOpen
+from pywebostv.controls import MediaControl, SystemControl
+from pywebostv.fleet import broadcast
+
+from utils import FakeClient
+
+
+def make_clients(count):
+    clients = [FakeClient("tv{}".format(i)) for i in range(count)]
+    for client in clients:
+        client.setup_response("ssap://com.webos.service.update/"
+                              "getCurrentSWInformation",
+                              {"returnValue": True, "host": client.host})
+    return clients
+
+
+class TestBroadcast(object):
+    def test_broadcast(self):
+        clients = make_clients(5)
+        res = broadcast(clients, SystemControl, "info", parallelism=2)
+
+        assert len(res) == 5
+        assert [x.payload for x in res] == [{"host": x.host} for x in clients]
+        assert all(x.latency is not None for x in res)
+        summary = res.summary()
+        assert summary["succeeded"] == 5
+        assert summary["failed"] == 0
+
+    def test_broadcast_args(self):
+        clients = make_clients(3)
+        broadcast(clients, MediaControl, "set_volume", 10, block=False)
+        for client in clients:
+            client.assert_sent_message_without_id({
+                "type": "request",
+                "uri": "ssap://audio/setVolume",
+                "payload": {"volume": 10}
+            })
+
+    def test_broadcast_plain_method(self):
+        # Not a COMMANDS entry: called without a timeout argument.
+        clients = make_clients(2)
+        res = broadcast(clients, MediaControl, "list_audio_output_sources")
+        assert [x.ok for x in res] == [True, True]
+        assert res.results[0].payload == \
+            MediaControl(clients[0]).list_audio_output_sources()
+
+    def test_broadcast_deadline_on_plain_method(self):
+        class SlowControl(SystemControl):
+            def slow(self):
+                time.sleep(0.3)
+                return "done"
+
+        res = broadcast(make_clients(2), SlowControl, "slow", deadline=0.1)
+        assert [x.ok for x in res] == [False, False]
+        assert all("Deadline" in str(x.error) for x in res)
+
+    def test_broadcast_failures(self):
+        clients = make_clients(3)
+        clients[1].responses = {}
+        clients[2].setup_response("ssap://com.webos.service.update/"
+                                  "getCurrentSWInformation",
+                                  {"returnValue": False, "errorText": "no"})
+
+        res = broadcast(clients, SystemControl, "info", deadline=0.5)
+        assert [x.ok for x in res] == [True, False, False]
+        assert str(res.results[2].error) == "no"
+        assert [x.host for x in res.failed] == ["tv1", "tv2"]
+        assert res.summary()["failed"] == 2
+
+    def test_broadcast_skips_open_breakers(self):
+        clients = make_clients(3)
+        clients[2].breaker = CircuitBreaker("tv2", threshold=1,
+                                            reset_timeout=60)
+        clients[2].breaker.failure()
+
+        res = broadcast(clients, SystemControl, "info")
+        assert [x.ok for x in res] == [True, True, False]
+        assert isinstance(res.results[2].error, CircuitOpen)
+        assert clients[2].sent_messages == []
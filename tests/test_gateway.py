@@ -0,0 +1,199 @@
+import json
+import time
+from http.client import HTTPConnection
+from threading import Thread
+
+from pytest import fixture
+
+from pywebostv.gateway import Gateway
+
+from utils import AutoClient
+
+
+def volume(request):
+    if request["type"] == "subscribe":
+        return [{"subscribed": True, "volume": x} for x in range(20)]
+    time.sleep(0.3)  # Slow enough for concurrent calls to overlap.
+    return {"returnValue": True, "volume": 10}
+
+
+class GatewayFakeClient(AutoClient):
+    instances = []
+    replies = {
+        "ssap://audio/getVolume": volume,
+        "ssap://audio/setVolume": lambda x: {
+            "returnValue": True, "volume": x["payload"]["volume"]},
+    }
+
+    def __init__(self, host, secure=False):
+        super(GatewayFakeClient, self).__init__(host)
+        GatewayFakeClient.instances.append(self)
+
+    @classmethod
+    def sent(cls, type, uri):
+        return [x for client in cls.instances for x in client.sent_messages
+                if x["type"] == type and x.get("uri") == uri]
+
+
+def make_gateway(**kwargs):
+    GatewayFakeClient.instances = []
+    gateway = Gateway({"lobby": {"host": "10.0.0.1"}}, port=0,
+                      client_class=GatewayFakeClient, **kwargs)
+    gateway.start()
+    return gateway
+
+
+@fixture
+def gateway():
+    gateway = make_gateway()
+    yield gateway
+    gateway.stop()
+
+
+def request(gateway, method, path, body=None):
+    conn = HTTPConnection(*gateway.address, timeout=10)
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    conn.request(method, path, body=body)
+    res = conn.getresponse()
+    data = json.loads(res.read())
+    conn.close()
+    return res.status, data
+
+
+def read_events(gateway, path, count):
+    conn = HTTPConnection(*gateway.address, timeout=10)
+    conn.request("GET", path)
+    res = conn.getresponse()
+    assert res.status == 200
+    assert res.getheader("Content-Type") == "text/event-stream"
+    events = []
+    event = None
+    while len(events) < count:
+        line = res.fp.readline().decode('utf-8').strip()
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            events.append((event, json.loads(line[6:])))
+    conn.close()
+    return events
+
+
+class TestGateway(object):
+    def test_call(self, gateway):
+        assert request(gateway, "GET", "/tvs/lobby/MediaControl/get_volume") \
+            == (200, {"ok": True, "payload": {"volume": 10}})
+        status, res = request(gateway, "POST",
+                              "/tvs/lobby/MediaControl/set_volume", [7])
+        assert status == 200
+        assert res["payload"]["volume"] == 7
+        status, res = request(gateway, "POST",
+                              "/tvs/lobby/MediaControl/set_volume",
+                              {"args": [8]})
+        assert res["payload"]["volume"] == 8
+
+    def test_listings(self, gateway):
+        status, res = request(gateway, "GET", "/tvs")
+        assert status == 200 and res["lobby"]["host"] == "10.0.0.1"
+        status, res = request(gateway, "GET", "/controls")
+        assert res["MediaControl"]["get_volume"] == \
+            {"subscription": True, "read_only": True}
+        assert res["MediaControl"]["set_volume"] == \
+            {"subscription": False, "read_only": False}
+        assert res["SystemControl"]["info"]["read_only"]
+
+    def test_errors(self, gateway):
+        for path in ["/tvs/kitchen/MediaControl/get_volume",
+                     "/tvs/lobby/Gateway/stop",
+                     "/tvs/lobby/MediaControl/close",
+                     "/tvs/lobby/MediaControl/set_volume/events",
+                     "/nothing"]:
+            status, res = request(gateway, "GET", path)
+            assert status == 404, path
+            assert not res["ok"]
+
+        status, res = request(gateway, "POST",
+                              "/tvs/lobby/MediaControl/set_volume", "[7")
+        assert status == 400
+
+    def test_get_only_read_only(self, gateway):
+        for path in ["/tvs/lobby/MediaControl/set_volume?volume=3",
+                     "/tvs/lobby/SystemControl/power_off"]:
+            status, res = request(gateway, "GET", path)
+            assert status == 405, path
+        assert not GatewayFakeClient.sent("request",
+                                          "ssap://audio/setVolume")
+        assert not GatewayFakeClient.sent("request", "ssap://system/turnOff")
+
+    def test_reserved_kwargs(self, gateway):
+        status, res = request(gateway, "GET",
+                              "/tvs/lobby/MediaControl/get_volume?block=false")
+        assert (status, res["payload"]) == (200, {"volume": 10})
+        status, res = request(gateway, "POST",
+                              "/tvs/lobby/MediaControl/set_volume",
+                              {"args": [4], "kwargs": {"block": False,
+                                                       "deadline": 0}})
+        assert (status, res["payload"]["volume"]) == (200, 4)
+
+    def test_coalescing(self, gateway):
+        results = []
+
+        def call():
+            results.append(request(gateway, "GET",
+                                   "/tvs/lobby/MediaControl/get_volume"))
+        threads = [Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [(200, {"ok": True, "payload": {"volume": 10}})] * 5
+        assert len(GatewayFakeClient.sent("request",
+                                          "ssap://audio/getVolume")) < 5
+        stats = gateway.stats()
+        assert stats["calls"] + stats["coalesced"] == 5
+
+    def test_concurrency_limit(self):
+        gateway = make_gateway(max_per_tv=1, queue_timeout=0.05)
+        try:
+            results = []
+
+            def call():
+                results.append(request(gateway, "POST",
+                                       "/tvs/lobby/MediaControl/get_volume"))
+            threads = [Thread(target=call) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sorted(x[0] for x in results) == [200, 503]
+            assert gateway.stats()["rejected"] == 1
+        finally:
+            gateway.stop()
+
+    def test_events(self, gateway):
+        path = "/tvs/lobby/MediaControl/get_volume/events"
+        results = []
+        threads = [Thread(target=lambda: results.append(
+            read_events(gateway, path, 2))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 3
+        for events in results:
+            assert [x[0] for x in events] == ["get_volume"] * 2
+            first = events[0][1]["volume"]
+            assert events[1][1] == {"volume": first + 1}
+        # One subscription on the TV for all the listeners, dropped once
+        # they are all gone.
+        assert len(GatewayFakeClient.sent("subscribe",
+                                          "ssap://audio/getVolume")) == 1
+        start = time.time()
+        while not GatewayFakeClient.sent("unsubscribe",
+                                         "ssap://audio/getVolume") or \
+                gateway.stats()["streams"]:
+            assert time.time() - start < 5
+            time.sleep(0.05)
+        assert gateway.stats()["subscriptions"] == 0
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from pywebostv.guide import ProgramGuide, current_program, parse_program_time
+
+from utils import AutoClient
+
+
+def format_time(timestamp):
+    return time.strftime("%Y,%m,%d,%H,%M,%S", time.gmtime(timestamp))
+
+
+def program_info(channel_id, end):
+    now = time.time()
+    return {
+        "returnValue": True,
+        "channel": {"channelId": channel_id},
+        "programList": [{
+            "programName": "Show on " + channel_id,
+            "startTime": format_time(now - 600),
+            "endTime": format_time(end),
+        }, {
+            "programName": "Next on " + channel_id,
+            "startTime": format_time(end),
+            "endTime": format_time(end + 1800),
+        }]
+    }
+
+
+class GuideClient(AutoClient):
+    # Answers getChannelProgramInfo for whichever channel was asked for.
+    def __init__(self, end=None, missing=()):
+        super(GuideClient, self).__init__("tv")
+        self.end = end
+        self.missing = set(missing)
+        self.replies["ssap://tv/getChannelProgramInfo"] = self.program
+
+    def program(self, request):
+        channel_id = request["payload"]["channelId"]
+        if channel_id not in self.missing:
+            return program_info(channel_id, self.end or time.time() + 1800)
+
+    @property
+    def requests(self):
+        return [x["payload"]["channelId"] for x in self.sent_messages]
+
+
+class TestProgramHelpers(object):
+    def test_parse_program_time(self):
+        assert parse_program_time("2021,03,14,20,30,00") == 1615753800
+        assert parse_program_time("bad") is None
+        assert parse_program_time(None) is None
+
+    def test_current_program(self):
+        info = program_info("1", time.time() + 60)
+        assert current_program(info)["programName"] == "Show on 1"
+        later = time.time() + 120
+        assert current_program(info, later)["programName"] == "Next on 1"
+        assert current_program({}) is None
+
+
+class TestProgramGuide(object):
+    def test_cached_until_end_of_program(self):
+        client = GuideClient()
+        guide = ProgramGuide(client, prefetch_enabled=False)
+
+        info = guide.get("1")
+        assert guide.get("1") is info
+        assert client.requests == ["1"]
+        assert guide.current("1")["programName"] == "Show on 1"
+
+        expires, _ = guide.entries["1"]
+        assert abs(expires - (time.time() + 1800)) < 5
+
+        guide.invalidate("1")
+        guide.get("1")
+        assert client.requests == ["1", "1"]
+
+    def test_default_ttl_without_guide_data(self):
+        client = GuideClient()
+        guide = ProgramGuide(client, default_ttl=5, prefetch_enabled=False)
+        guide.store("1", {"programList": []})
+        expires, _ = guide.entries["1"]
+        assert 4 < expires - time.time() <= 5
+
+    def test_prefetch_before_end(self):
+        client = GuideClient(end=time.time() + 3)
+        guide = ProgramGuide(client, prefetch=1.5)
+        try:
+            guide.get("1")
+            assert client.requests == ["1"]
+            for _ in range(30):
+                if len(client.requests) > 1:
+                    break
+                time.sleep(0.1)
+            assert client.requests == ["1", "1"]
+            assert "1" in guide.due
+        finally:
+            guide.close()
+        assert guide.thread is None
+
+    def test_prefetch_only_recent_channels(self):
+        client = GuideClient(end=time.time() + 1)
+        guide = ProgramGuide(client, prefetch=0.5, idle=0.2)
+        try:
+            guide.get_many(["1", "2", "3"])
+            # Not read again within `idle`: dropped instead of refetched.
+            time.sleep(1.5)
+            assert sorted(client.requests) == ["1", "2", "3"]
+            assert guide.due == {} and guide.last_read == {}
+            assert [x.name for x in threading.enumerate()].count(
+                "WebOSProgramGuide") == 1
+        finally:
+            guide.close()
+
+    def test_get_many(self):
+        client = GuideClient(missing=["3"])
+        guide = ProgramGuide(client, prefetch_enabled=False)
+        guide.get("1")
+
+        res = guide.get_many(["1", "2", "3", "2"], timeout=0.5)
+        assert sorted(res) == ["1", "2"]
+        assert res["2"]["channel"]["channelId"] == "2"
+        assert sorted(client.requests) == ["1", "2", "3"]
+        assert guide.cached("2") is res["2"]
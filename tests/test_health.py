@@ -0,0 +1,128 @@
+import socket
+import time
+
+import pywebostv.health
+from pywebostv.connection import WebOSClient
+from pywebostv.health import HealthChecker
+
+from utils import AutoClient
+
+
+class HealthFakeClient(AutoClient):
+    # Behaviour per host: "ok", "no-ws", "silent" or "bad-key".
+    behaviours = {}
+    closed_hosts = []
+    replies = {pywebostv.health.PING_URI: {"returnValue": True}}
+
+    def __init__(self, host, secure=False):
+        super(HealthFakeClient, self).__init__(host)
+        self.behaviour = self.behaviours[host]
+        if self.behaviour == "bad-key":
+            self.client_key = None
+
+    def connect(self):
+        if self.behaviour == "no-ws":
+            raise IOError("Handshake failed.")
+
+    def close(self):
+        self.closed_hosts.append(self.host)
+
+    def send(self, obj):
+        if self.behaviour != "silent":
+            super(HealthFakeClient, self).send(obj)
+
+
+class SilentUpgradeClient(WebOSClient):
+    # Connects to a local server that accepts TCP but never answers.
+    port = None
+
+    def __init__(self, host, secure=False):
+        super(SilentUpgradeClient, self).__init__("127.0.0.1")
+        self.port = SilentUpgradeClient.port
+
+
+def make_checker(monkeypatch, behaviours, **kwargs):
+    HealthFakeClient.behaviours = behaviours
+    HealthFakeClient.closed_hosts = []
+    monkeypatch.setattr(pywebostv.health, "port_open",
+                        lambda host, port, timeout: host != "down")
+    checker = HealthChecker(client_class=HealthFakeClient, timeout=0.3,
+                            **kwargs)
+    for host in behaviours:
+        checker.add(host, host, store={"client_key": "key"})
+    return checker
+
+
+class TestHealthChecker(object):
+    def test_statuses(self, monkeypatch):
+        checker = make_checker(monkeypatch, {
+            "good": "ok", "down": "ok", "nows": "no-ws",
+            "silent": "silent", "badkey": "bad-key"})
+        checker.add("nokey", "good")
+
+        res = checker.check_all()
+        assert {k: v.status for k, v in res.items()} == {
+            "good": "healthy", "down": "unreachable",
+            "nows": "handshake-failed", "silent": "unregistered",
+            "badkey": "unregistered", "nokey": "healthy"}
+
+        good = checker.health()["good"]
+        assert good["tcp"] is not None and good["ssap"] is not None
+        assert good["register"] is not None
+        assert checker.health()["nokey"]["register"] is None
+        assert sorted(checker.unhealthy()) == ["badkey", "down", "nows",
+                                               "silent"]
+
+    def test_history_and_changes(self, monkeypatch):
+        checker = make_checker(monkeypatch, {"tv": "ok"}, history=3)
+        events = []
+        checker.on_change(lambda *args: events.append(args[:3]))
+
+        for _ in range(4):
+            checker.check("tv")
+        HealthFakeClient.behaviours["tv"] = "no-ws"
+        checker.check("tv")
+
+        assert events == [("tv", None, "healthy"),
+                          ("tv", "healthy", "handshake-failed")]
+        assert [x["status"] for x in checker.history("tv")] == \
+            ["healthy", "healthy", "handshake-failed"]
+        assert checker.status("tv") == "handshake-failed"
+
+    def test_unresponsive_without_key(self, monkeypatch):
+        checker = make_checker(monkeypatch, {})
+        HealthFakeClient.behaviours["quiet"] = "silent"
+        checker.add("quiet", "quiet")
+        assert checker.check("quiet").status == "unresponsive"
+
+    def test_schedule(self, monkeypatch):
+        checker = make_checker(monkeypatch, {"tv": "ok"}, interval=0.05)
+        checker.start()
+        try:
+            end = time.time() + 3
+            while len(checker.history("tv")) < 3 and time.time() < end:
+                time.sleep(0.02)
+        finally:
+            checker.stop()
+        assert len(checker.history("tv")) >= 3
+
+    def test_handshake_failure_closes(self, monkeypatch):
+        checker = make_checker(monkeypatch, {"nows": "no-ws"})
+        assert checker.check("nows").status == "handshake-failed"
+        assert HealthFakeClient.closed_hosts == ["nows"]
+
+    def test_handshake_timeout(self, monkeypatch):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(5)
+        SilentUpgradeClient.port = server.getsockname()[1]
+        monkeypatch.setattr(pywebostv.health, "port_open",
+                            lambda host, port, timeout: True)
+        checker = HealthChecker(client_class=SilentUpgradeClient, timeout=0.3)
+        checker.add("tv", "tv")
+        try:
+            start = time.time()
+            assert checker.check("tv").status == "handshake-failed"
+            assert time.time() - start < 2
+        finally:
+            server.close()
@@ -0,0 +1,65 @@
+import base64
+
+from pytest import raises
+
+import pywebostv.icons
+from pywebostv.icons import IconRegistry, sniff_extension
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+JPG = b"\xff\xd8\xff\xe0" + b"\x01" * 32
+
+
+class TestIconRegistry(object):
+    def test_register_and_get(self):
+        registry = IconRegistry()
+        icon = registry.register(PNG, name="brand")
+
+        assert icon.data == base64.b64encode(PNG).decode('utf-8')
+        assert icon.extension == "png"
+        assert registry.get("brand") is icon
+        assert registry.get(icon.digest) is icon
+        assert registry.get(icon) is icon
+        assert "brand" in registry
+        with raises(KeyError):
+            registry.get("missing")
+
+    def test_same_content_encoded_once(self, monkeypatch):
+        registry = IconRegistry()
+        calls = []
+        original = pywebostv.icons.base64.b64encode
+
+        def counting_b64encode(data):
+            calls.append(data)
+            return original(data)
+        monkeypatch.setattr(pywebostv.icons.base64, "b64encode",
+                            counting_b64encode)
+
+        first = registry.register(JPG, name="a")
+        second = registry.register(JPG, name="b")
+        assert first is second
+        assert len(calls) == 1
+        assert len(registry) == 1
+        assert first.extension == "jpg"
+
+    def test_explicit_extension(self):
+        registry = IconRegistry()
+        assert registry.register(b"raw", extension="gif").extension == "gif"
+        assert registry.register(b"other").extension == "png"
+
+    def test_remove(self):
+        registry = IconRegistry()
+        registry.register(PNG, name="a")
+        registry.register(PNG, name="b")
+        registry.remove("a")
+        assert "b" not in registry
+        assert len(registry) == 0
+
+    def test_downsize_without_pillow(self, monkeypatch):
+        monkeypatch.setattr(pywebostv.icons, "Image", None)
+        icon = IconRegistry().register(PNG, max_size=16)
+        assert icon.size == len(PNG)
+
+    def test_sniff_extension(self):
+        assert sniff_extension(b"GIF89a...") == "gif"
+        assert sniff_extension(b"BM...") == "bmp"
+        assert sniff_extension(b"???") is None
@@ -0,0 +1,87 @@
+from threading import Event
+
+from pywebostv.inventory import AppInventory
+
+from utils import FakeClient
+
+
+LIST_APPS = "ssap://com.webos.applicationManager/listApps"
+
+
+def app(app_id, version="1"):
+    return {"id": app_id, "title": app_id.upper(), "version": version}
+
+
+class TestAppInventory(object):
+    def test_refresh(self):
+        client = FakeClient()
+        inventory = AppInventory(client)
+
+        client.setup_response(LIST_APPS, {"returnValue": True,
+                                          "apps": [app("a"), app("b")]})
+        changes = inventory.refresh()
+        assert sorted(x["id"] for x in changes.added) == ["a", "b"]
+        assert not changes.removed and not changes.changed
+        assert len(inventory) == 2
+
+        client.setup_response(LIST_APPS, {"returnValue": True,
+                                          "apps": [app("a"), app("b")]})
+        assert not inventory.refresh()
+
+        client.setup_response(LIST_APPS, {
+            "returnValue": True,
+            "apps": [app("b", version="2"), app("c")]
+        })
+        changes = inventory.refresh()
+        assert [x["id"] for x in changes.added] == ["c"]
+        assert [x["id"] for x in changes.removed] == ["a"]
+        assert [x["id"] for x in changes.changed] == ["b"]
+        assert "a" not in inventory
+        assert inventory.get("b")["version"] == "2"
+
+    def test_subscription(self):
+        client = FakeClient()
+        inventory = AppInventory(client)
+        events = []
+        done = Event()
+
+        def callback(status, changes):
+            events.append((status, changes))
+            if len(events) == 4:
+                done.set()
+
+        client.setup_subscribe_response(LIST_APPS, [
+            {"subscribed": True, "returnValue": True,
+             "apps": [app("a"), app("b")]},
+            {"change": "added", "app": app("c")},
+            {"change": "updated", "app": app("c")},
+            {"change": "updated", "app": app("a", version="2")},
+            {"change": "removed", "app": {"id": "b"}},
+        ])
+        inventory.subscribe(callback)
+        assert done.wait(timeout=5)
+
+        assert all(status for status, _ in events)
+        assert [len(x.added) for _, x in events] == [2, 1, 0, 0]
+        assert [x["id"] for x in events[2][1].changed] == ["a"]
+        assert [x["id"] for x in events[3][1].removed] == ["b"]
+        assert sorted(x["id"] for x in inventory.applications()) == ["a", "c"]
+
+        inventory.unsubscribe()
+        assert client.sent_message["type"] == "unsubscribe"
+
+    def test_subscription_unsupported(self):
+        client = FakeClient()
+        inventory = AppInventory(client)
+        events = []
+        done = Event()
+
+        def callback(status, changes):
+            events.append((status, changes))
+            done.set()
+
+        client.setup_subscribe_response(LIST_APPS, [
+            {"returnValue": False, "errorText": "Unsupported."}])
+        inventory.subscribe(callback)
+        assert done.wait(timeout=5)
+        assert events == [(False, "Unsupported.")]
@@ -0,0 +1,87 @@
+import time
+from threading import Event, Timer
+
+from pywebostv.keepalive import Keepalive
+
+from utils import FakeClient
+
+
+class PingClient(FakeClient):
+    def __init__(self, delay=0.01, answer=True):
+        super(PingClient, self).__init__("tv")
+        self.delay = delay
+        self.answer = answer
+        self.pinged = []
+        self.connection_closed = Event()
+
+    def ping(self, payload):
+        self.pinged.append(payload)
+        if self.answer:
+            Timer(self.delay, self.ponged,
+                  args=(Pong(payload.encode('utf-8')),)).start()
+
+    def close_connection(self):
+        self.connection_closed.set()
+
+
+class Pong(object):
+    def __init__(self, data):
+        self.data = data
+
+
+def wait_for(predicate, timeout=3):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestKeepalive(object):
+    def test_rtt(self):
+        client = PingClient(delay=0.05)
+        keepalive = Keepalive(client, interval=0.1, timeout=1).start()
+        try:
+            assert wait_for(lambda: keepalive.stats()["pongs"] >= 3)
+            assert client.keepalive is keepalive
+            assert 0.04 < client.rtt < 0.5
+            assert 0.04 < keepalive.percentile(50) < 0.5
+            assert keepalive.stats()["missed"] == 0
+        finally:
+            keepalive.stop()
+        assert client.keepalive is None
+        assert client.pong_hooks == []
+        assert client.rtt is None
+
+    def test_dead_after_missed_pongs(self):
+        client = PingClient(answer=False)
+        reasons = []
+        keepalive = Keepalive(client, interval=0.05, timeout=0.1,
+                              max_missed=2,
+                              on_dead=lambda c, r: reasons.append(r))
+        keepalive.start()
+        try:
+            assert client.connection_closed.wait(3)
+            assert keepalive.dead
+            assert reasons == ["2 pings unanswered."]
+            assert len(client.pinged) >= 2
+        finally:
+            keepalive.stop()
+
+    def test_late_pong_ignored(self):
+        client = PingClient(answer=False)
+        keepalive = Keepalive(client, interval=10, timeout=5)
+        keepalive.ping()
+        client.ponged(Pong(b"unknown"))
+        assert keepalive.rtt is None
+        keepalive.on_pong(client, client.pinged[0].encode('utf-8'))
+        assert keepalive.rtt is not None
+
+    def test_stops_when_closed(self):
+        client = PingClient()
+        keepalive = Keepalive(client, interval=0.05).start()
+        client.closed(1000, "bye")
+        keepalive.thread.join(2)
+        assert not keepalive.thread.is_alive()
+        keepalive.stop()
@@ -0,0 +1,64 @@
+import json
+
+from pytest import raises
+
+from pywebostv.model import Application, AudioOutputSource, Device
+from pywebostv.model import InputSource, ModelList, intern_strings
+
+
+class TestModels(object):
+    def test_no_instance_dict(self):
+        for obj in [Application({"id": "1"}), InputSource({"label": "x"}),
+                    AudioOutputSource("tv_speaker"), Device({})]:
+            with raises(AttributeError):
+                obj.__dict__
+
+    def test_equality_by_id(self):
+        a1 = Application({"id": "1", "title": "One"})
+        a2 = Application({"id": "1", "title": "One, updated"})
+        a3 = Application({"id": "2", "title": "Two"})
+
+        assert a1 == a2
+        assert a1 != a3
+        assert len({a1, a2, a3}) == 2
+        assert {a1: "x"}[a2] == "x"
+        assert InputSource({"id": "1", "label": "x"}) != a1
+        assert AudioOutputSource("soundbar") == AudioOutputSource("soundbar")
+        assert Device({"udn": "uuid:1", "host": "a"}) == \
+            Device({"udn": "uuid:1", "host": "b"})
+
+    def test_no_id(self):
+        a1, a2 = Application({"title": "x"}), Application({"title": "x"})
+        assert a1 == a1
+        assert a1 != a2
+        assert len({a1, a2}) == 2
+
+    def test_lazy_fields(self):
+        data = {"id": "1", "title": "One", "label": "HDMI 1"}
+        assert Application(data).title == "One"
+        assert InputSource(data).label == "HDMI 1"
+        data["label"] = "HDMI 2"
+        assert InputSource(data).label == "HDMI 2"
+
+    def test_model_list(self):
+        apps = ModelList(Application, [{"id": str(i)} for i in range(5)])
+        assert len(apps) == 5
+        assert apps[1] == Application({"id": "1"})
+        assert isinstance(apps[1:3], ModelList)
+        assert [x["id"] for x in apps[1:3]] == ["1", "2"]
+        assert Application({"id": "4"}) in apps
+
+        # Still a list, as list_apps() & co. used to return.
+        assert isinstance(apps, list)
+        assert apps == [Application({"id": str(i)}) for i in range(5)]
+        assert json.loads(json.dumps(apps, default=lambda x: x.data)) == \
+            [{"id": str(i)} for i in range(5)]
+
+    def test_intern_strings(self):
+        items = intern_strings([{"vendor": "".join(["L", "G"]),
+                                 "icon": "".join(["x"] * 100)},
+                                {"vendor": "".join(["L", "G"]),
+                                 "icon": "".join(["x"] * 100)}])
+        assert items[0]["vendor"] is items[1]["vendor"]
+        assert items[0]["icon"] is not items[1]["icon"]
+        assert items[0]["icon"] == items[1]["icon"]
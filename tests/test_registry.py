@@ -0,0 +1,170 @@
+import time
+
+import pywebostv.registry
+from pywebostv.connection import WebOSClient
+from pywebostv.model import Device
+from pywebostv.registry import DeviceRegistry, NotifyListener
+
+
+def make_device(host, udn="uuid:1"):
+    return {"host": host, "udn": udn, "friendly_name": "Living Room",
+            "model": "OLED55", "location": "http://{}:1/a.xml".format(host)}
+
+
+def make_notify(nts, udn="uuid:1", host="10.0.0.1"):
+    return "\r\n".join([
+        "NOTIFY * HTTP/1.1",
+        "HOST: 239.255.255.250:1900",
+        "NT: urn:schemas-upnp-org:device:MediaRenderer:1",
+        "NTS: {}".format(nts),
+        "USN: {}::urn:schemas-upnp-org:device:MediaRenderer:1".format(udn),
+        "LOCATION: http://{}:1/a.xml".format(host),
+        "", ""]).encode('ascii')
+
+
+class TestDeviceRegistry(object):
+    def test_persistence(self, tmpdir):
+        path = str(tmpdir.join("cache", "devices.json"))
+        registry = DeviceRegistry(path)
+        registry.update(make_device("10.0.0.1"))
+
+        restored = DeviceRegistry(path)
+        assert restored.hosts() == ["10.0.0.1"]
+        assert restored.get("uuid:1")["model"] == "OLED55"
+
+    def test_ttl(self):
+        registry = DeviceRegistry(ttl=10)
+        registry.update(make_device("10.0.0.1"), last_seen=time.time() - 20)
+        assert not registry.warm
+        assert registry.devices() == []
+
+        registry.touch("uuid:1")
+        assert registry.warm
+
+    def test_host_change(self):
+        registry = DeviceRegistry()
+        registry.update(make_device("10.0.0.1"))
+        registry.update(make_device("10.0.0.9"))
+        assert registry.hosts() == ["10.0.0.9"]
+
+    def test_discover_warm_cache(self):
+        def fail(*args, **kwargs):
+            raise AssertionError("Should not scan.")
+
+        registry = DeviceRegistry()
+        registry.refresh = fail
+        registry.update(make_device("10.0.0.1"))
+
+        clients = WebOSClient.discover(registry=registry)
+        assert [x.url for x in clients] == ["ws://10.0.0.1:3000/"]
+        assert clients[0].device.udn == "uuid:1"
+        assert clients[0].device["model"] == "OLED55"
+
+    def test_discover_cold_cache(self):
+        registry = DeviceRegistry()
+
+        def refresh(**kwargs):
+            return [registry.update(make_device("10.0.0.2", udn="uuid:2"))]
+        registry.refresh = refresh
+
+        clients = WebOSClient.discover(registry=registry, secure=True)
+        assert [x.url for x in clients] == ["wss://10.0.0.2:3001/"]
+
+    def test_refresh_saves_once(self):
+        saves = []
+        registry = DeviceRegistry()
+        registry.save = lambda: saves.append(len(registry.entries))
+        backup = pywebostv.registry.iter_discover
+
+        def iter_discover(*args, **kwargs):
+            for i in range(5):
+                yield make_device("10.0.0.{}".format(i),
+                                  udn="uuid:{}".format(i))
+        pywebostv.registry.iter_discover = iter_discover
+        try:
+            assert len(registry.refresh()) == 5
+        finally:
+            pywebostv.registry.iter_discover = backup
+        assert saves == [5]
+
+class TestNotifyListener(object):
+    def setup_method(self):
+        self.fetch_backup = pywebostv.registry.fetch_description
+        self.described = []
+
+        def fetch_description(location, keyword=None, timeout=5):
+            self.described.append(location)
+            return Device(make_device("10.0.0.1"))
+        pywebostv.registry.fetch_description = fetch_description
+
+    def teardown_method(self):
+        pywebostv.registry.fetch_description = self.fetch_backup
+
+    def test_alive_and_byebye(self):
+        registry = DeviceRegistry()
+        listener = NotifyListener(registry)
+
+        listener.handle(make_notify("ssdp:alive"))
+        listener.handle(make_notify("ssdp:alive"))
+        assert registry.hosts() == ["10.0.0.1"]
+        assert len(self.described) == 1
+
+        listener.handle(make_notify("ssdp:alive", host="10.0.0.5"))
+        assert registry.hosts() == ["10.0.0.5"]
+        assert registry.device("uuid:1")["location"] == \
+            "http://10.0.0.5:1/a.xml"
+
+        listener.handle(make_notify("ssdp:byebye"))
+        assert registry.hosts() == []
+
+    def test_ignores_other_messages(self):
+        registry = DeviceRegistry()
+        listener = NotifyListener(registry)
+
+        listener.handle(b"M-SEARCH * HTTP/1.1\r\n\r\n")
+        listener.handle(make_notify("ssdp:alive").replace(
+            b"MediaRenderer", b"MediaServer"))
+        assert registry.hosts() == []
+
+    def test_batched_saves(self):
+        saves = []
+        registry = DeviceRegistry()
+        registry.save = lambda: saves.append(sorted(registry.hosts()))
+        listener = NotifyListener(registry, save_interval=60)
+
+        listener.handle(make_notify("ssdp:alive"))
+        assert listener.save()
+        for _ in range(10):
+            listener.handle(make_notify("ssdp:alive"))
+            assert not listener.save()
+        assert saves == [["10.0.0.1"]]
+
+        listener.handle(make_notify("ssdp:byebye"))
+        assert listener.save(force=True)
+        assert saves == [["10.0.0.1"], []]
+        assert not listener.save(force=True)  # Nothing changed since.
+
+    def test_survives_errors(self):
+        class FakeSocket(object):
+            def __init__(self, packets):
+                self.packets = packets
+
+            def recvfrom(self, size):
+                if not self.packets:
+                    listener.running = False
+                    raise OSError("Closed.")
+                return self.packets.pop(0), None
+
+        def fail():
+            raise OSError("Disk full.")
+
+        registry = DeviceRegistry()
+        registry.save = fail
+        listener = NotifyListener(registry)
+        listener.sock = FakeSocket([b"garbage", make_notify("ssdp:alive"),
+                                    make_notify("ssdp:alive",
+                                                host="10.0.0.5")])
+        listener.running = True
+        listener.run()
+        assert registry.hosts() == ["10.0.0.5"]
+        assert listener.dirty
@@ -0,0 +1,162 @@
+import time
+from datetime import datetime
+
+from pytest import raises
+
+from pywebostv.scheduler import CronSchedule, Job, Scheduler
+
+from utils import FakeClient
+
+
+def timestamp(*args):
+    return time.mktime(datetime(*args).timetuple())
+
+
+def make_clients(*names):
+    clients = {}
+    for name in names:
+        client = FakeClient(name)
+        client.setup_response("ssap://system/turnOff", {"returnValue": True})
+        clients[name] = client
+    return clients
+
+
+def run_all(scheduler, now):
+    scheduler.run_pending(now=now)
+    scheduler.executor.shutdown(wait=True)
+
+
+class TestCronSchedule(object):
+    def test_parse(self):
+        cron = CronSchedule("*/15 2,3 1-5 * 7")
+        assert cron.fields[0] == {0, 15, 30, 45}
+        assert cron.fields[1] == {2, 3}
+        assert cron.fields[2] == {1, 2, 3, 4, 5}
+        assert cron.fields[4] == {0}
+
+        with raises(ValueError):
+            CronSchedule("* * *")
+        with raises(ValueError):
+            CronSchedule("61 * * * *")
+
+    def test_next_after(self):
+        # 2024-01-01 is a Monday.
+        nightly = CronSchedule("30 23 * * *")
+        assert nightly.next_after(timestamp(2024, 1, 1, 12, 0)) == \
+            timestamp(2024, 1, 1, 23, 30)
+        assert nightly.next_after(timestamp(2024, 1, 1, 23, 30)) == \
+            timestamp(2024, 1, 2, 23, 30)
+
+        weekdays = CronSchedule("0 8 * * 1-5")
+        assert weekdays.next_after(timestamp(2024, 1, 5, 9, 0)) == \
+            timestamp(2024, 1, 8, 8, 0)
+
+        # Restricted day-of-month and day-of-week: either one matches.
+        either = CronSchedule("0 0 15 * 0")
+        assert either.next_after(timestamp(2024, 1, 1, 0, 0)) == \
+            timestamp(2024, 1, 7, 0, 0)
+
+
+class TestScheduler(object):
+    def test_one_shot_with_groups_and_stagger(self):
+        clients = make_clients("tv1", "tv2", "tv3")
+        scheduler = Scheduler(clients, groups={"lobby": ["tv1", "tv2"]})
+        job = scheduler.schedule(["lobby", "tv3", "tv1"], "SystemControl",
+                                 "power_off", run_at=100, stagger=10)
+
+        assert scheduler.run_pending(now=100) == 110
+        scheduler.run_pending(now=115)
+        assert job.id in scheduler.jobs  # tv3 is still to come.
+        run_all(scheduler, now=120)
+        assert scheduler.jobs == {}
+
+        history = scheduler.job_history(job.id)
+        assert sorted(x["target"] for x in history) == ["tv1", "tv2", "tv3"]
+        assert sorted(x["scheduled"] for x in history) == [100, 110, 120]
+        assert all(x["ok"] and x["latency"] is not None for x in history)
+        for client in clients.values():
+            assert client.sent_message["uri"] == "ssap://system/turnOff"
+
+    def test_retries(self):
+        clients = make_clients("tv1")
+        clients["tv1"].setup_response(
+            "ssap://com.webos.service.update/getCurrentSWInformation",
+            {"returnValue": False})
+        scheduler = Scheduler(clients)
+        job = scheduler.schedule(["tv1", "missing"], "SystemControl",
+                                 "info", run_at=100, retries=1,
+                                 retry_delay=5)
+        run_all(scheduler, now=100)
+
+        history = scheduler.job_history(job.id)
+        assert [x["ok"] for x in history] == [False, False]
+        assert sorted(x[2].attempt for x in scheduler.queue) == [2, 2]
+
+    def test_cron_reschedules(self):
+        scheduler = Scheduler(make_clients("tv1"))
+        job = scheduler.schedule(["tv1"], "SystemControl", "power_off",
+                                 cron="0 * * * *")
+        first = job.next_run
+        scheduler.run_pending(now=first)
+        assert job.next_run == first + 3600
+        assert job.id in scheduler.jobs
+
+    def test_persistence(self, tmpdir):
+        path = str(tmpdir.join("jobs.json"))
+        scheduler = Scheduler({}, path=path)
+        job = scheduler.schedule(["tv1"], "MediaControl", "set_volume", 5,
+                                 run_at=time.time() + 3600, jitter=2)
+        scheduler.schedule(["tv1"], "SystemControl", "power_off",
+                           cron="0 1 * * *")
+
+        restored = Scheduler({}, path=path)
+        assert set(restored.jobs) == set(scheduler.jobs)
+        restored_job = restored.jobs[job.id]
+        assert restored_job.args == [5]
+        assert restored_job.next_run == job.next_run
+
+        restored.remove_job(job.id)
+        assert len(Scheduler({}, path=path).jobs) == 1
+
+    def test_restart_mid_stagger(self, tmpdir):
+        path = str(tmpdir.join("jobs.json"))
+        clients = make_clients("tv1", "tv2", "tv3")
+        scheduler = Scheduler(clients, path=path)
+        job = scheduler.schedule(["tv1", "tv2", "tv3"], "SystemControl",
+                                 "power_off", run_at=100, stagger=10)
+        run_all(scheduler, now=100)
+        assert scheduler.job_history(job.id)[0]["target"] == "tv1"
+
+        restored = Scheduler(clients, path=path)
+        assert restored.jobs[job.id].pending == {"tv2": [110, 1],
+                                                 "tv3": [120, 1]}
+        assert restored.run_pending(now=100) == 110
+        run_all(restored, now=120)
+        assert sorted(x["target"] for x in restored.job_history()) == \
+            ["tv2", "tv3"]
+        assert restored.jobs == {}
+        assert Scheduler({}, path=path).jobs == {}
+
+    def test_removed_job(self):
+        scheduler = Scheduler(make_clients("tv1", "tv2"))
+        job = scheduler.schedule(["tv1", "tv2"], "SystemControl",
+                                 "power_off", run_at=100, stagger=10)
+        scheduler.run_pending(now=100)
+        scheduler.remove_job(job.id)
+        run_all(scheduler, now=110)
+        assert [x["target"] for x in scheduler.job_history()] == ["tv1"]
+
+    def test_bad_job(self):
+        with raises(ValueError):
+            Job(["tv1"], "SystemControl", "power_off")
+
+    def test_background_thread(self):
+        clients = make_clients("tv1")
+        scheduler = Scheduler(clients)
+        scheduler.start()
+        scheduler.schedule(["tv1"], "SystemControl", "power_off",
+                           run_at=time.time() + 0.1)
+        time.sleep(0.5)
+        scheduler.stop()
+
+        assert [x["ok"] for x in scheduler.job_history()] == [True]
@@ -0,0 +1,168 @@
+import time
+from threading import Event
+
+from pytest import fixture, raises
+
+from pywebostv.controls import MediaControl
+from pywebostv.shard import ShardTarget, ShardWorker, ShardedFleet
+
+from utils import AutoClient
+
+
+def volume(request):
+    if request["type"] == "subscribe":
+        return [{"returnValue": True, "volume": 1},
+                {"returnValue": True, "volume": 2}]
+    return {"returnValue": True, "volume": 10}
+
+
+class ShardFakeClient(AutoClient):
+    replies = {"ssap://audio/getVolume": volume}
+
+    def __init__(self, host, secure=False):
+        super(ShardFakeClient, self).__init__(host)
+        self.client_key = "key-" + host
+
+
+class RejectedClient(AutoClient):
+    client_key = None
+    closed_hosts = []
+
+    def close(self):
+        RejectedClient.closed_hosts.append(self.host)
+
+
+def wait_for(condition, timeout=10):
+    start = time.time()
+    while time.time() - start < timeout:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@fixture
+def fleet():
+    fleet = ShardedFleet(workers=2, client_class=ShardFakeClient)
+    fleet.start()
+    yield fleet
+    fleet.stop()
+
+
+class TestShardedFleet(object):
+    def test_spread_and_call(self, fleet):
+        for i in range(4):
+            fleet.add("tv{}".format(i), "10.0.0.{}".format(i),
+                      store={"client_key": "x"})
+
+        pids = list(fleet.assignments().values())
+        assert sorted(pids.count(x) for x in set(pids)) == [2, 2]
+        for i in range(4):
+            assert fleet.call("tv{}".format(i), MediaControl, "get_volume") \
+                == {"volume": 10}
+
+    def test_errors(self, fleet):
+        fleet.add("tv", "10.0.0.1", store={"client_key": "x"})
+        with raises(AttributeError):
+            fleet.call("tv", MediaControl, "no_such_command")
+        with raises(KeyError):
+            fleet.call("other", MediaControl, "get_volume")
+
+    def test_key_sync(self, fleet):
+        changes = []
+        store = {}
+        fleet.on_key_change(lambda name, store: changes.append(name))
+        fleet.add("tv", "10.0.0.1", store=store)
+
+        fleet.call("tv", MediaControl, "get_volume")
+        assert wait_for(lambda: changes == ["tv"])
+        assert store == {"client_key": "key-10.0.0.1"}
+
+    def test_subscription(self, fleet):
+        events = []
+        done = Event()
+
+        def callback(name, status, payload):
+            events.append((name, status, payload))
+            if len(events) == 2:
+                done.set()
+
+        fleet.add("tv", "10.0.0.1", store={"client_key": "x"})
+        fleet.subscribe("tv", MediaControl, "get_volume", callback)
+        with raises(ValueError):
+            fleet.subscribe("tv", MediaControl, "get_volume", callback)
+
+        assert done.wait(10)
+        assert events == [("tv", True, {"volume": 1}),
+                          ("tv", True, {"volume": 2})]
+
+    def test_callback_errors(self, fleet):
+        def callback(name, status, payload):
+            raise ValueError("Bad callback.")
+        fleet.on_key_change(callback)
+        fleet.add("tv", "10.0.0.1", store={})
+        fleet.subscribe("tv", MediaControl, "get_volume", callback)
+        cancelled = fleet.call_async("tv", MediaControl, "get_volume")
+        cancelled.cancel()
+
+        time.sleep(0.5)
+        assert fleet.thread.is_alive()
+        assert fleet.call("tv", MediaControl, "get_volume") == {"volume": 10}
+
+    def test_worker_death(self, fleet):
+        events = []
+        for i in range(4):
+            fleet.add("tv{}".format(i), "10.0.0.{}".format(i), store={})
+        fleet.call("tv0", MediaControl, "get_volume")
+        fleet.subscribe("tv0", MediaControl, "get_volume",
+                        lambda *args: events.append(args))
+        assert wait_for(lambda: len(events) == 2)
+
+        dead = fleet.assignments()["tv0"]
+        [x for x in fleet.workers if x.pid == dead][0].process.kill()
+        assert wait_for(lambda: dead not in fleet.stats() and
+                        len(fleet.stats()) == 2)
+
+        assignments = fleet.assignments()
+        assert len(assignments) == 4
+        assert dead not in assignments.values()
+        assert fleet.call("tv0", MediaControl, "get_volume") == \
+            {"volume": 10}
+        # Re-subscribed on the new worker, with the key it had.
+        assert wait_for(lambda: len(events) == 4)
+        assert fleet.targets["tv0"]["store"] == \
+            {"client_key": "key-10.0.0.0"}
+
+    def test_rebalance(self):
+        fleet = ShardedFleet(workers=2, client_class=ShardFakeClient,
+                             respawn=False)
+        fleet.start()
+        try:
+            for i in range(4):
+                fleet.add("tv{}".format(i), "10.0.0.{}".format(i), store={})
+            victim = fleet.workers[0]
+            victim.process.kill()
+            assert wait_for(lambda: len(fleet.stats()) == 1)
+            assert len(set(fleet.assignments().values())) == 1
+            assert len(fleet.assignments()) == 4
+
+            fleet.add_worker()
+            pids = list(fleet.assignments().values())
+            assert sorted(pids.count(x) for x in set(pids)) == [2, 2]
+            assert fleet.call("tv3", MediaControl, "get_volume") == \
+                {"volume": 10}
+        finally:
+            fleet.stop()
+
+
+class TestShardWorker(object):
+    def test_failed_client_closed(self):
+        worker = ShardWorker(None, client_class=RejectedClient)
+        target = ShardTarget("tv", "10.0.0.1", {}, False)
+        try:
+            with raises(Exception):
+                worker.ensure(target)
+        finally:
+            worker.executor.shutdown()
+        assert target.client is None
+        assert RejectedClient.closed_hosts == ["10.0.0.1"]
@@ -0,0 +1,94 @@
+import json
+import time
+
+from pytest import raises
+
+from pywebostv.connection import RequestTimeout
+from pywebostv.controls import WebOSControlBase
+from pywebostv.timeouts import AdaptiveTimeouts
+
+from utils import FakeClient
+
+
+class TestAdaptiveTimeouts(object):
+    def test_default_until_enough_samples(self):
+        timeouts = AdaptiveTimeouts(default=30, min_samples=3)
+        timeouts.record("/a", 0.1)
+        timeouts.record("/a", 0.1)
+        assert timeouts.timeout_for("/a") == 30
+        timeouts.record("/a", 0.1)
+        assert timeouts.timeout_for("/a") == 0.5  # The floor.
+
+    def test_percentile_and_bounds(self):
+        timeouts = AdaptiveTimeouts(floor=0.1, ceiling=10, percentile=90,
+                                    multiplier=2, min_samples=1)
+        for latency in [0.1] * 9 + [1.0]:
+            timeouts.record("/a", latency)
+        assert timeouts.latency("/a", 50) == 0.1
+        assert timeouts.timeout_for("/a") == 2.0
+        assert timeouts.timeout_for("/a", ceiling=1) == 1
+        assert timeouts.timeout_for("/a", floor=5) == 5
+
+        for _ in range(10):
+            timeouts.record("/slow", 8)
+        assert timeouts.timeout_for("/slow") == 10
+
+    def test_window(self):
+        timeouts = AdaptiveTimeouts(window=3, min_samples=1, floor=0)
+        for latency in [5, 5, 5, 1, 1, 1]:
+            timeouts.record("/a", latency)
+        assert timeouts.timeout_for("/a") == 2
+        assert timeouts.stats()["/a"]["samples"] == 3
+
+
+class TestClientTimeouts(object):
+    def test_latencies_recorded(self):
+        client = FakeClient()
+        client.timeouts = AdaptiveTimeouts(min_samples=1)
+        control = WebOSControlBase(client)
+        control.COMMANDS = {"test": {"uri": "/test"}}
+        client.setup_response("/test", {"resp": True})
+
+        for _ in range(3):
+            control.test()
+        assert client.timeouts.stats()["/test"]["samples"] == 3
+        assert control.command_timeout(control.COMMANDS["test"]) == 0.5
+
+    def test_fails_fast_once_learnt(self):
+        client = FakeClient()
+        client.timeouts = AdaptiveTimeouts(floor=0.2, min_samples=1)
+        client.timeouts.record("/test", 0.01)
+        control = WebOSControlBase(client)
+        control.COMMANDS = {"test": {"uri": "/test"}}
+
+        start = time.time()
+        with raises(RequestTimeout):
+            control.test()
+        assert time.time() - start < 2
+        # The timeout itself counts as a (long) sample.
+        assert client.timeouts.latency("/test", 100) >= 0.2
+
+    def test_command_overrides(self):
+        client = FakeClient()
+        control = WebOSControlBase(client)
+        assert control.command_timeout({"uri": "/a"}) == 60
+        assert control.command_timeout({"uri": "/a", "timeout": 3}) == 3
+
+        client.timeouts = AdaptiveTimeouts(min_samples=1)
+        client.timeouts.record("/a", 0.01)
+        assert control.command_timeout(
+            {"uri": "/a", "timeout": {"floor": 5}}) == 5
+        assert control.command_timeout({"uri": "/a", "timeout": 3}) == 3
+
+    def test_register(self):
+        class RegisteringClient(FakeClient):
+            def send(self, obj):
+                obj = json.loads(obj)
+                self.received_message(json.dumps({
+                    "id": obj["id"], "type": "registered",
+                    "payload": {"client-key": "key"}}))
+
+        client = RegisteringClient()
+        client.timeouts = AdaptiveTimeouts()
+        list(client.register({"client_key": "key"}))
+        assert client.timeouts.stats()["register"]["samples"] == 1
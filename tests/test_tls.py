@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import os
+import socket
+import ssl
+from threading import Thread
+
+from pytest import raises
+
+from pywebostv import tls
+from pywebostv.connection import WebOSClient
+from pywebostv.tls import CertificateMismatch, SessionCache
+
+from utils import AutoClient
+
+
+CERT = os.path.join(os.path.dirname(__file__), "data", "tv.pem")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeSecureTV(object):
+    # Accepts TLS connections and answers the websocket upgrade, then hangs up.
+    def __init__(self):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(CERT)
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            try:
+                conn = self.context.wrap_socket(conn, server_side=True)
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    request += conn.recv(1024)
+                key = [x.split(b":", 1)[1].strip()
+                       for x in request.split(b"\r\n")
+                       if x.lower().startswith(b"sec-websocket-key")][0]
+                accept = base64.b64encode(hashlib.sha1(
+                    key + WS_GUID.encode()).digest())
+                conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\n"
+                             b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                             b"Sec-WebSocket-Accept: " + accept +
+                             b"\r\n\r\n")
+                conn.recv(1024)
+            except (OSError, ssl.SSLError):
+                pass
+            finally:
+                conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+def certificate_fingerprint():
+    with open(CERT) as f:
+        pem = f.read()
+    pem = pem[pem.index("-----BEGIN CERTIFICATE-----"):]
+    return hashlib.sha256(ssl.PEM_cert_to_DER_cert(pem)).hexdigest()
+
+
+def connect(port):
+    client = WebOSClient("127.0.0.1", secure=True)
+    client.port = port
+    client.connect()
+    client.close()
+    return client
+
+
+class TestSecureConnect(object):
+    def test_timings_fingerprint_and_resumption(self):
+        tv = FakeSecureTV()
+        tls.sessions.clear()
+        try:
+            first = connect(tv.port)
+            assert set(first.timings) == {"tcp", "tls", "upgrade"}
+            assert not first.tls_resumed
+            assert first.peer_fingerprint == certificate_fingerprint()
+
+            second = connect(tv.port)
+            assert second.tls_resumed
+            assert second.peer_fingerprint == first.peer_fingerprint
+        finally:
+            tv.close()
+            tls.sessions.clear()
+
+
+class TestCertificatePinning(object):
+    def test_pinned_on_first_registration(self):
+        client = AutoClient("tv")
+        client.peer_fingerprint = "abc"
+        store = {}
+        assert list(client.register(store, timeout=5)) == \
+            [WebOSClient.REGISTERED]
+        assert store["certificate_fingerprint"] == "abc"
+        assert "register" in client.timings
+
+        list(client.register(store, timeout=5))
+
+    def test_mismatch(self):
+        client = AutoClient("tv")
+        client.peer_fingerprint = "other"
+        store = {"client_key": "key", "certificate_fingerprint": "abc"}
+        with raises(CertificateMismatch):
+            list(client.register(store, timeout=5))
+        assert client.sent_messages == []
+
+    def test_not_pinned_without_tls(self):
+        client = AutoClient("tv")
+        store = {"certificate_fingerprint": "abc"}
+        list(client.register(store, timeout=5))
+        assert store["certificate_fingerprint"] == "abc"
+
+
+class TestSessionCache(object):
+    def test_context_and_expiry(self):
+        class Session(object):
+            time = 0
+            timeout = 0
+
+        cache = SessionCache(max_entries=2)
+        context = object()
+        session = Session()
+        session.time, session.timeout = 2 ** 40, 300
+
+        cache.put("a", session, context)
+        assert cache.get("a", context) is session
+        assert cache.get("a", object()) is None
+
+        cache.put("b", Session(), context)
+        assert cache.get("b", context) is None
+        assert "b" not in cache.sessions
+
+        cache.put("c", session, context)
+        cache.put("d", session, context)
+        assert sorted(cache.sessions) == ["c", "d"]
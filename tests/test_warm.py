@@ -0,0 +1,127 @@
+import time
+
+from pytest import raises
+
+from pywebostv.connection import RequestTimeout
+from pywebostv.warm import WarmConnection
+
+from utils import AutoClient
+
+
+class WarmFakeClient(AutoClient):
+    instances = []
+    failures = 0
+    rejections = 0
+    drops = 0
+
+    def __init__(self, host, secure=False):
+        super(WarmFakeClient, self).__init__(host)
+        self.close_calls = 0
+        WarmFakeClient.instances.append(self)
+
+    def close(self):
+        self.close_calls += 1
+
+    def connect(self):
+        if WarmFakeClient.failures:
+            WarmFakeClient.failures -= 1
+            raise IOError("Connection refused.")
+        self.timings = {"tcp": 0.01, "upgrade": 0.02}
+
+    def send(self, obj):
+        if WarmFakeClient.rejections:
+            WarmFakeClient.rejections -= 1
+            self.client_key = None
+        elif WarmFakeClient.drops:
+            # Gone before the connection is handed out.
+            WarmFakeClient.drops -= 1
+            self.closed(1006, "gone")
+        super(WarmFakeClient, self).send(obj)
+
+
+def make_warm(**kwargs):
+    WarmFakeClient.instances = []
+    WarmFakeClient.failures = 0
+    WarmFakeClient.rejections = 0
+    WarmFakeClient.drops = 0
+    return WarmConnection("tv", {"client_key": "key"},
+                          client_class=WarmFakeClient, **kwargs)
+
+
+class TestWarmConnection(object):
+    def test_get_registered_client(self):
+        warm = make_warm()
+        try:
+            client = warm.get(timeout=5)
+            assert client is WarmFakeClient.instances[0]
+            assert warm.get(timeout=5) is client
+
+            metrics = warm.metrics()
+            assert metrics["ready"]
+            assert metrics["connects"] == 1
+            assert set(metrics["last_phases"]) == \
+                {"tcp", "upgrade", "register", "total"}
+            assert metrics["time_to_first_command"] is not None
+        finally:
+            warm.stop()
+
+    def test_reconnects_after_close(self):
+        warm = make_warm()
+        try:
+            client = warm.get(timeout=5)
+            client.closed(1000, "idle")
+
+            for _ in range(50):
+                if warm.ready:
+                    break
+                time.sleep(0.05)
+            assert warm.ready
+            assert warm.get(timeout=5) is not client
+            metrics = warm.metrics()
+            assert metrics["connects"] == 2
+            assert metrics["disconnects"] == 1
+        finally:
+            warm.stop()
+
+    def test_retries_with_backoff(self):
+        warm = make_warm(retry_interval=0.05)
+        WarmFakeClient.failures = 2
+        try:
+            assert warm.get(timeout=5) is WarmFakeClient.instances[-1]
+            assert len(WarmFakeClient.instances) == 3
+            assert warm.metrics()["last_error"] is None
+        finally:
+            warm.stop()
+
+    def test_timeout(self):
+        warm = make_warm(retry_interval=10)
+        WarmFakeClient.failures = 100
+        try:
+            with raises(RequestTimeout):
+                warm.get(timeout=0.3)
+            assert "refused" in warm.metrics()["last_error"]
+        finally:
+            warm.stop()
+
+    def test_closes_failed_client(self):
+        warm = make_warm(retry_interval=0.05)
+        WarmFakeClient.rejections = 1
+        try:
+            client = warm.get(timeout=5)
+            failed = WarmFakeClient.instances[0]
+            assert client is not failed
+            assert failed.close_calls == 1
+            assert client.close_calls == 0
+        finally:
+            warm.stop()
+
+    def test_not_published_if_closed_early(self):
+        warm = make_warm(retry_interval=0.05)
+        WarmFakeClient.drops = 1
+        try:
+            client = warm.get(timeout=5)
+            assert client is WarmFakeClient.instances[1]
+            assert warm.dropped is WarmFakeClient.instances[0]
+            assert warm.metrics()["disconnects"] == 0
+        finally:
+            warm.stop()
@@ -0,0 +1,144 @@
+import json
+
+from pytest import raises
+
+import pywebostv.wol
+from pywebostv.discovery import mac_from_arp
+from pywebostv.wol import magic_packet, power_on, power_on_fleet
+from pywebostv.wol import remember_mac, wait_until_ready
+
+from utils import FakeClient
+
+
+class FakeTV(FakeClient):
+    connect_failures = 0
+    reject = False
+    closed = []
+
+    def __init__(self, host, secure=False):
+        super(FakeTV, self).__init__(host)
+        self.secure = secure
+
+    def connect(self):
+        if FakeTV.connect_failures:
+            FakeTV.connect_failures -= 1
+            raise IOError("Connection refused.")
+
+    def close(self):
+        FakeTV.closed.append(self)
+
+    def send(self, obj):
+        super(FakeTV, self).send(obj)
+        obj = json.loads(obj)
+        if obj["type"] == "register" and FakeTV.reject:
+            self.received_message(json.dumps({
+                "id": obj["id"], "type": "error", "error": "Rejected."}))
+        elif obj["type"] == "register":
+            self.received_message(json.dumps({
+                "id": obj["id"],
+                "type": "registered",
+                "payload": {"client-key": "KEY"}
+            }))
+
+
+class TestWakeOnLan(object):
+    def setup_method(self):
+        self.backup = (pywebostv.wol.port_open,
+                       pywebostv.wol.send_magic_packet)
+        self.packets = []
+        self.probes = []
+        self.up_after = 0
+        FakeTV.connect_failures = 0
+        FakeTV.reject = False
+        FakeTV.closed = []
+
+        def port_open(host, port, timeout=1):
+            self.probes.append((host, port))
+            return len(self.probes) > self.up_after
+
+        pywebostv.wol.port_open = port_open
+        pywebostv.wol.send_magic_packet = \
+            lambda mac, broadcast="": self.packets.append(mac)
+
+    def teardown_method(self):
+        pywebostv.wol.port_open, pywebostv.wol.send_magic_packet = self.backup
+
+    def test_magic_packet(self):
+        packet = magic_packet("AA:BB:CC:DD:EE:FF")
+        assert len(packet) == 102
+        assert packet[:6] == b"\xff" * 6
+        assert packet[6:12] == b"\xaa\xbb\xcc\xdd\xee\xff"
+        assert magic_packet("aabb.ccdd.eeff") == packet
+
+        with raises(ValueError):
+            magic_packet("AA:BB")
+
+    def test_mac_from_arp(self, tmpdir):
+        arp = tmpdir.join("arp")
+        arp.write("IP address HW type Flags HW address Mask Device\n"
+                  "10.0.0.5 0x1 0x2 AA:BB:CC:DD:EE:FF * eth0\n"
+                  "10.0.0.6 0x1 0x0 00:00:00:00:00:00 * eth0\n")
+        assert mac_from_arp("10.0.0.5", path=str(arp)) == "aa:bb:cc:dd:ee:ff"
+        assert mac_from_arp("10.0.0.6", path=str(arp)) is None
+        assert mac_from_arp("10.0.0.5", path=str(tmpdir.join("x"))) is None
+
+    def test_remember_mac(self):
+        client = FakeClient()
+        client.setup_response(
+            "ssap://com.webos.service.connectionmanager/getinfo",
+            {"returnValue": True, "wiredInfo": {"macAddress": "AA:BB"}})
+        store = {}
+        assert remember_mac(client, store) == "aa:bb"
+        assert store == {"mac_address": "aa:bb"}
+
+    def test_wait_until_ready_backoff(self):
+        self.up_after = 3
+        client = wait_until_ready("tv", secure=False, interval=0.01,
+                                  client_class=FakeTV)
+        assert isinstance(client, FakeTV)
+        assert self.probes == [("tv", 3000)] * 4
+
+        self.probes = []
+        self.up_after = 100
+        with raises(IOError):
+            wait_until_ready("tv", timeout=0.1, interval=0.01,
+                             client_class=FakeTV)
+        assert ("tv", 3001) in self.probes and ("tv", 3000) in self.probes
+
+    def test_power_on(self):
+        store = {"mac_address": "aa:bb:cc:dd:ee:ff"}
+        result = power_on("tv", store, client_class=FakeTV)
+
+        assert result.ok
+        assert result.time_to_ready <= result.time_to_registered
+        assert self.packets == ["aa:bb:cc:dd:ee:ff"]
+        assert store["client_key"] == "KEY"
+        assert result.client.secure
+
+    def test_power_on_unknown_mac(self):
+        with raises(ValueError):
+            power_on("unknown-host", {}, client_class=FakeTV)
+
+    def test_power_on_fleet(self):
+        targets = [("tv1", {"mac_address": "aa:bb:cc:dd:ee:01"}),
+                   ("tv2", {}),
+                   ("tv3", {"mac_address": "aa:bb:cc:dd:ee:03"})]
+        results = power_on_fleet(targets, stagger=0.01, client_class=FakeTV)
+
+        assert [x.host for x in results] == ["tv1", "tv2", "tv3"]
+        assert [x.ok for x in results] == [True, False, True]
+        assert isinstance(results[1].error, ValueError)
+        assert sorted(self.packets) == ["aa:bb:cc:dd:ee:01",
+                                        "aa:bb:cc:dd:ee:03"]
+
+    def test_failed_clients_closed(self):
+        FakeTV.connect_failures = 2
+        client = wait_until_ready("tv", secure=False, interval=0.01,
+                                  client_class=FakeTV)
+        assert len(FakeTV.closed) == 2 and client not in FakeTV.closed
+
+        FakeTV.reject = True
+        store = {"mac_address": "aa:bb:cc:dd:ee:ff"}
+        results = power_on_fleet([("tv", store)], client_class=FakeTV)
+        assert not results[0].ok
+        assert len(FakeTV.closed) == 3
@@ -9,6 +9,7 @@ class FakeClient(WebOSClient):
     def __init__(self, url="ws://test"):
         super(FakeClient, self).__init__(url)
         self.sent_message = None
+        self.sent_messages = []
         self.responses = {}
 
     def connect(self):
@@ -26,6 +27,7 @@ class FakeClient(WebOSClient):
     def send(self, obj):
         obj = json.loads(obj)
         self.sent_message = obj
+        self.sent_messages.append(obj)
         if obj.get("uri") in self.responses:
             if obj.get("type") == "request":
                 Thread(target=self.start_response, args=(obj,)).start()
@@ -61,3 +63,54 @@ class FakeMouseClient(FakeClient):
 
     def assert_sent_message(self, obj):
         assert self.sent_message == obj
+
+
+class AutoClient(FakeClient):
+    # Answers from another thread, as a TV would: registration (with
+    # `client_key`, or an error if it is None), the URIs in `replies`, the
+    # ones set up with setup_response(..), and an error for anything else.
+    # `replies` maps a URI to a payload, a list of payloads (streamed, for
+    # subscriptions), or a function of the request returning one of those
+    # (or None, to leave the request unanswered).
+    client_key = "key"
+    replies = {}
+
+    def __init__(self, host="ws://test", secure=False):
+        super(AutoClient, self).__init__(host)
+        self.replies = dict(self.replies)
+
+    def send(self, obj):
+        request = json.loads(obj)
+        if request["type"] != "register" and \
+                request.get("uri") in self.responses:
+            return super(AutoClient, self).send(obj)
+        self.sent_message = request
+        self.sent_messages.append(request)
+        Thread(target=self.reply, args=(request,)).start()
+
+    def reply(self, request):
+        uri = request.get("uri")
+        if request["type"] == "register":
+            if self.client_key is None:
+                responses = [{"type": "error", "error": "Rejected."}]
+            else:
+                responses = [{"type": "registered",
+                              "payload": {"client-key": self.client_key}}]
+        elif uri in self.replies:
+            payloads = self.replies[uri]
+            if callable(payloads):
+                payloads = payloads(request)
+            if payloads is None:
+                return
+            if not isinstance(payloads, list):
+                payloads = [payloads]
+            responses = [{"type": "response", "payload": x}
+                         for x in payloads]
+        else:
+            responses = [{"type": "error", "error": "No such API."}]
+
+        for index, res in enumerate(responses):
+            if index:
+                time.sleep(0.05)
+            res["id"] = request["id"]
+            self.received_message(json.dumps(res))